@@ -0,0 +1,336 @@
+import json
+import math
+import os
+import struct
+import sys
+import zlib
+from array import array
+from pathlib import Path
+from funciones import *
+
+try:
+    import numpy
+except ImportError:  # opcional: sin numpy las columnas se entregan como array/list
+    numpy = None
+
+
+# =========================
+# HISTÓRICO COLUMNAR
+# =========================
+# Dataset local particionado por fecha y región (Applid):
+#
+#   HISTORIAL_COLUMNAR/fecha=2025-04-11/region=CICSADM/ARCHIVO.col
+#
+# Cada .col guarda las filas (archivo, segmento, campo, valor, valor_num,
+# tipo_valor) de un reporte, columna por columna y comprimidas con zlib.
+# Las columnas de texto van codificadas con diccionario (lista de valores
+# distintos + índices uint32), las numéricas como float64.
+#
+# Formato del archivo: MAGIA | largo del encabezado (uint32 LE) |
+# encabezado JSON | bloques comprimidos. El encabezado indica, por columna,
+# desplazamiento y largo de cada bloque, así que el lector solo lee las
+# columnas pedidas.
+MAGIA = b"CICSCOL1"
+EXTENSION = ".col"
+NIVEL_COMPRESION = 6
+
+COLUMNAS_TEXTO = ("archivo", "segmento", "campo", "valor", "tipo_valor")
+COLUMNAS_NUMERO = ("valor_num",)
+# columnas de partición: salen del nombre del directorio, no del archivo
+COLUMNAS_PARTICION = ("fecha", "region")
+COLUMNAS = COLUMNAS_PARTICION + COLUMNAS_TEXTO + COLUMNAS_NUMERO
+
+REGION_DESCONOCIDA = "SIN_REGION"
+
+# una línea "fecha\tregion\tarchivo" por reporte agregado: los lectores de
+# otros procesos (consultas.py) la siguen para invalidar sus cachés
+REGISTRO_CARGAS = "_cargas.log"
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+def _a_bytes(valores: array) -> bytes:
+    # en disco siempre little-endian
+    if not _LITTLE_ENDIAN:
+        valores = array(valores.typecode, valores)
+        valores.byteswap()
+    return valores.tobytes()
+
+
+def _de_bytes(tipo: str, datos: bytes) -> array:
+    valores = array(tipo)
+    valores.frombytes(datos)
+    if not _LITTLE_ENDIAN:
+        valores.byteswap()
+    return valores
+
+
+def _codificar_texto(valores: list[str]) -> tuple[list[str], array]:
+    codigos = {}
+    indices = array("I", [codigos.setdefault(v, len(codigos)) for v in valores])
+    return list(codigos), indices
+
+
+def filas_desde_reporte(nombreArchivo: str, data: dict) -> dict[str, list]:
+    """Columnas {nombre: valores} de un reporte ya parseado y filtrado."""
+    columnas = {nombre: [] for nombre in COLUMNAS_TEXTO + COLUMNAS_NUMERO}
+    for segmento, campos in data.items():
+        for campo, valor in campos.items():
+            valor = "" if valor is None else str(valor)
+            normalizado = normalizar_valor(valor)
+            columnas["archivo"].append(nombreArchivo)
+            columnas["segmento"].append(segmento)
+            columnas["campo"].append(campo)
+            columnas["valor"].append(valor)
+            columnas["tipo_valor"].append(normalizado.tipo)
+            columnas["valor_num"].append(math.nan if normalizado.numero is None else normalizado.numero)
+    return columnas
+
+
+def escribir_particion(ruta: Path, columnas: dict[str, list]) -> int:
+    """Escribe un .col (atómico) y devuelve la cantidad de filas."""
+    filas = len(columnas["valor_num"])
+    bloques = []
+    encabezado = {"filas": filas, "columnas": {}}
+    desplazamiento = 0
+
+    def agregar(datos: bytes) -> list[int]:
+        nonlocal desplazamiento
+        comprimido = zlib.compress(datos, NIVEL_COMPRESION)
+        bloques.append(comprimido)
+        ubicacion = [desplazamiento, len(comprimido)]
+        desplazamiento += len(comprimido)
+        return ubicacion
+
+    for nombre in COLUMNAS_TEXTO:
+        diccionario, indices = _codificar_texto(columnas[nombre])
+        encabezado["columnas"][nombre] = {
+            "tipo": "texto",
+            "diccionario": agregar(json.dumps(diccionario, ensure_ascii=False).encode("utf-8")),
+            "datos": agregar(_a_bytes(indices)),
+        }
+    for nombre in COLUMNAS_NUMERO:
+        encabezado["columnas"][nombre] = {
+            "tipo": "numero",
+            "datos": agregar(_a_bytes(array("d", columnas[nombre]))),
+        }
+
+    crudo_encabezado = json.dumps(encabezado).encode("utf-8")
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    temporal = ruta.with_name(ruta.name + ".tmp")
+    with open(temporal, "wb") as f:
+        f.write(MAGIA)
+        f.write(struct.pack("<I", len(crudo_encabezado)))
+        f.write(crudo_encabezado)
+        for bloque in bloques:
+            f.write(bloque)
+    os.replace(temporal, ruta)
+    return filas
+
+
+class ParticionColumnar:
+    """Un archivo .col: lee el encabezado al abrirse y cada columna a pedido."""
+
+    def __init__(self, ruta: Path, fecha: str, region: str):
+        self.ruta = Path(ruta)
+        self.fecha = fecha
+        self.region = region
+        with open(self.ruta, "rb") as f:
+            if f.read(len(MAGIA)) != MAGIA:
+                raise ValueError(f"No es un archivo columnar de CICS: {self.ruta}")
+            (largo,) = struct.unpack("<I", f.read(4))
+            self._encabezado = json.loads(f.read(largo))
+            self._inicio_datos = len(MAGIA) + 4 + largo
+        self.filas = self._encabezado["filas"]
+
+    def _bloque(self, f, ubicacion: list[int]) -> bytes:
+        desplazamiento, largo = ubicacion
+        f.seek(self._inicio_datos + desplazamiento)
+        return zlib.decompress(f.read(largo))
+
+    def leer(self, columnas: Iterable[str]) -> dict:
+        """
+        {columna: datos} solo de las columnas pedidas. Las de texto se
+        entregan codificadas como (diccionario, índices uint32); las
+        numéricas como array("d").
+        """
+        out = {}
+        with open(self.ruta, "rb") as f:
+            for nombre in columnas:
+                meta = self._encabezado["columnas"][nombre]
+                if meta["tipo"] == "texto":
+                    diccionario = json.loads(self._bloque(f, meta["diccionario"]))
+                    out[nombre] = (diccionario, _de_bytes("I", self._bloque(f, meta["datos"])))
+                else:
+                    out[nombre] = _de_bytes("d", self._bloque(f, meta["datos"]))
+        return out
+
+
+class AlmacenColumnar:
+    """
+    Histórico local de los valores parseados, particionado por
+    fecha=AAAA-MM-DD/region=APPLID.
+
+    - agregar_reporte(): sink de salida, un .col por reporte y fecha
+      (volver a cargar el mismo reporte el mismo día lo reemplaza).
+    - leer(): lector con poda de columnas (solo se descomprimen las
+      pedidas) y de particiones (fechas/regiones fuera del filtro no se
+      abren); segmentos/campos filtran filas usando los diccionarios.
+    """
+
+    def __init__(self, raiz: Path):
+        self.raiz = Path(raiz)
+
+    # -------------------------
+    # escritura
+    # -------------------------
+    def ruta_particion(self, fecha: str, region: str, nombreArchivo: str) -> Path:
+        return self.raiz / f"fecha={fecha}" / f"region={region}" / f"{nombreArchivo}{EXTENSION}"
+
+    def agregar_reporte(self, fecha: str, region: str | None, nombreArchivo: str, data: dict) -> int:
+        region = region or REGION_DESCONOCIDA
+        ruta = self.ruta_particion(fecha, region, nombreArchivo)
+        filas = escribir_particion(ruta, filas_desde_reporte(nombreArchivo, data))
+        self.registrar_carga(fecha, region, nombreArchivo)
+        return filas
+
+    def registrar_carga(self, fecha: str, region: str, nombreArchivo: str) -> None:
+        # append de una línea corta: los lectores nunca ven una línea a medias sin su "\n"
+        with open(self.raiz / REGISTRO_CARGAS, "a", encoding="utf-8") as f:
+            f.write(f"{fecha}\t{region}\t{nombreArchivo}\n")
+
+    def cargas_desde(self, posicion: int = 0) -> tuple[int, list[tuple[str, str, str]]]:
+        """
+        Cargas registradas a partir del byte `posicion` del registro:
+        (nueva posición, [(fecha, region, archivo)]). Si el registro es más
+        corto que `posicion` (se borró o se rotó) devuelve posición -1.
+        """
+        ruta = self.raiz / REGISTRO_CARGAS
+        try:
+            with open(ruta, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                fin = f.tell()
+                if fin < posicion:
+                    return -1, []
+                f.seek(posicion)
+                crudo = f.read(fin - posicion)
+        except FileNotFoundError:
+            return (-1, []) if posicion > 0 else (0, [])
+        # solo líneas completas: una escritura en curso se lee en la próxima consulta
+        completo = crudo[:crudo.rfind(b"\n") + 1]
+        cargas = [tuple(linea.split("\t", 2)) for linea in completo.decode("utf-8").splitlines() if linea]
+        return posicion + len(completo), cargas
+
+    # -------------------------
+    # lectura
+    # -------------------------
+    def particiones(self, fecha_desde: str | None = None, fecha_hasta: str | None = None,
+                    regiones: Iterable[str] | None = None) -> list[ParticionColumnar]:
+        # filtro por nombre de directorio: las particiones excluidas no se abren
+        regiones = set(regiones) if regiones is not None else None
+        encontradas = []
+        if not self.raiz.exists():
+            return encontradas
+
+        for dir_fecha in sorted(self.raiz.glob("fecha=*")):
+            fecha = dir_fecha.name.split("=", 1)[1]
+            if (fecha_desde and fecha < fecha_desde) or (fecha_hasta and fecha > fecha_hasta):
+                continue
+            for dir_region in sorted(dir_fecha.glob("region=*")):
+                region = dir_region.name.split("=", 1)[1]
+                if regiones is not None and region not in regiones:
+                    continue
+                for ruta in sorted(dir_region.glob(f"*{EXTENSION}")):
+                    encontradas.append(ParticionColumnar(ruta, fecha, region))
+        return encontradas
+
+    def firma(self, fecha: str, region: str | None = None) -> list[list]:
+        """
+        [ruta relativa, tamaño, mtime_ns] de los .col de una fecha (o solo
+        de una región): cambia con cada reporte agregado, reemplazado o
+        borrado, así que sirve para saber si una caché de esa fecha quedó vieja.
+        """
+        directorio = self.raiz / f"fecha={fecha}"
+        patron = f"region={region}/*{EXTENSION}" if region is not None else f"region=*/*{EXTENSION}"
+        firma = []
+        for ruta in sorted(directorio.glob(patron)):
+            try:
+                st = ruta.stat()
+            except FileNotFoundError:
+                continue  # reemplazado mientras se listaba: la próxima firma lo verá
+            firma.append([f"{ruta.parent.name}/{ruta.name}", st.st_size, st.st_mtime_ns])
+        return firma
+
+    def fechas(self) -> list[str]:
+        return sorted(d.name.split("=", 1)[1] for d in self.raiz.glob("fecha=*")) if self.raiz.exists() else []
+
+    def leer(self, columnas: Iterable[str] | None = None, fecha_desde: str | None = None,
+             fecha_hasta: str | None = None, regiones: Iterable[str] | None = None,
+             segmentos: Iterable[str] | None = None, campos: Iterable[str] | None = None,
+             como_numpy: bool = False) -> dict:
+        """
+        {columna: valores} de todas las particiones que pasan el filtro.
+
+        Texto -> list[str], numéricas -> array("d") (o numpy.ndarray con
+        como_numpy=True si numpy está instalado).
+        """
+        columnas = list(COLUMNAS if columnas is None else columnas)
+        desconocidas = [c for c in columnas if c not in COLUMNAS]
+        if desconocidas:
+            raise ValueError(f"Columnas desconocidas: {desconocidas}")
+        if como_numpy and numpy is None:
+            raise ImportError("numpy no está instalado: usar como_numpy=False")
+
+        filtros = {}
+        if segmentos is not None:
+            filtros["segmento"] = set(segmentos)
+        if campos is not None:
+            filtros["campo"] = set(campos)
+
+        out = {c: ([] if c not in COLUMNAS_NUMERO else array("d")) for c in columnas}
+        for particion in self.particiones(fecha_desde, fecha_hasta, regiones):
+            a_leer = [c for c in dict.fromkeys(columnas + list(filtros)) if c not in COLUMNAS_PARTICION]
+            datos = particion.leer(a_leer)
+
+            seleccion = None
+            for columna, permitidos in filtros.items():
+                diccionario, indices = datos[columna]
+                codigos = {i for i, v in enumerate(diccionario) if v in permitidos}
+                filas = [n for n, i in enumerate(indices) if i in codigos] if seleccion is None \
+                    else [n for n in seleccion if indices[n] in codigos]
+                seleccion = filas
+            if seleccion is not None and not seleccion:
+                continue
+
+            for columna in columnas:
+                if columna in COLUMNAS_PARTICION:
+                    cantidad = particion.filas if seleccion is None else len(seleccion)
+                    out[columna].extend([getattr(particion, columna)] * cantidad)
+                    continue
+                valores = datos[columna]
+                if columna in COLUMNAS_NUMERO:
+                    out[columna].extend(valores if seleccion is None else (valores[n] for n in seleccion))
+                    continue
+                diccionario, indices = valores
+                if seleccion is None:
+                    out[columna].extend([diccionario[i] for i in indices])
+                else:
+                    out[columna].extend([diccionario[indices[n]] for n in seleccion])
+
+        if como_numpy:
+            out = {
+                c: numpy.frombuffer(v, dtype=numpy.float64) if c in COLUMNAS_NUMERO else numpy.array(v, dtype=object)
+                for c, v in out.items()
+            }
+        return out
+
+    def resumen(self) -> dict:
+        """Particiones, filas y bytes en disco del histórico."""
+        particiones = self.particiones()
+        return {
+            "particiones": len(particiones),
+            "fechas": len({p.fecha for p in particiones}),
+            "regiones": sorted({p.region for p in particiones}),
+            "filas": sum(p.filas for p in particiones),
+            "bytes": sum(p.ruta.stat().st_size for p in particiones),
+        }
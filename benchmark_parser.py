@@ -0,0 +1,312 @@
+"""
+Benchmark del parser de reportes CICS.
+
+Genera reportes sintéticos con el formato de DFHSTUP (encabezados de
+página "Applid ... PAGE", bandas "+_" de inicio, bandas "0-" de fin,
+segmentos clave/valor a una y dos columnas y tablas de varias páginas)
+y mide parse_cicsadm sobre ellos. El resultado es JSON para poder
+comparar versiones del parser entre releases.
+
+    python benchmark_parser.py --tamano 1MB --tamano 100MB --salida bench.json
+    python benchmark_parser.py --reporte Reportes_CICS_TEST/CICSADM.TXT
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import funciones
+import metricas
+
+
+ANCHO_LINEA = 133
+_UNIDADES = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+_TITULOS = (
+    "System Status", "Monitoring", "Statistics", "Transaction Manager",
+    "Dispatcher", "Dispatcher TCB Modes", "Dispatcher TCB Pools",
+    "Storage ABOVE 16MB", "Storage ABOVE 2GB", "Loader", "Transaction Classes",
+    "Temporary Storage", "Transient Data", "VTAM", "Autoinstall", "Enqueue Manager",
+)
+_CAMPOS = (
+    "MVS Product Name", "CICS Transaction Server Level", "CICS Startup",
+    "WLM Goal Type", "WLM Goal Value", "Max IP Sockets", "Peak Attach Count",
+    "Current ICV time", "Region size established from REGION= parameter",
+    "Times at MAXTASKS", "Peak number of active user transactions",
+    "Storage violations", "Average Attach Time", "Percent of limit used",
+)
+_VALORES = (
+    "4,000", "65,535", "10,216K", "00:00:05.123", "Yes", "No", "ACTIVE",
+    "12.5%", "04/11/2025 10:15:23", "0", "DFHIR000", "Velocity", "2,147,483,647",
+)
+# columnas de la tabla de transacciones: (encabezado superior, inferior, ancho, alineación)
+_COLUMNAS_TABLA = (
+    ("Tran", "ID", 4, "<"),
+    ("Tran", "Class", 8, "<"),
+    ("Program", "Name", 8, "<"),
+    ("Task Data", "Location", 9, "<"),
+    ("Attach", "Count", 10, ">"),
+    ("Restart", "Count", 7, ">"),
+    ("Dynamic --- Counts", "Local", 8, ">"),
+    ("", "Remote", 8, ">"),
+    ("Remote", "Starts", 8, ">"),
+    ("Storage", "Violations", 10, ">"),
+    ("Abend", "Count", 7, ">"),
+)
+_SANGRIA_TABLA = 3
+_SEPARACION_TABLA = 3
+
+
+def _linea_tabla(textos, control=" "):
+    # ubica cada texto en su columna; los que no caben empiezan en el borde izquierdo
+    buffer = [" "] * ANCHO_LINEA
+    buffer[0] = control
+    inicio = _SANGRIA_TABLA
+    for texto, (_, _, ancho, alineacion) in zip(textos, _COLUMNAS_TABLA):
+        texto = str(texto)
+        desde = inicio + ancho - len(texto) if alineacion == ">" and len(texto) <= ancho else inicio
+        buffer[desde:desde + len(texto)] = texto
+        inicio += ancho + _SEPARACION_TABLA
+    return "".join(buffer[:ANCHO_LINEA]).rstrip()
+
+
+_ENCABEZADO_TABLA = (
+    _linea_tabla([c[0] for c in _COLUMNAS_TABLA], control="0"),
+    _linea_tabla([c[1] for c in _COLUMNAS_TABLA]),
+)
+
+
+def parsear_tamano(texto: str) -> int:
+    t = texto.strip().upper()
+    for unidad, factor in _UNIDADES.items():
+        if t.endswith(unidad):
+            return int(float(t[:-len(unidad)]) * factor)
+    return int(t)
+
+
+# =========================
+# GENERADOR SINTÉTICO
+# =========================
+class _Escritor:
+    def __init__(self, f, rnd):
+        self.f = f
+        self.rnd = rnd
+        self.pagina = 0
+        self.lineas_pagina = 0
+        self.bytes = 0
+
+    def linea(self, texto=""):
+        # el reporte real nunca pasa de ANCHO_LINEA: el partido en columnas depende del ancho
+        if len(texto) > ANCHO_LINEA:
+            raise ValueError(f"Línea sintética de {len(texto)} columnas (máximo {ANCHO_LINEA}): {texto!r}")
+        self.f.write(texto + "\n")
+        self.bytes += len(texto) + 1
+        self.lineas_pagina += 1
+        if self.lineas_pagina >= 60:
+            self.encabezado_pagina()
+
+    def encabezado_pagina(self):
+        self.pagina += 1
+        self.lineas_pagina = 0
+        # ancho fijo de ANCHO_LINEA con PAGE en el margen derecho, como el DFHSTUP real
+        izquierda = "1Applid CICSADM  Sysid CADM  Jobname CICSADM  Date 04/11/2025  Time 10:15:23     CICS 7.2.0"
+        derecha = f"PAGE {self.pagina:>5}"
+        texto = izquierda.ljust(ANCHO_LINEA - len(derecha)) + derecha
+        self.f.write(texto + "\n\n")
+        self.bytes += len(texto) + 2
+
+    def kv(self, ancho):
+        # solo campos que dejan lugar a los puntos: con el valor más largo el par
+        # ocupa a lo sumo ancho + 6 y la línea de dos columnas no pasa de ANCHO_LINEA
+        campo = self.rnd.choice([c for c in _CAMPOS if len(c) <= ancho - 18])
+        puntos = " ." * max(1, (ancho - len(campo) - 16) // 2)
+        return f"{campo}{puntos} : {self.rnd.choice(_VALORES):>12}"
+
+
+def _segmento_kv(e: _Escritor):
+    e.linea("+" + "_" * (ANCHO_LINEA - 1))
+    e.linea(e.rnd.choice(_TITULOS))
+    e.linea()
+    for _ in range(e.rnd.randint(4, 30)):
+        e.linea(f"  {e.kv(60):<64}  {e.kv(56)}" if e.rnd.random() < 0.7 else f"  {e.kv(60)}")
+    e.linea("0" + "-" * (ANCHO_LINEA - 1))
+    e.linea()
+
+
+def _segmento_dos_columnas(e: _Escritor):
+    izquierdo, derecho = e.rnd.sample(_TITULOS, 2)
+    e.linea("+" + "_" * (ANCHO_LINEA - 1))
+    e.linea(f"-{izquierdo:<64}  -{derecho}")
+    for _ in range(e.rnd.randint(4, 20)):
+        e.linea(f"  {e.kv(60):<64}  {e.kv(56)}")
+    e.linea("0" + "-" * (ANCHO_LINEA - 1))
+    e.linea()
+
+
+def _segmento_tabla(e: _Escritor, filas: int):
+    # tablas largas: se repite banda + encabezado en cada página, como DFHSTUP
+    n = 0
+    while n < filas:
+        e.linea("+" + "_" * (ANCHO_LINEA - 1))
+        for encabezado in _ENCABEZADO_TABLA:
+            e.linea(encabezado)
+        e.linea()
+        for _ in range(min(50, filas - n)):
+            r = e.rnd
+            e.linea(_linea_tabla((
+                "T%03X" % (n % 4096), "DFHTC%03d" % r.randint(0, 999), "PRG%05d" % n,
+                r.choice(("Any", "Below")), f"{r.randint(0, 9_999_999):,}", r.randint(0, 99),
+                r.randint(0, 999), r.randint(0, 999), r.randint(0, 99), 0, r.randint(0, 9),
+            )))
+            n += 1
+        e.linea("0" + "-" * (ANCHO_LINEA - 1))
+        e.linea()
+
+
+def generar_reporte_sintetico(ruta: Path, tamano_bytes: int, semilla: int = 2024,
+                              filas_tabla: int = 800) -> Path:
+    """Escribe en `ruta` un reporte sintético de aproximadamente tamano_bytes."""
+    rnd = random.Random(semilla)
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        e = _Escritor(f, rnd)
+        e.encabezado_pagina()
+        while e.bytes < tamano_bytes:
+            r = rnd.random()
+            if r < 0.55:
+                _segmento_kv(e)
+            elif r < 0.85:
+                _segmento_dos_columnas(e)
+            else:
+                _segmento_tabla(e, rnd.randint(filas_tabla // 4, filas_tabla))
+    return ruta
+
+
+# =========================
+# MEDICIÓN
+# =========================
+# funciones del parser cuyo tiempo se mide por separado (etapa -> nombre en funciones)
+ETAPAS = {
+    # las líneas de un segmento pasan por la caché de columnas; la heurística solo en los fallos
+    "split_two_columns": "DisposicionColumnas.partir",
+    "parse_kvs": "parse_kvs",
+    "is_table_segment": "es_tabla_clasificada",
+    "clasificar_linea": "clasificar_linea",
+}
+
+
+def _contar_lineas(ruta: Path) -> int:
+    with open(ruta, "rb") as f:
+        return sum(bloque.count(b"\n") for bloque in iter(lambda: f.read(1 << 20), b""))
+
+
+def _medir_throughput(ruta: str) -> dict:
+    # proceso propio: el pico de RSS corresponde solo a este parseo
+    inicio = time.perf_counter()
+    data = funciones.parse_cicsadm(Path(ruta))
+    segundos = time.perf_counter() - inicio
+    return {
+        "segundos": segundos,
+        "rss_pico_mb": metricas.rss_pico_mb(),
+        "segmentos": len(data),
+        "campos": sum(len(v) for v in data.values()),
+    }
+
+
+def _medir_etapas(ruta: str) -> dict:
+    # pasada instrumentada aparte: envolver funciones agrega overhead
+    with metricas.recolectar() as medidas:
+        with metricas.instrumentar(funciones, ETAPAS):
+            inicio = time.perf_counter()
+            funciones.parse_cicsadm(Path(ruta))
+            total = time.perf_counter() - inicio
+
+    return {
+        "total_instrumentado_segundos": total,
+        "etapas": medidas.instantanea()["etapas"],
+    }
+
+
+def medir_reporte(ruta: Path, repeticiones: int = 1, etapas: bool = True) -> dict:
+    tamano = ruta.stat().st_size
+    lineas = _contar_lineas(ruta)
+
+    mediciones = []
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        for _ in range(max(1, repeticiones)):
+            mediciones.append(pool.submit(_medir_throughput, str(ruta)).result())
+        detalle = pool.submit(_medir_etapas, str(ruta)).result() if etapas else None
+
+    mejor = min(mediciones, key=lambda m: m["segundos"])
+    segundos = mejor["segundos"]
+    resultado = {
+        "archivo": str(ruta),
+        "bytes": tamano,
+        "lineas": lineas,
+        "repeticiones": len(mediciones),
+        "segundos": segundos,
+        "lineas_por_segundo": lineas / segundos if segundos else None,
+        "mb_por_segundo": tamano / 1024 ** 2 / segundos if segundos else None,
+        "rss_pico_mb": max((m["rss_pico_mb"] or 0.0) for m in mediciones) or None,
+        "segmentos": mejor["segmentos"],
+        "campos": mejor["campos"],
+    }
+    if detalle is not None:
+        resultado.update(detalle)
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de parse_cicsadm")
+    parser.add_argument("--tamano", action="append", default=[],
+                        help="tamaño del reporte sintético (p. ej. 1MB, 100MB, 1GB); repetible")
+    parser.add_argument("--reporte", action="append", default=[], type=Path,
+                        help="reporte real a medir; repetible")
+    parser.add_argument("--semilla", type=int, default=2024)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--sin-etapas", action="store_true", help="omitir la pasada instrumentada por etapa")
+    parser.add_argument("--directorio", type=Path, default=None,
+                        help="dónde dejar los reportes sintéticos (por defecto, temporal)")
+    parser.add_argument("--salida", type=Path, default=None, help="archivo JSON de resultados (por defecto, stdout)")
+    args = parser.parse_args(argv)
+
+    if not args.tamano and not args.reporte:
+        args.tamano = ["1MB"]
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as temporal:
+        directorio = args.directorio or Path(temporal)
+        directorio.mkdir(parents=True, exist_ok=True)
+
+        for texto in args.tamano:
+            ruta = directorio / f"SINTETICO_{texto.upper()}.TXT"
+            if not ruta.exists():
+                generar_reporte_sintetico(ruta, parsear_tamano(texto), args.semilla)
+            medicion = medir_reporte(ruta, args.repeticiones, not args.sin_etapas)
+            medicion["sintetico"] = {"tamano": texto, "semilla": args.semilla}
+            resultados.append(medicion)
+            print(f"{ruta.name}: {medicion['mb_por_segundo']:.2f} MB/s, "
+                  f"{medicion['lineas_por_segundo']:,.0f} líneas/s", file=sys.stderr)
+
+        for ruta in args.reporte:
+            resultados.append(medir_reporte(ruta, args.repeticiones, not args.sin_etapas))
+
+    salida = {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "resultados": resultados,
+    }
+    texto = json.dumps(salida, indent=2, ensure_ascii=False)
+    if args.salida:
+        args.salida.write_text(texto, encoding="utf-8")
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
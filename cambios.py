@@ -0,0 +1,362 @@
+import argparse
+import sqlite3
+import threading
+from funciones import *
+
+
+# =========================
+# CARGA POR CAMBIOS (CDC)
+# =========================
+# La mayoría de los campos de un reporte son configuración que no cambia
+# de un día a otro ("MVS Product Name", "Max IP Sockets", ...). En modo
+# CDC (main.py --modo-carga cdc) cada carga escribe en
+# validacion_sistema_cambios solo:
+#
+#   - los campos nuevos o con un valor distinto al snapshot anterior;
+#   - una lápida (eliminado = 1, valor NULL) por cada campo que estaba en
+#     el snapshot anterior y ya no aparece en el reporte.
+#
+# El snapshot completo de cualquier fecha se reconstruye con la última
+# fila de cada (segmento, campo) con fecha <= esa fecha que no sea una
+# lápida (reconstruir_snapshot).
+#
+# Para no releer el estado anterior de la BD en cada carga, los últimos
+# valores por (archivo, segmento, campo) se guardan en una caché local
+# SQLite. Cada carga incrementa la versión del archivo en
+# validacion_sistema_cambios_estado; si la caché tiene otra versión
+# (otro proceso cargó el archivo, o un corte ocurrió entre el commit y la
+# caché), se reconstruye desde la BD antes de comparar.
+#
+# Las fechas de un archivo deben cargarse en orden: recargar la última
+# fecha corrige sus valores, pero una fecha anterior se rechaza (para
+# rellenar el pasado está la carga completa).
+
+
+DDL_CACHE = (
+    """
+    CREATE TABLE IF NOT EXISTS valores
+    (
+        archivo TEXT NOT NULL,
+        segmento TEXT NOT NULL,
+        campo TEXT NOT NULL,
+        valor TEXT NOT NULL,
+        PRIMARY KEY (archivo, segmento, campo)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS estado
+    (
+        archivo TEXT NOT NULL PRIMARY KEY,
+        fecha TEXT,
+        version INTEGER NOT NULL
+    )
+    """,
+)
+
+
+class CacheUltimosValores:
+    """
+    Caché local (SQLite) del último valor conocido de cada
+    (archivo, segmento, campo) y de la versión CDC de cada archivo.
+    Segura entre hilos (los escritores del modo --pipeline la comparten).
+    """
+
+    def __init__(self, ruta: Path):
+        self.ruta = Path(ruta)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.ruta), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for sentencia in DDL_CACHE:
+            self._conn.execute(sentencia)
+        self._conn.commit()
+
+    def estado(self, archivo: str) -> tuple[str | None, int] | None:
+        """(fecha, versión) de la última carga CDC del archivo, o None."""
+        with self._lock:
+            fila = self._conn.execute("SELECT fecha, version FROM estado WHERE archivo = ?", (archivo,)).fetchone()
+        return None if fila is None else (fila[0], fila[1])
+
+    def valores(self, archivo: str) -> dict[tuple[str, str], str]:
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT segmento, campo, valor FROM valores WHERE archivo = ?", (archivo,)
+            ).fetchall()
+        return {(segmento, campo): valor for segmento, campo, valor in filas}
+
+    def reemplazar(self, archivo: str, valores: dict, fecha: str | None, version: int) -> None:
+        # estado reconstruido desde la BD: se descarta lo que hubiera del archivo
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM valores WHERE archivo = ?", (archivo,))
+            self._conn.executemany(
+                "INSERT INTO valores (archivo, segmento, campo, valor) VALUES (?, ?, ?, ?)",
+                ((archivo, segmento, campo, valor) for (segmento, campo), valor in valores.items()),
+            )
+            self._fijar_estado(archivo, fecha, version)
+
+    def aplicar(self, archivo: str, cambios, eliminados, fecha: str, version: int) -> None:
+        """Aplica una carga ya confirmada en la BD (una transacción SQLite)."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO valores (archivo, segmento, campo, valor) VALUES (?, ?, ?, ?)",
+                ((archivo, segmento, campo, valor) for segmento, campo, valor in cambios),
+            )
+            self._conn.executemany(
+                "DELETE FROM valores WHERE archivo = ? AND segmento = ? AND campo = ?",
+                ((archivo, segmento, campo) for segmento, campo in eliminados),
+            )
+            self._fijar_estado(archivo, fecha, version)
+
+    def _fijar_estado(self, archivo, fecha, version):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO estado (archivo, fecha, version) VALUES (?, ?, ?)",
+            (archivo, fecha, version),
+        )
+
+    def olvidar(self, archivo: str) -> None:
+        # la próxima carga del archivo reconstruye su estado desde la BD
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM valores WHERE archivo = ?", (archivo,))
+            self._conn.execute("DELETE FROM estado WHERE archivo = ?", (archivo,))
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# =========================
+# DIFERENCIAS
+# =========================
+def valores_reporte(data: dict) -> dict[tuple[str, str], str]:
+    # mismas reglas que filasValidacionSistema: sin segmentos vacíos, valores como texto
+    valores = {}
+    for titulo, campos in data.items():
+        if not campos or not isinstance(campos, Mapping):
+            continue
+        for campo, valor in campos.items():
+            valores[(titulo, str(campo))] = "" if valor is None else str(valor)
+    return valores
+
+
+def diferencias(anteriores: dict, data: dict) -> tuple[list, list, int]:
+    """
+    Compara el snapshot anterior {(segmento, campo): valor} con un
+    reporte parseado. Devuelve (cambios [(segmento, campo, valor)],
+    eliminados [(segmento, campo)], cantidad de campos sin cambios).
+    """
+    actuales = valores_reporte(data)
+    cambios = [
+        (segmento, campo, valor)
+        for (segmento, campo), valor in actuales.items()
+        if anteriores.get((segmento, campo)) != valor
+    ]
+    eliminados = [clave for clave in anteriores if clave not in actuales]
+    return cambios, eliminados, len(actuales) - len(cambios)
+
+
+# =========================
+# CARGA
+# =========================
+# lee y bloquea el estado del archivo hasta el commit: dos cargas del mismo
+# archivo no comparan contra el mismo snapshot
+ESTADO_CDC_SQL = """
+    SELECT version, ultima_fecha FROM validacion_sistema_cambios_estado WITH (UPDLOCK, HOLDLOCK)
+    WHERE archivo = ?
+"""
+
+ACTUALIZAR_ESTADO_CDC_SQL = """
+    UPDATE validacion_sistema_cambios_estado SET ultima_fecha = ?, version = version + 1 WHERE archivo = ?;
+    IF @@ROWCOUNT = 0
+        INSERT INTO validacion_sistema_cambios_estado (archivo, ultima_fecha, version) VALUES (?, ?, 1);
+"""
+
+INSERT_CARGA_CDC_SQL = """
+    INSERT INTO validacion_sistema_carga (lote, archivo, segmento, campo, valor, valor_num, valor_fecha, tipo_valor, fecha, eliminado)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# recargar la misma fecha reemplaza la fila de ese día; si no existe, se inserta
+PUBLICAR_CAMBIOS_ACTUALIZAR_SQL = """
+    UPDATE v SET valor = c.valor, valor_num = c.valor_num, valor_fecha = c.valor_fecha,
+                 tipo_valor = c.tipo_valor, eliminado = c.eliminado
+    FROM validacion_sistema_cambios v WITH (UPDLOCK, HOLDLOCK)
+    JOIN validacion_sistema_carga c
+      ON c.archivo = v.archivo AND c.segmento = v.segmento AND c.campo = v.campo AND c.fecha = v.fecha
+    WHERE c.lote = ?;
+"""
+
+PUBLICAR_CAMBIOS_INSERTAR_SQL = """
+    INSERT INTO validacion_sistema_cambios (archivo, segmento, campo, fecha, valor, valor_num, valor_fecha, tipo_valor, eliminado)
+    SELECT c.archivo, c.segmento, c.campo, c.fecha, c.valor, c.valor_num, c.valor_fecha, c.tipo_valor, c.eliminado
+    FROM validacion_sistema_carga c
+    WHERE c.lote = ?
+      AND NOT EXISTS (
+          SELECT 1 FROM validacion_sistema_cambios v WITH (UPDLOCK, HOLDLOCK)
+          WHERE v.archivo = c.archivo AND v.segmento = c.segmento
+            AND v.campo = c.campo AND v.fecha = c.fecha
+      );
+"""
+
+# valor vigente de cada (segmento, campo) del archivo a una fecha: la
+# última versión con fecha <= ?, salvo que sea una lápida. Lo resuelve la
+# clave agrupada (archivo, segmento, campo, fecha).
+SNAPSHOT_SQL = """
+    SELECT s.segmento, c.campo, x.valor
+    FROM (
+        SELECT segmento, campo, valor, eliminado,
+               ROW_NUMBER() OVER (PARTITION BY segmento, campo ORDER BY fecha DESC) AS n
+        FROM validacion_sistema_cambios
+        WHERE archivo = ? AND fecha <= ?
+    ) x
+    JOIN segmento s ON s.id = x.segmento
+    JOIN campo c ON c.id = x.campo
+    WHERE x.n = 1 AND x.eliminado = 0
+    ORDER BY x.segmento, x.campo;
+"""
+
+
+def _valores_a_fecha(cursor, archivo_id, fecha) -> dict[tuple[str, str], str]:
+    cursor.execute(SNAPSHOT_SQL, (archivo_id, fecha))
+    return {(segmento, campo): ("" if valor is None else valor) for segmento, campo, valor in cursor.fetchall()}
+
+
+def filasCambios(fechaActual, archivo_id, cambios, eliminados, ids_segmentos, ids_campos):
+    filas = []
+    for segmento, campo, valor in cambios:
+        normalizado = normalizar_valor(valor)
+        filas.append((
+            archivo_id, ids_segmentos.get(segmento), ids_campos.get(campo), valor,
+            normalizado.numero, normalizado.fecha, normalizado.tipo, fechaActual, 0,
+        ))
+    for segmento, campo in eliminados:
+        filas.append((
+            archivo_id, ids_segmentos.get(segmento), ids_campos.get(campo), None,
+            None, None, None, fechaActual, 1,
+        ))
+    return filas
+
+
+def cargar_reporte_cdc(nombreArchivo, data, fechaActual, cache: CacheUltimosValores,
+                       tamanoLote=TAMANO_LOTE_CARGA):
+    """
+    Carga CDC de un reporte ya parseado: registra las dimensiones igual
+    que cargar_reporte y escribe en validacion_sistema_cambios solo los
+    cambios y lápidas respecto del último snapshot del archivo. Todo en
+    una transacción; la caché se actualiza después del commit. Devuelve
+    la cantidad de filas escritas.
+    """
+    with etapa("bd_dimensiones"):
+        registrarSegmentos(data.keys())
+        registrarArchivos([nombreArchivo])
+        registrarCampos(campo for campos in data.values() if isinstance(campos, Mapping) for campo in campos)
+
+    asegurar_esquema()
+    archivo_id = cache_archivos.id(nombreArchivo)
+    fechaActual = str(fechaActual)
+    inicio = time.perf_counter()
+
+    with conexion() as conn_sqlserver:
+        cursor = conn_sqlserver.cursor()
+        try:
+            cursor.execute(ESTADO_CDC_SQL, (archivo_id,))
+            fila = cursor.fetchone()
+            version, ultima_fecha = (fila[0], str(fila[1])) if fila else (0, None)
+            if ultima_fecha is not None and fechaActual < ultima_fecha:
+                raise ValueError(
+                    f"La carga CDC de {nombreArchivo} ya llegó al {ultima_fecha}; "
+                    f"el {fechaActual} debe cargarse en modo completo"
+                )
+
+            estado = cache.estado(nombreArchivo)
+            if estado is None or estado[1] != version:
+                # caché ausente o atrasada: el snapshot vigente sale de la BD
+                with etapa("cdc_reconstruccion"):
+                    anteriores = _valores_a_fecha(cursor, archivo_id, ultima_fecha) if version else {}
+                cache.reemplazar(nombreArchivo, anteriores, ultima_fecha, version)
+                contar("cdc_reconstrucciones")
+            else:
+                anteriores = cache.valores(nombreArchivo)
+
+            with etapa("cdc_diferencias"):
+                cambios, eliminados, sin_cambio = diferencias(anteriores, data)
+                filas = filasCambios(
+                    fechaActual, archivo_id, cambios, eliminados, obtenerIdsSegmentos(), obtenerIdsCampos()
+                )
+
+            if filas:
+                lote = str(uuid.uuid4())
+                cursor.fast_executemany = True
+                tamanoLote = max(1, tamanoLote)
+                for i in range(0, len(filas), tamanoLote):
+                    cursor.executemany(INSERT_CARGA_CDC_SQL, [(lote, *f) for f in filas[i:i + tamanoLote]])
+                    contar("bd_lotes")
+                cursor.execute(PUBLICAR_CAMBIOS_ACTUALIZAR_SQL, (lote,))
+                cursor.execute(PUBLICAR_CAMBIOS_INSERTAR_SQL, (lote,))
+                cursor.execute("DELETE FROM validacion_sistema_carga WHERE lote = ?", (lote,))
+
+            cursor.execute(ACTUALIZAR_ESTADO_CDC_SQL, (fechaActual, archivo_id, archivo_id, fechaActual))
+            conn_sqlserver.commit()
+        except Exception:
+            conn_sqlserver.rollback()
+            raise
+
+    cache.aplicar(nombreArchivo, cambios, eliminados, fechaActual, version + 1)
+
+    segundos = time.perf_counter() - inicio
+    metricas_actuales().sumar_tiempo("bd_insercion", segundos)
+    contar("filas_insertadas", len(filas))
+    contar("cdc_cambios", len(cambios))
+    contar("cdc_lapidas", len(eliminados))
+    contar("cdc_sin_cambios", sin_cambio)
+
+    total = len(cambios) + sin_cambio
+    proporcion = len(filas) / total if total else 0.0
+    print(
+        f"Carga CDC completada para {nombreArchivo}: {len(cambios)} cambios, {len(eliminados)} eliminados, "
+        f"{sin_cambio} sin cambios ({proporcion:.1%} de una carga completa) en {segundos:.2f} s"
+    )
+    return len(filas)
+
+
+# =========================
+# RECONSTRUCCIÓN
+# =========================
+def reconstruir_snapshot(nombreArchivo, fecha) -> dict:
+    """
+    Snapshot completo de un archivo a una fecha, con la forma de
+    parse_cicsadm ({segmento: {campo: valor}}, sin segmentos vacíos),
+    a partir de validacion_sistema_cambios.
+    """
+    asegurar_esquema()
+    archivo_id = cache_archivos.id(nombreArchivo)
+    if archivo_id is None:
+        return {}
+    with conexion() as conn_sqlserver:
+        valores = _valores_a_fecha(conn_sqlserver.cursor(), archivo_id, str(fecha))
+
+    snapshot: dict[str, dict] = {}
+    for (segmento, campo), valor in valores.items():
+        snapshot.setdefault(segmento, {})[campo] = valor
+    return snapshot
+
+
+def leer_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Reconstruye el snapshot CDC de un reporte a una fecha.")
+    parser.add_argument("archivo", help="nombre del reporte sin extensión (como en la tabla archivos)")
+    parser.add_argument("fecha", type=datetime.date.fromisoformat, help="AAAA-MM-DD")
+    parser.add_argument("--salida", type=Path, help="escribir el JSON en este archivo")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = leer_argumentos(argv)
+    snapshot = reconstruir_snapshot(args.archivo, args.fecha)
+    if args.salida is not None:
+        exportar_json(snapshot, args.salida)
+        print(f"✔ Snapshot de {args.archivo} al {args.fecha}: {len(snapshot)} segmentos en {args.salida}")
+        return
+    print(json.dumps(snapshot, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,269 @@
-import pyodbc
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import pyodbc
+except ImportError:  # el pool también funciona con otra fábrica (p. ej. sqlite3)
+    pyodbc = None
+
 
 def conectar_base_datos():
+    if pyodbc is None:
+        raise ImportError("pyodbc no está instalado: no es posible conectar a SQL Server")
     conn = pyodbc.connect('DRIVER={SQL Server};' \
     'SERVER=10.2.214.69;' \
     'DATABASE=DB_base_conocimiento_2;' \
     'UID=C3;' \
     'PWD=R3s1l13nc14C0d1g02024.')
-    return conn 
+    return conn
+
+
+# =========================
+# POOL DE CONEXIONES
+# =========================
+TAMANO_POOL = int(os.environ.get("CICS_TAMANO_POOL", "4"))
+
+
+class PoolAgotadoError(RuntimeError):
+    pass
+
+
+# errores de red o de sesión que justifican reintentar con otra conexión
+ERRORES_CONEXION = (ConnectionError, TimeoutError, PoolAgotadoError)
+if pyodbc is not None:
+    ERRORES_CONEXION += (pyodbc.OperationalError, pyodbc.InterfaceError)
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones DB-API reutilizables.
+
+    - fabrica: función sin argumentos que abre una conexión nueva
+      (conectar_base_datos por defecto; sqlite3.connect para pruebas locales).
+    - tamano: máximo de conexiones abiertas a la vez.
+    - consulta_salud: consulta para validar una conexión que estuvo inactiva
+      más de verificar_tras segundos antes de prestarla.
+    - umbral_fuga: segundos que una conexión puede estar prestada antes de
+      contarse como posible fuga en estadisticas().
+
+    Dentro de un mismo hilo los préstamos anidados reutilizan la misma
+    conexión (sesión), así un helper que llama a otro no abre una segunda.
+    Al devolverse, la conexión se limpia con rollback(): lo que no se haya
+    confirmado con commit() se descarta.
+    """
+
+    def __init__(self, fabrica=conectar_base_datos, tamano=TAMANO_POOL, consulta_salud="SELECT 1",
+                 verificar_tras=30.0, espera=30.0, umbral_fuga=300.0):
+        if tamano < 1:
+            raise ValueError("El tamaño del pool debe ser al menos 1")
+
+        self.fabrica = fabrica
+        self.tamano = tamano
+        self.consulta_salud = consulta_salud
+        self.verificar_tras = verificar_tras
+        self.espera = espera
+        self.umbral_fuga = umbral_fuga
+
+        self._inactivas = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._vivas = 0
+        self._prestadas = {}
+        self._cerrado = False
+        self._contadores = {
+            "abiertas": 0,
+            "prestamos": 0,
+            "reutilizadas": 0,
+            "descartadas": 0,
+            "fallos_salud": 0,
+        }
+
+    # -------------------------
+    # préstamo / devolución
+    # -------------------------
+    @contextmanager
+    def conexion(self):
+        actual = getattr(self._local, "conexion", None)
+        if actual is not None:
+            # préstamo anidado en el mismo hilo: misma sesión
+            self._local.nivel += 1
+            try:
+                yield actual
+            finally:
+                self._local.nivel -= 1
+            return
+
+        conn = self._prestar()
+        self._local.conexion = conn
+        self._local.nivel = 1
+        try:
+            yield conn
+        finally:
+            self._local.conexion = None
+            self._local.nivel = 0
+            # si el rollback falla la conexión está rota y se descarta
+            self._devolver(conn, descartar=not self._rollback(conn))
+
+    def _prestar(self):
+        limite = time.monotonic() + self.espera
+
+        while True:
+            if self._cerrado:
+                raise PoolAgotadoError("El pool de conexiones está cerrado")
+
+            try:
+                conn, devuelta_en = self._inactivas.get_nowait()
+            except queue.Empty:
+                conn = None
+
+            if conn is not None:
+                if time.monotonic() - devuelta_en >= self.verificar_tras and not self._saludable(conn):
+                    self._contar("fallos_salud")
+                    self._cerrar_conexion(conn)
+                    continue
+                self._contar("reutilizadas")
+                return self._registrar_prestamo(conn)
+
+            with self._lock:
+                crear = self._vivas < self.tamano
+                if crear:
+                    self._vivas += 1
+
+            if crear:
+                try:
+                    conn = self.fabrica()
+                except BaseException:
+                    with self._lock:
+                        self._vivas -= 1
+                    raise
+                self._contar("abiertas")
+                return self._registrar_prestamo(conn)
+
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                raise PoolAgotadoError(
+                    f"No hay conexiones libres tras {self.espera} s "
+                    f"({len(self._prestadas)} prestadas, posible fuga)"
+                )
+            try:
+                conn, devuelta_en = self._inactivas.get(timeout=restante)
+            except queue.Empty:
+                continue
+            # se vuelve a encolar para pasar por la validación de arriba
+            self._inactivas.put((conn, devuelta_en))
+
+    def _registrar_prestamo(self, conn):
+        with self._lock:
+            self._prestadas[id(conn)] = (time.monotonic(), threading.current_thread().name)
+            self._contadores["prestamos"] += 1
+        return conn
+
+    def _contar(self, nombre):
+        with self._lock:
+            self._contadores[nombre] += 1
+
+    def _devolver(self, conn, descartar=False):
+        with self._lock:
+            self._prestadas.pop(id(conn), None)
+
+        if descartar or self._cerrado:
+            self._contar("descartadas")
+            self._cerrar_conexion(conn)
+            return
+
+        self._inactivas.put((conn, time.monotonic()))
+
+    def _saludable(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.consulta_salud)
+            cursor.fetchall()
+            return self._rollback(conn)
+        except Exception:
+            return False
+
+    @staticmethod
+    def _rollback(conn):
+        try:
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _cerrar_conexion(self, conn):
+        with self._lock:
+            self._vivas -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    # -------------------------
+    # administración
+    # -------------------------
+    def fugas(self):
+        # préstamos activos que superan umbral_fuga: (segundos, hilo)
+        ahora = time.monotonic()
+        with self._lock:
+            prestadas = list(self._prestadas.values())
+        return [
+            (ahora - desde, hilo)
+            for desde, hilo in prestadas
+            if ahora - desde >= self.umbral_fuga
+        ]
+
+    def estadisticas(self):
+        with self._lock:
+            prestadas = len(self._prestadas)
+            vivas = self._vivas
+            contadores = dict(self._contadores)
+        return {
+            **contadores,
+            "tamano": self.tamano,
+            "vivas": vivas,
+            "prestadas": prestadas,
+            "inactivas": self._inactivas.qsize(),
+            "fugas": len(self.fugas()),
+        }
+
+    def cerrar(self):
+        """Cierra las conexiones inactivas; las prestadas se cierran al devolverse."""
+        self._cerrado = True
+        while True:
+            try:
+                conn, _ = self._inactivas.get_nowait()
+            except queue.Empty:
+                break
+            self._cerrar_conexion(conn)
+        return self.estadisticas()
+
+
+_pool = None
+_pool_pid = None
+_pool_config = {}
+
+
+def configurar_pool(fabrica=conectar_base_datos, tamano=TAMANO_POOL, **opciones):
+    """Reemplaza el pool del proceso (p. ej. tamaño distinto o sqlite3 en pruebas)."""
+    global _pool, _pool_pid, _pool_config
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.cerrar()
+    _pool_config = {"fabrica": fabrica, "tamano": tamano, **opciones}
+    _pool = PoolConexiones(**_pool_config)
+    _pool_pid = os.getpid()
+    return _pool
+
+
+def obtener_pool():
+    # un pool por proceso: los hijos de un ProcessPoolExecutor no heredan conexiones
+    if _pool is None or _pool_pid != os.getpid():
+        return configurar_pool(**_pool_config)
+    return _pool
+
+
+def conexion():
+    """Presta una conexión del pool del proceso: with conexion() as conn: ..."""
+    return obtener_pool().conexion()
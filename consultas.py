@@ -0,0 +1,409 @@
+import argparse
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from funciones import *
+from almacen_columnar import AlmacenColumnar, ParticionColumnar, EXTENSION
+
+
+# =========================
+# CONSULTAS SOBRE EL HISTÓRICO
+# =========================
+# API de lectura para tableros sobre el histórico columnar local
+# (main.py --destino columnar|ambos), sin ida y vuelta a SQL Server:
+#
+#   consultas = ConsultasEstadisticas(AlmacenColumnar(DIRECTORIO_HISTORIAL))
+#   consultas.obtener_metrica("Dispatcher", "Peak Attach Count", regiones=["CICSADM"],
+#                             fecha_desde="2026-01-01", fecha_hasta="2026-01-31")
+#   consultas.top_n("Peak Attach Count", "2026-01-31", n=10)
+#
+# Solo lee el histórico local: con el destino por defecto (--destino bd)
+# no se escribe y las consultas no tienen datos (se avisa en el log).
+#
+# Dos niveles de caché:
+#   - rollups diarios por (fecha, region): {segmento: {campo: [suma, mínimo,
+#     máximo, cuenta]}} de los valores numéricos, con los títulos repetidos
+#     ("Dispatcher (2)") sumados al título base. main.py guarda al cargar
+#     un parcial por reporte en HISTORIAL_COLUMNAR/_rollups/;
+#   - un LRU acotado de resultados de consultas.
+#
+# Invalidación: cada carga al histórico agrega una línea a _cargas.log
+# (almacen_columnar.REGISTRO_CARGAS). Antes de responder se lee lo nuevo
+# del registro (un stat si no cambió) y se descartan los rollups y
+# resultados de las fechas cargadas, también si la carga la hizo otro proceso.
+DIRECTORIO_ROLLUPS = "_rollups"
+CAPACIDAD_CACHE = 512
+CAPACIDAD_ROLLUPS = 4096
+
+AGREGADO_SUMA = "suma"
+AGREGADO_MINIMO = "minimo"
+AGREGADO_MAXIMO = "maximo"
+AGREGADO_PROMEDIO = "promedio"
+AGREGADO_CUENTA = "cuenta"
+AGREGADOS = (AGREGADO_SUMA, AGREGADO_MINIMO, AGREGADO_MAXIMO, AGREGADO_PROMEDIO, AGREGADO_CUENTA)
+
+
+def validar_agregado(agregado: str) -> None:
+    if agregado not in AGREGADOS:
+        raise ValueError(f"Agregado desconocido: {agregado} (opciones: {', '.join(AGREGADOS)})")
+
+
+def valor_agregado(acumulado: list, agregado: str) -> float:
+    suma, minimo, maximo, cuenta = acumulado
+    if agregado == AGREGADO_SUMA:
+        return suma
+    if agregado == AGREGADO_MINIMO:
+        return minimo
+    if agregado == AGREGADO_MAXIMO:
+        return maximo
+    if agregado == AGREGADO_PROMEDIO:
+        return suma / cuenta
+    validar_agregado(agregado)
+    return cuenta
+
+
+class CacheLRU:
+    """
+    Resultados por clave con capacidad acotada (se descarta el menos
+    usado). Cada entrada guarda el rango de fechas que cubre para poder
+    invalidar solo las afectadas por una carga.
+    """
+
+    def __init__(self, capacidad: int = CAPACIDAD_CACHE):
+        self.capacidad = max(1, capacidad)
+        self._entradas: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidadas = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def poner(self, clave, valor, fecha_desde: str | None = None, fecha_hasta: str | None = None) -> None:
+        with self._lock:
+            self._entradas[clave] = (valor, fecha_desde, fecha_hasta)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, fecha: str | None = None) -> int:
+        """Descarta las entradas cuyo rango incluye `fecha` (todas si fecha es None)."""
+        with self._lock:
+            if fecha is None:
+                claves = list(self._entradas)
+            else:
+                claves = [
+                    clave for clave, (_, desde, hasta) in self._entradas.items()
+                    if (desde is None or desde <= fecha) and (hasta is None or fecha <= hasta)
+                ]
+            for clave in claves:
+                del self._entradas[clave]
+            self.invalidadas += len(claves)
+            return len(claves)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "capacidad": self.capacidad,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "invalidadas": self.invalidadas,
+            }
+
+
+# =========================
+# ROLLUPS DIARIOS
+# =========================
+# Un rollup parcial por .col (HISTORIAL_COLUMNAR/_rollups/fecha=X/region=Y/
+# ARCHIVO.json), calculado una vez cuando main.py escribe ese reporte: cargar
+# N reportes del día lee N archivos, no N veces la partición. El rollup de
+# (fecha, region) combina los parciales y queda en el LRU de rollups.
+def _firma_archivo(ruta: Path) -> list:
+    st = ruta.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _acumular(segmentos: dict, segmento: str, campo: str, valor: float) -> None:
+    campos = segmentos.setdefault(segmento, {})
+    acumulado = campos.get(campo)
+    if acumulado is None:
+        campos[campo] = [valor, valor, valor, 1]
+    else:
+        acumulado[0] += valor
+        acumulado[1] = min(acumulado[1], valor)
+        acumulado[2] = max(acumulado[2], valor)
+        acumulado[3] += 1
+
+
+def combinar_rollups(destino: dict, segmentos: dict) -> dict:
+    """Suma a `destino` un rollup {segmento: {campo: [suma, mínimo, máximo, cuenta]}}."""
+    for segmento, campos in segmentos.items():
+        campos_destino = destino.setdefault(segmento, {})
+        for campo, (suma, minimo, maximo, cuenta) in campos.items():
+            acumulado = campos_destino.get(campo)
+            if acumulado is None:
+                campos_destino[campo] = [suma, minimo, maximo, cuenta]
+            else:
+                acumulado[0] += suma
+                acumulado[1] = min(acumulado[1], minimo)
+                acumulado[2] = max(acumulado[2], maximo)
+                acumulado[3] += cuenta
+    return destino
+
+
+def calcular_rollup(ruta: Path, fecha: str, region: str) -> dict:
+    """{segmento: {campo: [suma, mínimo, máximo, cuenta]}} de los valores numéricos de un .col."""
+    datos = ParticionColumnar(ruta, fecha, region).leer(("segmento", "campo", "valor_num"))
+    dic_segmentos, idx_segmentos = datos["segmento"]
+    dic_campos, idx_campos = datos["campo"]
+    bases = [titulo_base(s) for s in dic_segmentos]
+    segmentos: dict[str, dict[str, list]] = {}
+    for i_segmento, i_campo, valor in zip(idx_segmentos, idx_campos, datos["valor_num"]):
+        if not math.isnan(valor):
+            _acumular(segmentos, bases[i_segmento], dic_campos[i_campo], valor)
+    return segmentos
+
+
+def ruta_rollup(almacen: AlmacenColumnar, fecha: str, region: str, nombreArchivo: str) -> Path:
+    return almacen.raiz / DIRECTORIO_ROLLUPS / f"fecha={fecha}" / f"region={region}" / f"{nombreArchivo}.json"
+
+
+def _guardar_rollup(ruta: Path, firma: list, segmentos: dict) -> None:
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    # temporal por hilo: dos escritores del mismo reporte no se pisan
+    temporal = ruta.with_name(f"{ruta.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    temporal.write_text(json.dumps({"firma": firma, "segmentos": segmentos}, ensure_ascii=False), encoding="utf-8")
+    os.replace(temporal, ruta)
+
+
+def precalcular_rollup(almacen: AlmacenColumnar, fecha: str, region: str, nombreArchivo: str) -> dict:
+    """Rollup parcial de un reporte recién agregado al histórico (lo llama main.py)."""
+    ruta = almacen.ruta_particion(fecha, region, nombreArchivo)
+    # la firma se toma antes de leer: si el .col cambia en el medio, la consulta lo recalcula
+    firma = _firma_archivo(ruta)
+    segmentos = calcular_rollup(ruta, fecha, region)
+    _guardar_rollup(ruta_rollup(almacen, fecha, region, nombreArchivo), firma, segmentos)
+    return segmentos
+
+
+def leer_rollup(almacen: AlmacenColumnar, fecha: str, region: str) -> dict:
+    """
+    Rollup de (fecha, region): combina los parciales de sus .col y
+    recalcula solo los que faltan o no coinciden con su .col.
+    """
+    directorio = almacen.raiz / f"fecha={fecha}" / f"region={region}"
+    total: dict[str, dict[str, list]] = {}
+    rutas = sorted(directorio.glob(f"*{EXTENSION}")) if directorio.exists() else []
+    for ruta in rutas:
+        nombreArchivo = ruta.name[:-len(EXTENSION)]
+        parcial = ruta_rollup(almacen, fecha, region, nombreArchivo)
+        segmentos = None
+        try:
+            guardado = json.loads(parcial.read_text(encoding="utf-8"))
+            if guardado["firma"] == _firma_archivo(ruta):
+                segmentos = guardado["segmentos"]
+        except (OSError, ValueError, KeyError):
+            pass
+        if segmentos is None:
+            segmentos = precalcular_rollup(almacen, fecha, region, nombreArchivo)
+        combinar_rollups(total, segmentos)
+    return total
+
+
+# =========================
+# API DE CONSULTAS
+# =========================
+class ConsultasEstadisticas:
+    """
+    Consultas de tablero sobre el histórico columnar, respondidas desde
+    rollups diarios y un LRU de resultados. Segura entre hilos.
+    """
+
+    def __init__(self, almacen: AlmacenColumnar, capacidad_cache: int = CAPACIDAD_CACHE,
+                 capacidad_rollups: int = CAPACIDAD_ROLLUPS):
+        self.almacen = almacen
+        self.resultados = CacheLRU(capacidad_cache)
+        self.rollups = CacheLRU(capacidad_rollups)
+        self._lock = threading.Lock()
+        # se ignora lo ya registrado: las cachés arrancan vacías
+        self._posicion, _ = almacen.cargas_desde(0)
+        self._posicion = max(self._posicion, 0)
+        self._vacio_verificado = False
+
+    # -------------------------
+    # invalidación
+    # -------------------------
+    def sincronizar(self) -> list[tuple[str, str, str]]:
+        """Aplica las cargas registradas desde la última consulta; devuelve las nuevas."""
+        with self._lock:
+            posicion, cargas = self.almacen.cargas_desde(self._posicion)
+            if posicion < 0:
+                # registro borrado o rotado: no se sabe qué cambió
+                self.invalidar()
+                self._posicion, cargas = max(self.almacen.cargas_desde(0)[0], 0), []
+                return cargas
+            self._posicion = posicion
+        self._verificar_datos()
+        for fecha, region, _ in cargas:
+            self.rollups.invalidar(fecha)
+            self.resultados.invalidar(fecha)
+        return cargas
+
+    def _verificar_datos(self) -> None:
+        # un histórico vacío suele ser una carga con --destino bd: se avisa
+        # (una vez) en lugar de devolver resultados vacíos en silencio
+        if self._vacio_verificado:
+            return
+        self._vacio_verificado = True
+        if self._posicion > 0 or self.almacen.fechas():
+            return
+        log.warning(
+            "El histórico columnar %s está vacío: las consultas no tendrán resultados. "
+            "Se llena cargando con main.py --destino columnar o --destino ambos.",
+            self.almacen.raiz,
+        )
+
+    def invalidar(self, fecha: str | None = None) -> None:
+        self.rollups.invalidar(fecha)
+        self.resultados.invalidar(fecha)
+
+    # -------------------------
+    # lectura
+    # -------------------------
+    def particiones(self, fecha_desde: str | None = None, fecha_hasta: str | None = None,
+                    regiones: Iterable[str] | None = None) -> list[tuple[str, str]]:
+        # (fecha, region) por nombre de directorio, sin abrir los .col
+        regiones = set(regiones) if regiones is not None else None
+        pares = []
+        if not self.almacen.raiz.exists():
+            return pares
+        for dir_fecha in sorted(self.almacen.raiz.glob("fecha=*")):
+            fecha = dir_fecha.name.split("=", 1)[1]
+            if (fecha_desde and fecha < fecha_desde) or (fecha_hasta and fecha > fecha_hasta):
+                continue
+            for dir_region in sorted(dir_fecha.glob("region=*")):
+                region = dir_region.name.split("=", 1)[1]
+                if regiones is None or region in regiones:
+                    pares.append((fecha, region))
+        return pares
+
+    def rollup(self, fecha: str, region: str) -> dict:
+        """{segmento: {campo: [suma, mínimo, máximo, cuenta]}} de una fecha y región."""
+        clave = (fecha, region)
+        segmentos = self.rollups.obtener(clave)
+        if segmentos is None:
+            segmentos = leer_rollup(self.almacen, fecha, region)
+            self.rollups.poner(clave, segmentos, fecha, fecha)
+        return segmentos
+
+    def obtener_metrica(self, segmento: str, campo: str, regiones: Iterable[str] | None = None,
+                        fecha_desde: str | None = None, fecha_hasta: str | None = None,
+                        agregado: str = AGREGADO_SUMA) -> list[tuple[str, str, float]]:
+        """
+        [(fecha, region, valor)] de un campo numérico de un segmento, en
+        orden de fecha y región. El segmento se da sin sufijo: "Dispatcher"
+        agrega "Dispatcher (2)", "Dispatcher (3)", ... según `agregado`.
+        """
+        validar_agregado(agregado)
+        self.sincronizar()
+        regiones = tuple(sorted(regiones)) if regiones is not None else None
+        clave = ("metrica", segmento, campo, regiones, fecha_desde, fecha_hasta, agregado)
+        resultado = self.resultados.obtener(clave)
+        if resultado is not None:
+            return resultado
+
+        resultado = []
+        for fecha, region in self.particiones(fecha_desde, fecha_hasta, regiones):
+            acumulado = self.rollup(fecha, region).get(segmento, {}).get(campo)
+            if acumulado is not None:
+                resultado.append((fecha, region, valor_agregado(acumulado, agregado)))
+        self.resultados.poner(clave, resultado, fecha_desde, fecha_hasta)
+        return resultado
+
+    def top_n(self, campo: str, fecha: str, n: int = 10, segmento: str | None = None,
+              regiones: Iterable[str] | None = None, agregado: str = AGREGADO_SUMA) -> list[tuple[str, str, float]]:
+        """[(region, segmento, valor)] con los n valores más altos de un campo en una fecha."""
+        validar_agregado(agregado)
+        self.sincronizar()
+        regiones = tuple(sorted(regiones)) if regiones is not None else None
+        clave = ("top", campo, fecha, n, segmento, regiones, agregado)
+        resultado = self.resultados.obtener(clave)
+        if resultado is not None:
+            return resultado
+
+        candidatos = []
+        for _, region in self.particiones(fecha, fecha, regiones):
+            for nombre, campos in self.rollup(fecha, region).items():
+                if segmento is not None and nombre != segmento:
+                    continue
+                acumulado = campos.get(campo)
+                if acumulado is not None:
+                    candidatos.append((region, nombre, valor_agregado(acumulado, agregado)))
+        resultado = sorted(candidatos, key=lambda c: c[2], reverse=True)[:max(0, n)]
+        self.resultados.poner(clave, resultado, fecha, fecha)
+        return resultado
+
+    def estadisticas(self) -> dict:
+        return {"resultados": self.resultados.estadisticas(), "rollups": self.rollups.estadisticas()}
+
+
+def leer_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Consultas sobre el histórico columnar de estadísticas CICS.")
+    parser.add_argument("--historial", type=Path, default=Path(__file__).parent / "HISTORIAL_COLUMNAR")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    metrica = sub.add_parser("metrica", help="serie de un campo por fecha y región")
+    metrica.add_argument("segmento")
+    metrica.add_argument("campo")
+    metrica.add_argument("--region", action="append", dest="regiones")
+    metrica.add_argument("--desde")
+    metrica.add_argument("--hasta")
+    metrica.add_argument("--agregado", choices=AGREGADOS, default=AGREGADO_SUMA)
+
+    top = sub.add_parser("top", help="mayores valores de un campo en una fecha")
+    top.add_argument("campo")
+    top.add_argument("fecha")
+    top.add_argument("-n", type=int, default=10)
+    top.add_argument("--segmento")
+    top.add_argument("--agregado", choices=AGREGADOS, default=AGREGADO_SUMA)
+
+    sub.add_parser("precalcular", help="calcular los rollups diarios que falten o estén desactualizados")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = leer_argumentos(argv)
+    consultas = ConsultasEstadisticas(AlmacenColumnar(args.historial))
+
+    if args.comando == "precalcular":
+        pares = consultas.particiones()
+        for fecha, region in pares:
+            leer_rollup(consultas.almacen, fecha, region)
+        print(f"✔ Rollups al día para {len(pares)} particiones (fecha, región)")
+        return
+
+    if args.comando == "metrica":
+        for fecha, region, valor in consultas.obtener_metrica(
+            args.segmento, args.campo, args.regiones, args.desde, args.hasta, args.agregado
+        ):
+            print(f"{fecha}\t{region}\t{valor:g}")
+        return
+
+    for region, segmento, valor in consultas.top_n(args.campo, args.fecha, args.n, args.segmento, agregado=args.agregado):
+        print(f"{region}\t{segmento}\t{valor:g}")
+
+
+if __name__ == "__main__":
+    main()
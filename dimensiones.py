@@ -0,0 +1,122 @@
+import threading
+from conexionBD import *
+from esquema import asegurar_esquema
+
+
+# SQL Server admite 2100 parámetros por sentencia
+MAX_PARAMETROS_SENTENCIA = 1000
+
+
+class CacheDimension:
+    """
+    Caché en memoria (nombre -> id) de una tabla de dimensión.
+
+    Se calienta con un único SELECT la primera vez que se usa; después
+    las búsquedas no tocan la base de datos y los nombres que faltan se
+    insertan en bloque con una sola sentencia por lote.
+    """
+
+    def __init__(self, tabla, columna):
+        self.tabla = tabla
+        self.columna = columna
+        self._ids = {}
+        self._cargada = False
+        self._lock = threading.RLock()
+
+    def calentar(self):
+        with self._lock:
+            # las tablas las crean las migraciones (una verificación por proceso)
+            asegurar_esquema()
+            with conexion() as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"SELECT {self.columna}, id FROM {self.tabla}")
+                ids = {}
+                for nombre, id_ in cursor.fetchall():
+                    ids.setdefault(nombre, id_)
+
+            self._ids = ids
+            self._cargada = True
+
+    def _asegurar_cargada(self):
+        if not self._cargada:
+            self.calentar()
+
+    def id(self, nombre):
+        with self._lock:
+            self._asegurar_cargada()
+            return self._ids.get(nombre)
+
+    def ids(self):
+        with self._lock:
+            self._asegurar_cargada()
+            return dict(self._ids)
+
+    def __contains__(self, nombre):
+        return self.id(nombre) is not None
+
+    def __len__(self):
+        with self._lock:
+            self._asegurar_cargada()
+            return len(self._ids)
+
+    def asegurar(self, nombres):
+        """
+        Registra los nombres que todavía no existen y devuelve la lista de
+        los que se insertaron. Los existentes se resuelven desde memoria.
+        """
+        with self._lock:
+            self._asegurar_cargada()
+            faltantes = [n for n in dict.fromkeys(nombres) if n not in self._ids]
+            if not faltantes:
+                return []
+
+            resueltos = {}
+            insertados = []
+            with conexion() as conn:
+                cursor = conn.cursor()
+                for i in range(0, len(faltantes), MAX_PARAMETROS_SENTENCIA):
+                    lote = faltantes[i:i + MAX_PARAMETROS_SENTENCIA]
+                    valores = ", ".join(["(?)"] * len(lote))
+
+                    # anti-join: no duplica nombres que otro proceso haya insertado
+                    cursor.execute(f"""
+                        INSERT INTO {self.tabla} ({self.columna})
+                        OUTPUT inserted.{self.columna}, inserted.id
+                        SELECT v.nombre FROM (VALUES {valores}) AS v(nombre)
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM {self.tabla} t WHERE t.{self.columna} = v.nombre
+                        );
+                    """, lote)
+                    for nombre, id_ in cursor.fetchall():
+                        resueltos.setdefault(nombre, id_)
+                        insertados.append(nombre)
+
+                    # los que ya existían en la tabla se resuelven con un SELECT
+                    pendientes = [n for n in lote if n not in resueltos]
+                    if pendientes:
+                        marcadores = ", ".join(["?"] * len(pendientes))
+                        cursor.execute(
+                            f"SELECT {self.columna}, id FROM {self.tabla} WHERE {self.columna} IN ({marcadores})",
+                            pendientes,
+                        )
+                        for nombre, id_ in cursor.fetchall():
+                            resueltos.setdefault(nombre, id_)
+
+                conn.commit()
+
+            # solo se cachea lo que quedó confirmado
+            for nombre, id_ in resueltos.items():
+                self._ids.setdefault(nombre, id_)
+
+            return insertados
+
+    def invalidar(self):
+        with self._lock:
+            self._ids = {}
+            self._cargada = False
+
+
+# cachés del proceso: se comparten entre todos los reportes de una corrida
+cache_archivos = CacheDimension("archivos", "archivo")
+cache_segmentos = CacheDimension("segmento", "segmento")
+cache_campos = CacheDimension("campo", "campo")
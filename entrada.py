@@ -0,0 +1,314 @@
+import bz2
+import codecs
+import gzip
+import io
+import locale
+import lzma
+import os
+from pathlib import Path
+from typing import BinaryIO, Iterator, NamedTuple
+
+try:
+    import zstandard
+except ImportError:  # opcional: solo hace falta para reportes .zst
+    zstandard = None
+
+
+# =========================
+# ENTRADA DE REPORTES
+# =========================
+# Los reportes pueden llegar:
+#   - comprimidos (.gz, .bz2, .xz, .zst): se descomprimen en streaming,
+#     sin copia temporal; el tipo se detecta por los bytes mágicos.
+#   - en EBCDIC (cp037/cp1047) transferidos en binario, con saltos de línea
+#     (NL 0x15 / LF 0x25) o como registros fijos RECFM=FB/FBA (sin saltos,
+#     LRECL bytes por registro) o variables RECFM=VB/VBA (RDW de 4 bytes).
+#     En FBA/VBA la primera columna es el carácter de control ASA, que el
+#     parser ya espera ("1" página, "+" banda, "0" fin de segmento).
+#
+# detectar_formato() mira solo los primeros bytes; iterar_lineas_reporte()
+# produce las mismas líneas que daría el reporte ya convertido a texto.
+
+COMPRESION_GZIP = "gz"
+COMPRESION_BZIP2 = "bz2"
+COMPRESION_XZ = "xz"
+COMPRESION_ZSTD = "zst"
+
+_MAGIAS = (
+    (b"\x1f\x8b", COMPRESION_GZIP),
+    (b"BZh", COMPRESION_BZIP2),
+    (b"\xfd7zXZ\x00", COMPRESION_XZ),
+    (b"\x28\xb5\x2f\xfd", COMPRESION_ZSTD),
+)
+EXTENSIONES_COMPRESION = {"." + c: c for _, c in _MAGIAS}
+
+REGISTRO_TEXTO = "texto"
+REGISTRO_FIJO = "fb"
+REGISTRO_VARIABLE = "vb"
+
+# cp037 y cp1047 solo difieren en unos pocos signos ([, ], ^, ¬...)
+CODIFICACION_EBCDIC = os.environ.get("CICS_CODIFICACION_EBCDIC", "cp037")
+CODIFICACIONES_EBCDIC = ("cp037", "cp1047", "cp500", "cp1140")
+
+# DFHSTUP escribe registros FBA de 133 bytes (132 de impresión + ASA)
+LRECL_CANDIDATOS = (133, 121, 132, 81, 80)
+LRECL_DEFECTO = 133
+
+TAMANO_MUESTRA = 16 * 1024
+
+# bytes EBCDIC
+_EBCDIC_SALTOS = (0x15, 0x25)  # NL, LF
+# controles ASA en EBCDIC: " ", "0", "-", "+", "1"
+_ASA_EBCDIC = frozenset(b"\x40\xf0\x60\x4e\xf1")
+
+
+class FormatoEntrada(NamedTuple):
+    compresion: str | None = None
+    codificacion: str | None = None  # None = la de open() (locale)
+    registro: str = REGISTRO_TEXTO
+    lrecl: int | None = None
+
+    @property
+    def plano(self) -> bool:
+        """Texto sin comprimir en la codificación local: los bytes del archivo son las líneas."""
+        return self.compresion is None and self.codificacion is None and self.registro == REGISTRO_TEXTO
+
+
+FORMATO_PLANO = FormatoEntrada()
+
+
+def _compresion_por_magia(cabecera: bytes) -> str | None:
+    for magia, compresion in _MAGIAS:
+        if cabecera.startswith(magia):
+            return compresion
+    return None
+
+
+def abrir_binario(ruta: Path, compresion: str | None = None) -> BinaryIO:
+    """Stream binario del reporte, descomprimido al vuelo si corresponde."""
+    if compresion is None:
+        return open(ruta, "rb")
+    if compresion == COMPRESION_GZIP:
+        return gzip.open(ruta, "rb")
+    if compresion == COMPRESION_BZIP2:
+        return bz2.open(ruta, "rb")
+    if compresion == COMPRESION_XZ:
+        return lzma.open(ruta, "rb")
+    if compresion == COMPRESION_ZSTD:
+        if zstandard is None:
+            raise ImportError(f"zstandard no está instalado: no es posible leer {Path(ruta).name}")
+        crudo = open(ruta, "rb")
+        return zstandard.ZstdDecompressor().stream_reader(crudo, closefd=True)
+    raise ValueError(f"Compresión desconocida: {compresion}")
+
+
+_BYTES_TEXTO_ASCII = frozenset(range(0x20, 0x7F)) | frozenset(b"\t\n\r\x0b\x0c")
+_SALTOS_DECODIFICADOS = frozenset("\n\r\x0b\x0c\x85")
+
+
+def _parece_ebcdic(muestra: bytes) -> bool:
+    # se compara qué proporción de la muestra es texto legible leída como
+    # ASCII y como EBCDIC: en EBCDIC las letras y dígitos son bytes >= 0x81
+    # y los saltos 0x15/0x25; en ASCII el espacio 0x20 y el salto 0x0A son
+    # controles de EBCDIC
+    if not muestra:
+        return False
+    ascii_legible = sum(1 for b in muestra if b in _BYTES_TEXTO_ASCII) / len(muestra)
+    texto = muestra.decode(CODIFICACION_EBCDIC, "ignore")
+    ebcdic_legible = sum(1 for c in texto if c.isprintable() or c in _SALTOS_DECODIFICADOS) / len(muestra)
+    return ebcdic_legible > ascii_legible
+
+
+def _registros_variables(muestra: bytes) -> bool:
+    # RECFM=V: cada registro empieza con RDW = largo (2 bytes big-endian, incluye el RDW) + 0x0000
+    pos = 0
+    vistos = 0
+    while pos + 4 <= len(muestra):
+        largo = int.from_bytes(muestra[pos:pos + 2], "big")
+        if muestra[pos + 2:pos + 4] != b"\x00\x00" or not 4 <= largo <= 32760:
+            return False
+        pos += largo
+        vistos += 1
+    return vistos >= 2
+
+
+def _lrecl_probable(muestra: bytes, asa: frozenset) -> int:
+    # el LRECL cuyo primer byte de cada registro es siempre un control ASA;
+    # con líneas rellenas de blancos varios largos cumplen, así que gana el
+    # que ve más controles distintos de blanco ("1", "0", "-", "+")
+    mejor, mejor_puntaje = LRECL_DEFECTO, -1.0
+    for lrecl in LRECL_CANDIDATOS:
+        registros = len(muestra) // lrecl
+        if registros < 2:
+            continue
+        controles = [muestra[i] for i in range(0, registros * lrecl, lrecl)]
+        if not all(c in asa for c in controles):
+            continue
+        puntaje = sum(1 for c in controles if c != 0x40) / registros
+        if puntaje > mejor_puntaje:
+            mejor, mejor_puntaje = lrecl, puntaje
+    return mejor
+
+
+def detectar_formato(ruta: Path, codificacion: str | None = None, lrecl: int | None = None) -> FormatoEntrada:
+    """
+    Compresión, codificación y formato de registro del reporte, a partir
+    de los primeros bytes. codificacion/lrecl fuerzan esos valores (p. ej.
+    cp1047, o un LRECL que no está en LRECL_CANDIDATOS).
+    """
+    ruta = Path(ruta)
+    # manda la magia, no la extensión: un .gz sin comprimir se lee como texto
+    with open(ruta, "rb") as f:
+        compresion = _compresion_por_magia(f.read(8))
+
+    with abrir_binario(ruta, compresion) as f:
+        muestra = f.read(TAMANO_MUESTRA)
+
+    if codificacion is None and _parece_ebcdic(muestra):
+        codificacion = CODIFICACION_EBCDIC
+    if codificacion is not None and codecs.lookup(codificacion).name == codecs.lookup(_codificacion_local()).name:
+        codificacion = None
+
+    ebcdic = codificacion is not None and codecs.lookup(codificacion).name in CODIFICACIONES_EBCDIC
+    saltos = ebcdic and any(b in muestra for b in _EBCDIC_SALTOS)
+
+    # registros sin saltos solo se deducen en EBCDIC (transferencia binaria);
+    # un texto local sin saltos sigue siendo una sola línea, como antes
+    if lrecl is not None:
+        registro = REGISTRO_FIJO
+    elif not ebcdic or not muestra:
+        registro = REGISTRO_TEXTO
+    elif _registros_variables(muestra):
+        # antes que los saltos: un largo de RDW puede valer 0x15 o 0x25
+        registro = REGISTRO_VARIABLE
+    elif saltos:
+        registro = REGISTRO_TEXTO
+    else:
+        registro = REGISTRO_FIJO
+        lrecl = _lrecl_probable(muestra, _ASA_EBCDIC)
+
+    return FormatoEntrada(compresion, codificacion, registro, lrecl)
+
+
+def _codificacion_local() -> str:
+    # la misma que usa open() sin encoding
+    return locale.getpreferredencoding(False)
+
+
+# =========================
+# LÍNEAS
+# =========================
+# caracteres que str.splitlines() considera fin de línea
+FINES_DE_LINEA = frozenset("\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029")
+
+
+def lineas_de_texto(f, tamano_bloque: int) -> Iterator[str]:
+    """
+    Líneas de un stream de texto leído por bloques (mismo corte que
+    splitlines()). Al agotarse devuelve la cantidad de líneas entregadas.
+    """
+    pendiente = ""
+    entregadas = 0
+    while True:
+        bloque = f.read(tamano_bloque)
+        if not bloque:
+            break
+        texto = pendiente + bloque
+        lineas = texto.splitlines()
+        # la última línea puede continuar en el siguiente bloque
+        pendiente = lineas.pop() if texto[-1] not in FINES_DE_LINEA else ""
+        entregadas += len(lineas)
+        yield from lineas
+    if pendiente:
+        entregadas += 1
+        yield pendiente
+    return entregadas
+
+
+def _lineas_fijas(f: BinaryIO, lrecl: int, codificacion: str | None, tamano_bloque: int) -> Iterator[str]:
+    # se lee un múltiplo de LRECL y se decodifica de una vez; en las
+    # codificaciones de un byte cada registro son lrecl caracteres
+    tamano_bloque = max(lrecl, tamano_bloque - tamano_bloque % lrecl)
+    codificacion = codificacion or _codificacion_local()
+    un_byte = codecs.lookup(codificacion).name in CODIFICACIONES_EBCDIC or codificacion in ("latin-1", "iso8859-1", "ascii")
+    resto = b""
+    entregadas = 0
+    while True:
+        bloque = f.read(tamano_bloque)
+        if not bloque:
+            break
+        bloque = resto + bloque
+        completos = len(bloque) - len(bloque) % lrecl
+        resto = bloque[completos:]
+        if un_byte:
+            texto = bloque[:completos].decode(codificacion, "ignore")
+            lineas = [texto[i:i + lrecl].rstrip(" ") for i in range(0, len(texto), lrecl)]
+        else:
+            lineas = [bloque[i:i + lrecl].decode(codificacion, "ignore").rstrip(" ") for i in range(0, completos, lrecl)]
+        entregadas += len(lineas)
+        yield from lineas
+    if resto:
+        entregadas += 1
+        yield resto.decode(codificacion, "ignore").rstrip(" ")
+    return entregadas
+
+
+def _leer_exacto(f: BinaryIO, n: int) -> bytes:
+    # los streams de descompresión pueden devolver lecturas cortas
+    partes = []
+    while n > 0:
+        parte = f.read(n)
+        if not parte:
+            break
+        partes.append(parte)
+        n -= len(parte)
+    return b"".join(partes)
+
+
+def _lineas_variables(f: BinaryIO, codificacion: str | None) -> Iterator[str]:
+    codificacion = codificacion or _codificacion_local()
+    entregadas = 0
+    while True:
+        rdw = _leer_exacto(f, 4)
+        if len(rdw) < 4:
+            break
+        largo = int.from_bytes(rdw[:2], "big")
+        entregadas += 1
+        yield _leer_exacto(f, largo - 4).decode(codificacion, "ignore").rstrip(" ")
+    return entregadas
+
+
+def iterar_lineas_reporte(ruta: Path, formato: FormatoEntrada, tamano_bloque: int) -> Iterator[str]:
+    """
+    Líneas del reporte en cualquier formato soportado, en streaming. Al
+    agotarse devuelve la cantidad de líneas entregadas.
+    """
+    if formato.plano:
+        with open(ruta, errors="ignore") as f:
+            return (yield from lineas_de_texto(f, tamano_bloque))
+
+    with abrir_binario(ruta, formato.compresion) as crudo:
+        if formato.registro == REGISTRO_FIJO:
+            return (yield from _lineas_fijas(crudo, formato.lrecl or LRECL_DEFECTO, formato.codificacion, tamano_bloque))
+        if formato.registro == REGISTRO_VARIABLE:
+            return (yield from _lineas_variables(crudo, formato.codificacion))
+        # newline=None: mismos saltos universales que open() en texto plano
+        with io.TextIOWrapper(crudo, encoding=formato.codificacion, errors="ignore") as f:
+            return (yield from lineas_de_texto(f, tamano_bloque))
+
+
+def nombre_base_reporte(nombre: str) -> str:
+    """'CICSADM.TXT.GZ' -> 'CICSADM' (sin compresión ni .TXT)."""
+    base, extension = os.path.splitext(nombre)
+    if extension.lower() in EXTENSIONES_COMPRESION:
+        nombre = base
+    base, extension = os.path.splitext(nombre)
+    return base if extension.upper() == ".TXT" else nombre
+
+
+def es_nombre_reporte(nombre: str) -> bool:
+    """Reportes .TXT, también comprimidos (.TXT.GZ, .TXT.ZST...)."""
+    base, extension = os.path.splitext(nombre)
+    if extension.lower() in EXTENSIONES_COMPRESION:
+        base, extension = os.path.splitext(base)
+    return extension.upper() == ".TXT"
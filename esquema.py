@@ -0,0 +1,362 @@
+import threading
+from typing import NamedTuple
+from conexionBD import *
+
+
+# =========================
+# ESQUEMA Y MIGRACIONES
+# =========================
+# El esquema de la BD se versiona en la tabla esquema_version. Cada
+# migración se aplica una sola vez, en orden, dentro de su propia
+# transacción y bajo un applock de SQL Server: dos procesos que arrancan a
+# la vez no aplican la misma migración dos veces.
+#
+# Los helpers de inserción ya no re-ejecutan "IF NOT EXISTS CREATE TABLE"
+# en cada llamada: llaman a asegurar_esquema(), que consulta la versión una
+# vez por proceso.
+#
+# Para cambiar el esquema se agrega una Migracion al final de MIGRACIONES
+# (nunca se edita una ya publicada).
+
+
+class Migracion(NamedTuple):
+    version: int
+    descripcion: str
+    sentencias: tuple[str, ...]  # cada una se envía como un batch aparte
+    # (consulta escalar, mensaje con {}) que se informa al aplicarla: para
+    # las migraciones que modifican datos y no solo el esquema
+    aviso: tuple[str, str] | None = None
+
+
+DDL_ESQUEMA_VERSION = """
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='esquema_version' AND xtype='U')
+CREATE TABLE esquema_version
+(
+    version INT NOT NULL PRIMARY KEY,
+    descripcion NVARCHAR(255) NOT NULL,
+    aplicada DATETIME2(0) NOT NULL DEFAULT SYSUTCDATETIME()
+);
+"""
+
+# serializa migraciones entre procesos (se libera con el commit/rollback)
+APPLOCK_ESQUEMA = "cics_esquema"
+SQL_APPLOCK = """
+DECLARE @resultado INT;
+EXEC @resultado = sp_getapplock @Resource = ?, @LockMode = 'Exclusive',
+                                @LockOwner = 'Transaction', @LockTimeout = 60000;
+IF @resultado < 0
+    THROW 50001, 'No se obtuvo el lock de migraciones del esquema', 1;
+"""
+
+
+MIGRACIONES = (
+    # v1: las tablas que antes se creaban en cada inserción. Idempotente
+    # para que una BD existente quede como versión 1 sin cambios.
+    Migracion(1, "tablas base: archivos, segmento, validacion_sistema", (
+        """
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='archivos' AND xtype='U')
+        CREATE TABLE archivos
+        (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            archivo NVARCHAR(255)
+        );
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='segmento' AND xtype='U')
+        CREATE TABLE segmento
+        (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            segmento NVARCHAR(255)
+        );
+        """,
+        """
+        IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='validacion_sistema' AND xtype='U')
+        CREATE TABLE validacion_sistema
+        (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            archivo INT,
+            segmento INT,
+            campo NVARCHAR(255),
+            valor NVARCHAR(MAX),
+            fecha DATE
+        );
+        """,
+        """
+        IF COL_LENGTH('validacion_sistema', 'valor_num') IS NULL
+        ALTER TABLE validacion_sistema ADD
+            valor_num FLOAT NULL,
+            valor_fecha DATETIME2(3) NULL,
+            tipo_valor VARCHAR(12) NULL;
+        """,
+    )),
+
+    # v2: nombres de campo internados en una dimensión; validacion_sistema
+    # guarda el id (INT) igual que archivo y segmento.
+    Migracion(2, "dimensión campo: validacion_sistema.campo pasa a id", (
+        """
+        CREATE TABLE campo
+        (
+            id INT IDENTITY(1,1) PRIMARY KEY,
+            campo NVARCHAR(255) NOT NULL,
+            CONSTRAINT UQ_campo_campo UNIQUE (campo)
+        );
+        """,
+        "ALTER TABLE validacion_sistema ADD campo_id INT NULL;",
+        """
+        INSERT INTO campo (campo)
+        SELECT DISTINCT v.campo FROM validacion_sistema v
+        WHERE v.campo IS NOT NULL;
+        """,
+        """
+        UPDATE v SET campo_id = c.id
+        FROM validacion_sistema v
+        JOIN campo c ON c.campo = v.campo;
+        """,
+        """
+        IF EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_validacion_sistema_campo_num'
+                   AND object_id = OBJECT_ID('validacion_sistema'))
+        DROP INDEX IX_validacion_sistema_campo_num ON validacion_sistema;
+        """,
+        "ALTER TABLE validacion_sistema DROP COLUMN campo;",
+        "EXEC sp_rename 'validacion_sistema.campo_id', 'campo', 'COLUMN';",
+    )),
+
+    # v3: clave agrupada por (fecha, archivo, segmento, campo). Es el orden
+    # de las consultas por día y de la deduplicación de la carga; el id
+    # queda como clave primaria no agrupada.
+    #
+    # NO es solo de esquema: las filas duplicadas de cargas repetidas
+    # impiden crear el índice único, así que se conserva la primera (menor
+    # id) y las demás se mueven a validacion_sistema_duplicados antes de
+    # borrarlas. La cantidad movida se informa al aplicar la migración.
+    Migracion(3, "clave agrupada (fecha, archivo, segmento, campo)", (
+        """
+        WITH repetidas AS (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY fecha, archivo, segmento, campo ORDER BY id) AS n
+            FROM validacion_sistema
+        )
+        SELECT CONVERT(INT, id) AS id, archivo, segmento, campo, valor, valor_num, valor_fecha,
+               tipo_valor, fecha, SYSUTCDATETIME() AS respaldada
+        INTO validacion_sistema_duplicados
+        FROM repetidas WHERE n > 1;
+        """,
+        """
+        DELETE v FROM validacion_sistema v
+        WHERE v.id IN (SELECT d.id FROM validacion_sistema_duplicados d);
+        """,
+        """
+        DECLARE @pk SYSNAME = (
+            SELECT name FROM sys.key_constraints
+            WHERE type = 'PK' AND parent_object_id = OBJECT_ID('validacion_sistema')
+        );
+        IF @pk IS NOT NULL
+            EXEC('ALTER TABLE validacion_sistema DROP CONSTRAINT ' + QUOTENAME(@pk));
+        """,
+        "ALTER TABLE validacion_sistema ADD CONSTRAINT PK_validacion_sistema_id PRIMARY KEY NONCLUSTERED (id);",
+        """
+        CREATE UNIQUE CLUSTERED INDEX CX_validacion_sistema
+            ON validacion_sistema (fecha, archivo, segmento, campo);
+        """,
+        # el agrupado empieza por fecha: el índice solo por fecha sobra
+        """
+        IF EXISTS (SELECT * FROM sys.indexes WHERE name = 'IX_validacion_sistema_fecha'
+                   AND object_id = OBJECT_ID('validacion_sistema'))
+        DROP INDEX IX_validacion_sistema_fecha ON validacion_sistema;
+        """,
+        # rangos y agregados de métricas numéricas por campo
+        """
+        CREATE INDEX IX_validacion_sistema_campo_num
+            ON validacion_sistema (campo, fecha) INCLUDE (valor_num, segmento, archivo);
+        """,
+    ), aviso=(
+        "SELECT COUNT(*) FROM validacion_sistema_duplicados",
+        "{} filas duplicadas de validacion_sistema movidas a validacion_sistema_duplicados",
+    )),
+
+    # v4: tabla de staging de la carga masiva. Cada carga usa su propio lote
+    # (uuid4) y pasa a validacion_sistema con un solo INSERT ... SELECT
+    # con anti-join sobre la clave agrupada (ver insertarValidacionSistemaMasivo).
+    Migracion(4, "staging validacion_sistema_carga", (
+        """
+        CREATE TABLE validacion_sistema_carga
+        (
+            lote CHAR(36) NOT NULL,  -- uuid4 en texto (fast_executemany no convierte GUID)
+            archivo INT NOT NULL,
+            segmento INT NOT NULL,
+            campo INT NOT NULL,
+            valor NVARCHAR(MAX),
+            valor_num FLOAT NULL,
+            valor_fecha DATETIME2(3) NULL,
+            tipo_valor VARCHAR(12) NULL,
+            fecha DATE NOT NULL
+        );
+        """,
+        "CREATE CLUSTERED INDEX CX_validacion_sistema_carga ON validacion_sistema_carga (lote);",
+    )),
+
+    # v5: carga por cambios (CDC, ver cambios.py). Solo se guardan los
+    # valores nuevos o modificados respecto del snapshot anterior, más
+    # lápidas (eliminado = 1) para los campos que desaparecen. El orden de
+    # la clave agrupada deja juntas las versiones de cada campo: el valor
+    # vigente a una fecha es la última fila con fecha <= esa fecha.
+    Migracion(5, "CDC: validacion_sistema_cambios y su estado por archivo", (
+        """
+        CREATE TABLE validacion_sistema_cambios
+        (
+            archivo INT NOT NULL,
+            segmento INT NOT NULL,
+            campo INT NOT NULL,
+            fecha DATE NOT NULL,
+            valor NVARCHAR(MAX) NULL,
+            valor_num FLOAT NULL,
+            valor_fecha DATETIME2(3) NULL,
+            tipo_valor VARCHAR(12) NULL,
+            eliminado BIT NOT NULL CONSTRAINT DF_validacion_sistema_cambios_eliminado DEFAULT 0,
+            CONSTRAINT PK_validacion_sistema_cambios PRIMARY KEY CLUSTERED (archivo, segmento, campo, fecha)
+        );
+        """,
+        # versión por archivo: la caché local de últimos valores la compara
+        # para detectar que quedó atrasada (otro proceso, corte antes de guardarla)
+        """
+        CREATE TABLE validacion_sistema_cambios_estado
+        (
+            archivo INT NOT NULL PRIMARY KEY,
+            ultima_fecha DATE NOT NULL,
+            version INT NOT NULL
+        );
+        """,
+        """
+        ALTER TABLE validacion_sistema_carga ADD
+            eliminado BIT NOT NULL CONSTRAINT DF_validacion_sistema_carga_eliminado DEFAULT 0;
+        """,
+    )),
+
+    # v6: diario de cargas y checkpoints por trozo. Cada trozo del staging
+    # se confirma en su propia transacción junto con su checkpoint; una
+    # carga interrumpida se reanuda en el primer trozo sin checkpoint y se
+    # publica con una sola transacción (ver insertarValidacionSistemaMasivo).
+    Migracion(6, "diario de cargas y checkpoints de staging", (
+        """
+        CREATE TABLE carga_diario
+        (
+            lote CHAR(36) NOT NULL PRIMARY KEY,
+            archivo INT NOT NULL,
+            fecha DATE NOT NULL,
+            huella CHAR(64) NOT NULL,  -- sha256 de las filas: solo se reanuda con el mismo contenido
+            tamano_trozo INT NOT NULL,
+            total_trozos INT NOT NULL,
+            total_filas INT NOT NULL,
+            estado VARCHAR(12) NOT NULL,  -- cargando | publicada | abandonada
+            filas_publicadas INT NULL,
+            iniciada DATETIME2(0) NOT NULL DEFAULT SYSUTCDATETIME(),
+            actualizada DATETIME2(0) NOT NULL DEFAULT SYSUTCDATETIME()
+        );
+        """,
+        "CREATE INDEX IX_carga_diario_archivo_fecha ON carga_diario (archivo, fecha, estado);",
+        """
+        CREATE TABLE carga_checkpoint
+        (
+            lote CHAR(36) NOT NULL,
+            trozo INT NOT NULL,
+            filas INT NOT NULL,
+            confirmado DATETIME2(0) NOT NULL DEFAULT SYSUTCDATETIME(),
+            CONSTRAINT PK_carga_checkpoint PRIMARY KEY (lote, trozo)
+        );
+        """,
+    )),
+
+    # v7: iniciada tiene precisión de segundos y dos lotes del mismo archivo
+    # y fecha abiertos en el mismo segundo empataban al buscar el último; el
+    # id IDENTITY los desempata. filas_distintas: claves que ya estaban
+    # publicadas con otro valor y que la publicación no pisa (ver publicarLote).
+    Migracion(7, "diario de cargas: id de desempate y filas distintas", (
+        "ALTER TABLE carga_diario ADD id INT IDENTITY(1,1) NOT NULL;",
+        "ALTER TABLE carga_diario ADD filas_distintas INT NULL;",
+    )),
+)
+
+VERSION_ESQUEMA = MIGRACIONES[-1].version
+
+
+# =========================
+# APLICACIÓN
+# =========================
+_lock = threading.Lock()
+_version_confirmada = None  # por proceso: evita consultar la versión en cada carga
+
+
+def version_actual(cursor) -> int:
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM esquema_version")
+    return cursor.fetchone()[0]
+
+
+def aplicar_migraciones(conn, hasta: int = VERSION_ESQUEMA) -> list[int]:
+    """
+    Aplica las migraciones pendientes hasta la versión `hasta` y devuelve
+    las versiones aplicadas. Cada una en su transacción: si falla, el
+    rollback deja la BD en la versión anterior.
+    """
+    cursor = conn.cursor()
+    cursor.execute(DDL_ESQUEMA_VERSION)
+    conn.commit()
+
+    aplicadas = []
+    inicial = version_actual(cursor)
+    for migracion in MIGRACIONES:
+        if migracion.version > hasta:
+            break
+        if migracion.version <= inicial:
+            continue
+        try:
+            cursor.execute(SQL_APPLOCK, (APPLOCK_ESQUEMA,))
+            # se vuelve a leer con el lock tomado: otro proceso pudo aplicarla
+            if version_actual(cursor) >= migracion.version:
+                conn.commit()
+                continue
+
+            for sentencia in migracion.sentencias:
+                cursor.execute(sentencia)
+            aviso = None
+            if migracion.aviso is not None:
+                consulta, mensaje = migracion.aviso
+                cursor.execute(consulta)
+                aviso = mensaje.format(cursor.fetchone()[0])
+            cursor.execute(
+                "INSERT INTO esquema_version (version, descripcion) VALUES (?, ?)",
+                (migracion.version, migracion.descripcion),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        aplicadas.append(migracion.version)
+        print(f"✔ Migración {migracion.version} aplicada: {migracion.descripcion}")
+        if aviso is not None:
+            print(f"  {aviso}")
+    return aplicadas
+
+
+def asegurar_esquema() -> int:
+    """Deja la BD en VERSION_ESQUEMA; después de la primera vez no consulta la BD."""
+    global _version_confirmada
+    if _version_confirmada is not None:
+        return _version_confirmada
+    with _lock:
+        if _version_confirmada is None:
+            with conexion() as conn:
+                aplicar_migraciones(conn)
+            _version_confirmada = VERSION_ESQUEMA
+    return _version_confirmada
+
+
+def invalidar_esquema() -> None:
+    # p. ej. tras restaurar la BD: la próxima carga vuelve a verificar
+    global _version_confirmada
+    with _lock:
+        _version_confirmada = None
+
+
+if __name__ == "__main__":
+    with conexion() as conn:
+        aplicadas = aplicar_migraciones(conn)
+    print(f"Esquema en versión {VERSION_ESQUEMA} ({len(aplicadas)} migraciones aplicadas)")
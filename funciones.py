@@ -1,9 +1,26 @@
 from pathlib import Path
+from collections import deque
+from collections.abc import Mapping
+from itertools import islice
+from functools import lru_cache
+from typing import Iterable, Iterator, NamedTuple
 from conexionBD import *
+from dimensiones import *
+from metricas import *
+from entrada import *
+from reporte_compacto import *
+from manifiesto import firma_archivo
 import re
 import json
 import datetime
+import hashlib
+import logging
 import os
+import sys
+import time
+import uuid
+
+log = logging.getLogger(__name__)
 
 # =========================
 # DETECTORES BASE
@@ -27,24 +44,27 @@ def reached_segment_boundary(line: str) -> bool:
     return is_segment_end(line) or is_segment_start_band(line)
 
 
+_RE_TITULO = re.compile(r"[A-Za-z0-9][A-Za-z0-9 \-]{0,50}")
+
+
 def is_title_text(text: str) -> bool:
     t = text.strip()
     if not t or ":" in t:
         return False
     if t.startswith("-"):
         return True
-    return bool(re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9 \-]{0,50}", t))
+    return bool(_RE_TITULO.fullmatch(t))
 
 
 # =========================
 # COLUMNAS
 # =========================
-def split_two_columns(line: str) -> tuple[str, str] | None:
-    raw = line.rstrip("\n\r")
-    if len(raw) < 40:
-        return None
+_RE_HUECO = re.compile(r"\s{3,}")
+
 
-    runs = [(m.start(), m.end()) for m in re.finditer(r"\s{3,}", raw)]
+def _mejor_hueco(raw: str) -> tuple[int, int] | None:
+    # hueco (inicio, fin) que separa las dos columnas, o None
+    runs = [(m.start(), m.end()) for m in _RE_HUECO.finditer(raw)]
     if not runs:
         return None
 
@@ -62,6 +82,15 @@ def split_two_columns(line: str) -> tuple[str, str] | None:
             best_score = score
             best = (a, b)
 
+    return best
+
+
+def split_two_columns(line: str) -> tuple[str, str] | None:
+    raw = line.rstrip("\n\r")
+    if len(raw) < 40:
+        return None
+
+    best = _mejor_hueco(raw)
     if not best:
         return None
 
@@ -73,15 +102,114 @@ def split_two_columns(line: str) -> tuple[str, str] | None:
     return left, right
 
 
+# espacios distintos del blanco: con ellos el atajo no aplica
+_RE_ESPACIO_ESPECIAL = re.compile(r"[\t\x0b\x0c\x1c-\x1f]")
+
+# por debajo de este largo la penalización por distancia al centro
+# (0.01 por carácter, a lo sumo un 25% del largo) nunca llega a 1, así que
+# el hueco elegido es siempre el más largo
+_LARGO_MAXIMO_ATAJO = 400
+
+
+def _hay_hueco_competidor(raw: str, ancho: int, desde: int, hasta: int) -> bool:
+    # ¿hay en raw[desde:hasta] otro hueco de al menos `ancho` espacios que
+    # split_two_columns pudiera elegir (centro a menos del 25% del medio)?
+    largo = len(raw)
+    mitad = largo // 2
+    hueco = " " * ancho
+    p = raw.find(hueco, desde, hasta)
+    while p != -1:
+        fin = _RE_HUECO.match(raw, p).end()
+        if abs((p + fin) // 2 - mitad) <= largo * 0.25:
+            return True
+        p = raw.find(hueco, fin, hasta)
+    return False
+
+
+class DisposicionColumnas:
+    """
+    Columnas donde empieza la mitad derecha de un segmento a dos columnas.
+
+    Dentro de un segmento esas columnas casi no cambian: se infieren con
+    la heurística de split_two_columns y en las líneas siguientes solo se
+    comprueba que el hueco que termina en alguna de ellas sea el que la
+    heurística elegiría (ningún otro hueco elegible igual o más largo).
+    Si ninguna pasa la comprobación se usa la heurística y se recuerda la
+    columna nueva, así que el resultado es siempre el de split_two_columns.
+    """
+
+    __slots__ = ("columnas", "aciertos", "fallos")
+
+    # columnas recordadas por segmento (la más reciente primero)
+    MAX_COLUMNAS = 4
+
+    def __init__(self):
+        self.columnas: list[int] = []
+        self.aciertos = 0
+        self.fallos = 0
+
+    def partir(self, line: str) -> tuple[str, str] | None:
+        raw = line.rstrip("\n\r")
+        largo = len(raw)
+        if largo < 40:
+            return None
+
+        if (
+            self.columnas
+            and largo < _LARGO_MAXIMO_ATAJO
+            and raw.isascii()
+            and not _RE_ESPACIO_ESPECIAL.search(raw)
+        ):
+            for b in self.columnas:
+                if b >= largo or raw[b] == " " or raw[b - 1] != " ":
+                    continue
+                izquierda = raw[:b].rstrip(" ")
+                a = len(izquierda)
+                ancho = b - a
+                if (
+                    a
+                    and ancho >= 3
+                    and abs((a + b) // 2 - largo // 2) <= largo * 0.25
+                    and not _hay_hueco_competidor(raw, ancho, 0, a)
+                    and not _hay_hueco_competidor(raw, ancho, b, largo)
+                ):
+                    self.aciertos += 1
+                    return izquierda, raw[b:].rstrip()
+
+            # sin ningún hueco elegible la heurística no parte la línea
+            if not _hay_hueco_competidor(raw, 3, 0, largo):
+                self.aciertos += 1
+                return None
+
+        self.fallos += 1
+        best = _mejor_hueco(raw)
+        if not best:
+            return None
+        a, b = best
+        left = raw[:a].rstrip()
+        right = raw[b:].rstrip()
+        if not left or not right:
+            return None
+        if b not in self.columnas:
+            self.columnas.insert(0, b)
+            del self.columnas[self.MAX_COLUMNAS:]
+        return left, right
+
+
 # =========================
 # KV PARSER (MULTI CAMPO)
 # =========================
 KEY_RE = re.compile(r"(?P<name>(?=[^:]*[A-Za-z])[^:]{1,120}?)\s*:\s*")
 
 
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=8192)
 def clean_field_name(name: str) -> str:
+    # los nombres de campo se repiten en cada segmento del mismo tipo
     n = name.replace(".", " ")
-    n = re.sub(r"\s+", " ", n).strip()
+    n = _RE_ESPACIOS.sub(" ", n).strip()
     return n
 
 
@@ -111,8 +239,8 @@ def add_kvs_from_piece(piece: str, fields: dict[str, str]) -> None:
         fields[k] = v
 
 
-def add_kvs_from_line(line: str, fields: dict[str, str]) -> None:
-    parts = split_two_columns(line)
+def add_kvs_from_line(line: str, fields: dict[str, str], disposicion: "DisposicionColumnas | None" = None) -> None:
+    parts = split_two_columns(line) if disposicion is None else disposicion.partir(line)
     if parts:
         add_kvs_from_piece(parts[0], fields)
         add_kvs_from_piece(parts[1], fields)
@@ -120,131 +248,777 @@ def add_kvs_from_line(line: str, fields: dict[str, str]) -> None:
         add_kvs_from_piece(line, fields)
 
 
+# =========================
+# NORMALIZACIÓN DE VALORES
+# =========================
+_NUM = r"[+-]?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?|[+-]?\.\d+"
+_RE_NUMERO = re.compile(_NUM)
+_RE_SUFIJO = re.compile(rf"({_NUM})\s*([KMG])")
+_RE_PORCENTAJE = re.compile(rf"({_NUM})\s*%")
+_RE_DURACION = re.compile(r"(?:(\d+)-)?(\d+):([0-5]\d):([0-5]\d(?:\.\d+)?)")
+
+_EPOCA = datetime.datetime(1970, 1, 1)
+_MULTIPLICADORES = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+_BOOLEANOS = {"YES": 1.0, "NO": 0.0}
+_FORMATOS_FECHA = (
+    ("%m/%d/%Y %H:%M:%S", "fecha_hora"),
+    ("%m/%d/%Y %H:%M:%S.%f", "fecha_hora"),
+    ("%m/%d/%y %H:%M:%S", "fecha_hora"),
+    ("%m/%d/%Y", "fecha"),
+    ("%m/%d/%y", "fecha"),
+)
+
+
+class ValorNormalizado(NamedTuple):
+    """
+    Valor de un campo junto a su forma tipada.
+
+    tipo: vacio, entero, decimal, bytes (sufijos K/M/G en bytes),
+    porcentaje, duracion (segundos), fecha, fecha_hora, booleano (1/0) o texto.
+    Las fechas quedan en `fecha` y también en `numero` como segundos POSIX.
+    """
+
+    crudo: str
+    tipo: str
+    numero: float | None = None
+    fecha: datetime.datetime | None = None
+
+
+def _a_numero(texto: str) -> float:
+    return float(texto.replace(",", ""))
+
+
+@lru_cache(maxsize=65536)
+def normalizar_valor(valor: str) -> ValorNormalizado:
+    # los valores de CICS se repiten mucho entre segmentos y reportes: se cachean
+    v = valor.strip()
+    if not v:
+        return ValorNormalizado(valor, "vacio")
+
+    if _RE_NUMERO.fullmatch(v):
+        numero = _a_numero(v)
+        return ValorNormalizado(valor, "decimal" if "." in v else "entero", numero)
+
+    m = _RE_SUFIJO.fullmatch(v)
+    if m:
+        return ValorNormalizado(valor, "bytes", _a_numero(m.group(1)) * _MULTIPLICADORES[m.group(2)])
+
+    m = _RE_PORCENTAJE.fullmatch(v)
+    if m:
+        return ValorNormalizado(valor, "porcentaje", _a_numero(m.group(1)))
+
+    m = _RE_DURACION.fullmatch(v)
+    if m:
+        dias, horas, minutos, segundos = m.groups()
+        total = int(dias or 0) * 86400 + int(horas) * 3600 + int(minutos) * 60 + float(segundos)
+        return ValorNormalizado(valor, "duracion", total)
+
+    bandera = _BOOLEANOS.get(v.upper())
+    if bandera is not None:
+        return ValorNormalizado(valor, "booleano", bandera)
+
+    if "/" in v:
+        for formato, tipo in _FORMATOS_FECHA:
+            try:
+                fecha = datetime.datetime.strptime(v, formato)
+            except ValueError:
+                continue
+            return ValorNormalizado(valor, tipo, (fecha - _EPOCA).total_seconds(), fecha)
+
+    return ValorNormalizado(valor, "texto")
+
+
+def normalizar_campos(fields: dict[str, str]) -> dict[str, ValorNormalizado]:
+    return {campo: normalizar_valor("" if valor is None else str(valor)) for campo, valor in fields.items()}
+
+
 # =========================
 # SEGMENTO TABLA
 # =========================
+_RE_TRAMO_ENCABEZADO = re.compile(r"\S+(?: \S+)*")
+_RE_LETRA = re.compile(r"[A-Za-z]")
+_RE_SEPARADOR_TABLA = re.compile(r"\s{2,}")
+
+
+def _dos_separadores(s: str) -> bool:
+    # equivale a len(findall(r"\s{2,}")) >= 2 pero se detiene en el segundo
+    separadores = _RE_SEPARADOR_TABLA.finditer(s)
+    return next(separadores, None) is not None and next(separadores, None) is not None
+
+
 def looks_like_table_header(line: str) -> bool:
     s = line.rstrip()
     if not s.strip() or ":" in s:
         return False
-    if not re.search(r"[A-Za-z]", s):
+    if not _RE_LETRA.search(s):
         return False
-    return len(re.findall(r"\s{2,}", s)) >= 2
+    return _dos_separadores(s)
 
 
 def looks_like_table_row(line: str) -> bool:
     s = line.rstrip()
     if not s.strip() or ":" in s:
         return False
-    return len(re.findall(r"\s{2,}", s)) >= 2
+    return _dos_separadores(s)
 
 
 def is_table_segment(lines: list[str], start_idx: int) -> bool:
-    end_scan = min(len(lines), start_idx + 25)
+    ventana = lines[start_idx:start_idx + VENTANA_TABLA]
+    return es_tabla_clasificada([(clasificar_linea(l), l) for l in ventana])
+
+
+# =========================
+# UTILS
+# =========================
+def unique_title(base: str, store: dict) -> str:
+    # busca el primer sufijo libre recorriendo store; para muchos títulos
+    # repetidos usar RegistroTitulos (contador por título)
+    if base not in store:
+        return base
+    i = 2
+    while f"{base} ({i})" in store:
+        i += 1
+    return f"{base} ({i})"
+
+
+class IdentidadSegmento(NamedTuple):
+    """Identidad estable de un segmento: título original, n-ésima aparición y página."""
+
+    titulo: str
+    ocurrencia: int
+    pagina: int | None
+
+
+class RegistroTitulos:
+    """
+    Asigna nombres únicos a los segmentos en O(1) amortizado.
+
+    Produce los mismos nombres que unique_title (" (2)", " (3)", ...) pero
+    guarda, por título, el próximo sufijo a probar en lugar de recorrer
+    todos desde 2. Además recuerda la identidad (titulo, ocurrencia,
+    pagina) de cada nombre entregado.
+    """
+
+    __slots__ = ("_identidades", "_siguiente", "_ocurrencias")
+
+    def __init__(self):
+        self._identidades: dict[str, IdentidadSegmento] = {}
+        self._siguiente: dict[str, int] = {}
+        self._ocurrencias: dict[str, int] = {}
+
+    def registrar(self, titulo: str, pagina: int | None = None) -> str:
+        nombre = titulo
+        if nombre in self._identidades:
+            # los sufijos por debajo del contador ya están tomados
+            i = self._siguiente.get(titulo, 2)
+            while f"{titulo} ({i})" in self._identidades:
+                i += 1
+            self._siguiente[titulo] = i + 1
+            nombre = f"{titulo} ({i})"
+
+        ocurrencia = self._ocurrencias.get(titulo, 0) + 1
+        self._ocurrencias[titulo] = ocurrencia
+        self._identidades[nombre] = IdentidadSegmento(titulo, ocurrencia, pagina)
+        return nombre
+
+    def identidad(self, nombre: str) -> IdentidadSegmento | None:
+        return self._identidades.get(nombre)
+
+    def identidades(self) -> dict[str, IdentidadSegmento]:
+        return dict(self._identidades)
+
+    def __contains__(self, nombre) -> bool:
+        return nombre in self._identidades
+
+    def __len__(self) -> int:
+        return len(self._identidades)
+
+
+# =========================
+# LECTURA EN STREAMING
+# =========================
+TAMANO_BLOQUE_LECTURA = 1 << 20  # 1 MiB por lectura
+
+
+def iterar_lineas(file_path: Path, tamano_bloque: int = TAMANO_BLOQUE_LECTURA, medir: bool = True,
+                  formato: FormatoEntrada | None = None) -> Iterator[str]:
+    """
+    Lee el reporte por bloques y produce las mismas líneas que
+    file_path.read_text(errors="ignore").splitlines(), sin cargar el
+    archivo completo en memoria. Los reportes comprimidos o en EBCDIC
+    (ver entrada.py) se decodifican al vuelo; formato evita detectarlo de
+    nuevo. Con medir=True suma las líneas entregadas al contador "lineas".
+    """
+    formato = detectar_formato(file_path) if formato is None else formato
+    entregadas = yield from iterar_lineas_reporte(file_path, formato, tamano_bloque)
+    if medir:
+        contar("lineas", entregadas)
+
+
+# =========================
+# CLASIFICACIÓN DE LÍNEAS
+# =========================
+LINEA_VACIA = 0
+LINEA_PAGINA = 1
+LINEA_INICIO = 2
+LINEA_FIN = 3
+LINEA_TEXTO = 4
+
+# líneas que is_table_segment revisa por adelantado
+VENTANA_TABLA = 25
+
+_RE_PAGINA = re.compile(r"PAGE\s+(\d+)")
+
+
+def numero_pagina(line: str, anterior: int = 0) -> int:
+    # número impreso en el encabezado; si no se puede leer, la siguiente
+    m = _RE_PAGINA.search(line)
+    return int(m.group(1)) if m else anterior + 1
+
+
+def clasificar_linea(line: str) -> int:
+    s = line.strip()
+    if not s:
+        return LINEA_VACIA
+    # los detectores solo se evalúan si el primer carácter puede coincidir
+    if s[0].isdigit():
+        if s.startswith("0-") and is_segment_end(line):
+            return LINEA_FIN
+        if is_page_header(line):
+            return LINEA_PAGINA
+        return LINEA_TEXTO
+    if line.startswith("+_") and is_segment_start_band(line):
+        return LINEA_INICIO
+    return LINEA_TEXTO
+
+
+class _FlujoLineas:
+    """
+    Líneas ya clasificadas (tipo, línea), con devolución y lectura
+    anticipada acotada. Cada línea se clasifica una sola vez.
+    """
+
+    __slots__ = ("_fuente", "_pendientes", "pagina")
+
+    def __init__(self, lineas: Iterable[str]):
+        self._fuente = iter(lineas)
+        self._pendientes: deque[tuple[int, str]] = deque()
+        # página del último encabezado consumido (0 = antes del primero)
+        self.pagina = 0
+
+    def siguiente(self) -> tuple[int, str] | None:
+        if self._pendientes:
+            item = self._pendientes.popleft()
+        else:
+            linea = next(self._fuente, None)
+            if linea is None:
+                return None
+            item = (clasificar_linea(linea), linea)
+        if item[0] == LINEA_PAGINA:
+            self.pagina = numero_pagina(item[1], self.pagina)
+        return item
+
+    def devolver(self, item: tuple[int, str]) -> None:
+        self._pendientes.appendleft(item)
+
+    def anticipar(self, n: int) -> list[tuple[int, str]]:
+        while len(self._pendientes) < n:
+            linea = next(self._fuente, None)
+            if linea is None:
+                break
+            self._pendientes.append((clasificar_linea(linea), linea))
+        return list(islice(self._pendientes, n))
+
+    def contenido_segmento(self) -> Iterator[tuple[int, str]]:
+        # líneas hasta el siguiente límite de segmento (que se deja pendiente)
+        while True:
+            item = self.siguiente()
+            if item is None:
+                return
+            if item[0] == LINEA_INICIO or item[0] == LINEA_FIN:
+                self.devolver(item)
+                return
+            yield item
+
+    def saltar_segmento(self) -> None:
+        # como contenido_segmento, sin entregar las líneas
+        while True:
+            item = self.siguiente()
+            if item is None:
+                return
+            if item[0] == LINEA_INICIO or item[0] == LINEA_FIN:
+                self.devolver(item)
+                return
+
+
+def es_tabla_clasificada(ventana: list[tuple[int, str]]) -> bool:
     header_at = None
 
-    for i in range(start_idx, end_scan):
-        if is_page_header(lines[i]) or lines[i].strip() == "":
+    for idx, (tipo, linea) in enumerate(ventana):
+        if tipo == LINEA_VACIA or tipo == LINEA_PAGINA:
             continue
-        if reached_segment_boundary(lines[i]):
+        if tipo == LINEA_INICIO or tipo == LINEA_FIN:
             return False
-        if looks_like_table_header(lines[i]):
-            header_at = i
+        if looks_like_table_header(linea):
+            header_at = idx
             break
 
     if header_at is None:
         return False
 
-    for i in range(header_at + 1, end_scan):
-        if is_page_header(lines[i]) or lines[i].strip() == "":
+    for tipo, linea in ventana[header_at + 1:]:
+        if tipo == LINEA_VACIA or tipo == LINEA_PAGINA:
             continue
-        if reached_segment_boundary(lines[i]):
+        if tipo == LINEA_INICIO or tipo == LINEA_FIN:
             break
-        if looks_like_table_row(lines[i]):
+        if looks_like_table_row(linea):
             return True
 
     return False
 
 
 # =========================
-# UTILS
+# EXTRACCIÓN DE TABLAS
 # =========================
-def unique_title(base: str, store: dict) -> str:
-    if base not in store:
-        return base
-    i = 2
-    while f"{base} ({i})" in store:
-        i += 1
-    return f"{base} ({i})"
+# líneas de encabezado apiladas como máximo (p. ej. "Tran ..." / "ID ...")
+MAX_LINEAS_ENCABEZADO = 3
+
+# primera columna con control de carro ASA ("0", "1", "-", "+")
+_CONTROL_CARRO = frozenset("01-+")
+
+
+def _tramos_encabezado(linea: str) -> list[tuple[int, int, str]]:
+    # textos del encabezado separados por 2+ espacios: (inicio, fin, texto)
+    if linea[:1] in _CONTROL_CARRO and linea[1:2] == " ":
+        linea = " " + linea[1:]
+    return [(m.start(), m.end(), m.group()) for m in _RE_TRAMO_ENCABEZADO.finditer(linea)]
+
+
+def _columnas_encabezado(lineas_encabezado: list[str]) -> tuple[list[str], list[list[int]]]:
+    # nombres y tramos [inicio, fin) de cada columna según el encabezado
+    tramos_por_linea = [_tramos_encabezado(l) for l in lineas_encabezado]
+
+    columnas = [[a, b] for a, b, _ in tramos_por_linea[-1]]
+    for tramos in reversed(tramos_por_linea[:-1]):
+        for a, b, _ in tramos:
+            if not any(a < cb and ca < b for ca, cb in columnas):
+                columnas.append([a, b])
+    columnas.sort()
+
+    nombres = []
+    for ca, cb in columnas:
+        partes = [
+            texto
+            for tramos in tramos_por_linea
+            for a, b, texto in tramos
+            if a < cb and ca < b
+        ]
+        nombres.append(" ".join(partes))
+
+    return nombres, columnas
+
+
+def inferir_columnas(lineas_encabezado: list[str]) -> tuple[list[str], list[tuple[int, int | None]]]:
+    """
+    Calcula, una sola vez por encabezado, los nombres de columna y los
+    cortes (inicio, fin) con los que se rebanan las filas.
+
+    La línea de encabezado más baja define las columnas; las de arriba
+    agregan columnas que no se solapan y anteponen su texto al nombre.
+    """
+    nombres, columnas = _columnas_encabezado(lineas_encabezado)
+
+    # cada corte llega hasta la mitad del hueco con la columna vecina
+    cortes = []
+    for idx, (ca, cb) in enumerate(columnas):
+        inicio = 0 if idx == 0 else (columnas[idx - 1][1] + ca) // 2
+        fin = None if idx == len(columnas) - 1 else (cb + columnas[idx + 1][0]) // 2
+        cortes.append((inicio, fin))
+
+    return nombres, cortes
+
+
+def tipar_celda(valor: str):
+    # enteros con separador de miles y decimales simples; el resto queda como texto
+    if not valor:
+        return valor
+    digitos = valor.replace(",", "")
+    signo = digitos[:1] in "+-"
+    cuerpo = digitos[1:] if signo else digitos
+    if cuerpo.isdigit():
+        return int(digitos)
+    if "." in cuerpo and cuerpo.replace(".", "", 1).isdigit():
+        return float(digitos)
+    return valor
+
+
+class TablaCICS:
+    """
+    Segmento tabular del reporte: columnas inferidas del encabezado y
+    filas como tuplas con valores tipados (int/float/str).
+    """
+
+    __slots__ = ("titulo", "columnas", "filas", "_cortes", "_huecos", "_encabezado")
+
+    def __init__(self, titulo: str, lineas_encabezado: list[str]):
+        self.titulo = titulo
+        self.columnas, self._cortes = inferir_columnas(lineas_encabezado)
+        _, tramos = _columnas_encabezado(lineas_encabezado)
+        # hueco entre encabezados vecinos: rango donde puede moverse cada corte
+        self._huecos = [(tramos[i][1], tramos[i + 1][0]) for i in range(len(tramos) - 1)]
+        self._encabezado = frozenset(l.strip() for l in lineas_encabezado)
+        self.filas: list[tuple] = []
+
+    def _cortes_fila(self, linea: str) -> list[tuple[int, int | None]]:
+        # un valor más ancho que su encabezado (p. ej. nombres alineados a la
+        # izquierda) puede cruzar la mitad del hueco: el corte se corre al
+        # espacio más cercano dentro del hueco para no partir el valor
+        cortes = self._cortes
+        ajustados = None
+        for idx, (desde, hasta) in enumerate(self._huecos):
+            corte = cortes[idx][1]
+            if corte >= len(linea) or linea[corte] == " " or linea[corte - 1] == " ":
+                continue
+            nuevo = None
+            for distancia in range(1, hasta - desde + 1):
+                for p in (corte - distancia, corte + distancia):
+                    if desde <= p <= hasta and p < len(linea) and linea[p] == " ":
+                        nuevo = p
+                        break
+                if nuevo is not None:
+                    break
+            if nuevo is None:
+                continue
+            if ajustados is None:
+                ajustados = list(cortes)
+            ajustados[idx] = (ajustados[idx][0], nuevo)
+            ajustados[idx + 1] = (nuevo, ajustados[idx + 1][1])
+        return cortes if ajustados is None else ajustados
+
+    def agregar_linea(self, linea: str) -> None:
+        # los encabezados repetidos (p. ej. tras un salto de página) se ignoran
+        if linea.strip() in self._encabezado:
+            return
+        self.filas.append(tuple(tipar_celda(linea[a:b].strip()) for a, b in self._cortes_fila(linea)))
+
+    def mismo_encabezado(self, otra: "TablaCICS") -> bool:
+        return self._encabezado == otra._encabezado and self.columnas == otra.columnas
+
+    def extender(self, otra: "TablaCICS") -> None:
+        self.filas.extend(otra.filas)
+
+    def registros(self) -> Iterator[dict]:
+        for fila in self.filas:
+            yield dict(zip(self.columnas, fila))
+
+    def a_dict(self) -> dict:
+        return {"columnas": list(self.columnas), "filas": [list(f) for f in self.filas]}
+
+    def a_campos(self) -> dict[str, str]:
+        # vista {campo: valor} compatible con insertarValidacionSistema
+        campos = {}
+        registro = RegistroTitulos()
+        for n, fila in enumerate(self.filas, start=1):
+            clave = str(fila[0]) if fila and fila[0] != "" else str(n)
+            for columna, valor in zip(self.columnas[1:], fila[1:]):
+                campos[registro.registrar(f"{clave} {columna}")] = str(valor)
+        return campos
+
+    def __len__(self) -> int:
+        return len(self.filas)
+
+
+def _es_linea_encabezado(linea: str) -> bool:
+    # las líneas de encabezado no traen números ni pares campo:valor
+    return ":" not in linea and not any(c.isdigit() for c in linea[1:])
+
+
+def extraer_tabla(titulo: str, linea_titulo: str, items: Iterable[tuple[int, str]]) -> TablaCICS:
+    """Construye la tabla de un segmento a partir de sus líneas clasificadas."""
+    encabezado = [linea_titulo] if looks_like_table_header(linea_titulo) else []
+    tabla = None
+
+    for tipo, linea in items:
+        if tipo == LINEA_PAGINA:
+            continue
+
+        if tabla is None:
+            if tipo == LINEA_VACIA:
+                if encabezado:
+                    tabla = TablaCICS(titulo, encabezado)
+                continue
+            if not encabezado:
+                if looks_like_table_header(linea):
+                    encabezado.append(linea)
+                continue
+            if len(encabezado) < MAX_LINEAS_ENCABEZADO and _es_linea_encabezado(linea):
+                encabezado.append(linea)
+                continue
+            tabla = TablaCICS(titulo, encabezado)
+
+        if tipo == LINEA_TEXTO:
+            tabla.agregar_linea(linea)
+
+    if tabla is None:
+        tabla = TablaCICS(titulo, encabezado or [linea_titulo])
+    return tabla
 
 
 # =========================
 # PARSER PRINCIPAL
 # =========================
-def parse_cicsadm(file_path: Path) -> dict:
-    lines = file_path.read_text(errors="ignore").splitlines()
-    out: dict[str, dict] = {}
-    i = 0
-
-    while i < len(lines):
-        if is_page_header(lines[i]):
-            i += 1
-            continue
+class SegmentoCICS(NamedTuple):
+    """
+    Segmento tal como aparece en el reporte: título, campos (o TablaCICS),
+    página donde empieza y si es continuación del segmento anterior.
+    """
+
+    titulo: str
+    campos: dict | TablaCICS
+    pagina: int
+    continuacion: bool = False
 
-        if is_segment_start_band(lines[i]):
-            j = i + 1
-            while j < len(lines) and (lines[j].strip() == "" or is_page_header(lines[j])):
-                j += 1
-            if j >= len(lines):
-                break
 
-            split = split_two_columns(lines[j])
+def _es_linea_sin_titulo(linea: str) -> bool:
+    # control de carro solo o seguido de espacios: encabezado/datos que
+    # continúan el segmento anterior, no un título
+    s = linea.strip()
+    return s[:1] == "0" and (len(s) == 1 or s[1] in " \t")
+
+
+def _titulo_logico(titulo: str) -> str:
+    # "0Monitoring" -> "Monitoring": control de carro pegado al título
+    if len(titulo) > 1 and titulo[0] in _CONTROL_CARRO and titulo[1].isalpha():
+        return titulo[1:]
+    return titulo
+
+
+def iterar_fragmentos_lineas(lineas: Iterable[str], tablas: bool = False,
+                             continuaciones: bool = False, pagina_inicial: int = 0,
+                             selector: "SelectorSegmentos | None" = None) -> Iterator[SegmentoCICS]:
+    """
+    Motor del parser: recorre las líneas una sola vez y produce cada
+    segmento (SegmentoCICS) en cuanto se alcanza su límite.
+    Con tablas=True los segmentos tabulares se entregan como TablaCICS
+    en lugar de {}.
+
+    Con continuaciones=True se reconocen los fragmentos que un salto de
+    página separa de su segmento: bandas sin título propio (la línea
+    "título" es en realidad encabezado o datos) y el mismo título repetido
+    en otra página. Se entregan con el título del segmento al que
+    pertenecen y continuacion=True.
+
+    pagina_inicial es la página vigente antes de la primera línea (para
+    parsear un tramo del reporte, ver indice_segmentos.py).
+
+    Con un selector, los segmentos cuyo título no acepta se saltan hasta
+    el siguiente límite sin partir columnas ni parsear clave/valor (sus
+    continuaciones también, porque llevan el mismo título).
+    """
+    flujo = _FlujoLineas(lineas)
+    flujo.pagina = pagina_inicial
+    anterior = None  # (titulo, página donde terminó) del último segmento de una columna
+
+    while True:
+        item = flujo.siguiente()
+        if item is None:
+            return
+        if item[0] != LINEA_INICIO:
+            continue
+
+        # el título es la primera línea con contenido después de la banda
+        item = flujo.siguiente()
+        while item is not None and (item[0] == LINEA_VACIA or item[0] == LINEA_PAGINA):
+            item = flujo.siguiente()
+        if item is None:
+            return
+        linea_titulo = item[1]
+        pagina = flujo.pagina
+
+        continuacion = False
+        if continuaciones and anterior is not None and _es_linea_sin_titulo(linea_titulo):
+            # la línea pertenece al contenido: se devuelve al flujo
+            flujo.devolver(item)
+            title, linea_titulo, continuacion = anterior[0], "", True
+        else:
+            split = split_two_columns(linea_titulo)
             if split and is_title_text(split[0]) and is_title_text(split[1]):
                 tL = split[0].lstrip("-").strip()
                 tR = split[1].lstrip("-").strip()
-                j += 1
+                anterior = None
+                incluir_L = selector is None or selector.acepta(tL)
+                incluir_R = selector is None or selector.acepta(tR)
+                if not (incluir_L or incluir_R):
+                    flujo.saltar_segmento()
+                    continue
 
                 left, right = {}, {}
-                while j < len(lines) and not reached_segment_boundary(lines[j]):
-                    if not is_page_header(lines[j]) and lines[j].strip():
-                        parts = split_two_columns(lines[j])
-                        if parts:
-                            add_kvs_from_piece(parts[0], left)
-                            add_kvs_from_piece(parts[1], right)
-                        else:
-                            add_kvs_from_piece(lines[j], left)
-                    j += 1
-
-                out[unique_title(tL, out)] = left
-                out[unique_title(tR, out)] = right
-                i = j
+                disposicion = DisposicionColumnas()
+                for tipo, linea in flujo.contenido_segmento():
+                    if tipo != LINEA_TEXTO:
+                        continue
+                    parts = disposicion.partir(linea)
+                    if parts:
+                        add_kvs_from_piece(parts[0], left)
+                        add_kvs_from_piece(parts[1], right)
+                    else:
+                        add_kvs_from_piece(linea, left)
+
+                if incluir_L:
+                    yield SegmentoCICS(tL, left, pagina)
+                if incluir_R:
+                    yield SegmentoCICS(tR, right, pagina)
                 continue
 
-            title = lines[j].lstrip("-").strip()
-            j += 1
+            title = linea_titulo.lstrip("-").strip()
+            if continuaciones:
+                title = _titulo_logico(title)
+                # mismo título justo después de un salto de página
+                continuacion = anterior is not None and anterior[0] == title and anterior[1] != pagina
+
+        item = flujo.siguiente()
+        while item is not None and (item[0] == LINEA_VACIA or item[0] == LINEA_PAGINA or item[1].startswith("+_")):
+            item = flujo.siguiente()
+        incluido = selector is None or selector.acepta(title)
+        if item is None:
+            if incluido:
+                yield SegmentoCICS(title, {}, pagina, continuacion)
+            return
+        flujo.devolver(item)
+
+        if not incluido:
+            flujo.saltar_segmento()
+            anterior = (title, flujo.pagina)
+            continue
 
-            while j < len(lines) and (lines[j].strip() == "" or is_page_header(lines[j]) or lines[j].startswith("+_")):
-                j += 1
+        if es_tabla_clasificada(flujo.anticipar(VENTANA_TABLA)):
+            if tablas:
+                fields = extraer_tabla(title, linea_titulo, flujo.contenido_segmento())
+            else:
+                flujo.saltar_segmento()
+                fields = {}
+        else:
+            fields = {}
+            # el hueco entre columnas se infiere una vez por segmento
+            disposicion = DisposicionColumnas()
+            for tipo, linea in flujo.contenido_segmento():
+                if tipo == LINEA_TEXTO:
+                    add_kvs_from_line(linea, fields, disposicion)
 
-            if j < len(lines) and is_table_segment(lines, j):
-                out[unique_title(title, out)] = {}
-                while j < len(lines) and not reached_segment_boundary(lines[j]):
-                    j += 1
-                i = j
-                continue
+        anterior = (title, flujo.pagina)
+        yield SegmentoCICS(title, fields, pagina, continuacion)
 
-            fields = {}
-            while j < len(lines) and not reached_segment_boundary(lines[j]):
-                if not is_page_header(lines[j]) and lines[j].strip():
-                    add_kvs_from_line(lines[j], fields)
-                j += 1
 
-            out[unique_title(title, out)] = fields
-            i = j
+def iterar_segmentos_lineas(lineas: Iterable[str], tablas: bool = False) -> Iterator[tuple[str, dict]]:
+    """(titulo, campos) de cada segmento; ver iterar_fragmentos_lineas."""
+    for segmento in iterar_fragmentos_lineas(lineas, tablas):
+        yield segmento.titulo, segmento.campos
+
+
+def iterar_segmentos(file_path: Path, tablas: bool = False) -> Iterator[tuple[str, dict]]:
+    return iterar_segmentos_lineas(iterar_lineas(file_path), tablas)
+
+
+_RE_APPLID = re.compile(r"Applid\s+(\S+)")
+
+
+def obtener_region(file_path: Path, max_lineas: int = 200) -> str | None:
+    """Applid del primer encabezado de página (la región CICS del reporte)."""
+    for n, linea in enumerate(iterar_lineas(file_path, medir=False)):
+        if n >= max_lineas:
+            break
+        if is_page_header(linea):
+            m = _RE_APPLID.search(linea)
+            return m.group(1) if m else None
+    return None
+
+
+def iterar_fragmentos(file_path: Path, tablas: bool = False, continuaciones: bool = False,
+                     selector: "SelectorSegmentos | None" = None) -> Iterator[SegmentoCICS]:
+    return iterar_fragmentos_lineas(iterar_lineas(file_path), tablas, continuaciones, selector=selector)
+
+
+def parse_cicsadm(file_path: Path, fusionar_fragmentos: bool = False,
+                  registro: RegistroTitulos | None = None,
+                  selector: "SelectorSegmentos | None" = None, tablas: bool = False) -> dict:
+    """
+    {titulo: campos} del reporte. Los títulos repetidos reciben " (2)",
+    " (3)", ...; la identidad (titulo, ocurrencia, pagina) de cada clave
+    queda en `registro` si se pasa uno.
+
+    Con fusionar_fragmentos=True los fragmentos que continúan un segmento
+    tras un salto de página se agregan a la entrada de ese segmento en
+    lugar de crear claves nuevas ("0 (18)", "Transaction Classes (2)").
+
+    Con un selector (SelectorSegmentos) solo se parsean los segmentos que
+    acepta; las claves de los incluidos no cambian, porque un título se
+    incluye o se excluye en todas sus apariciones.
+
+    Con tablas=True los segmentos tabulares, que de otro modo quedan como
+    {}, traen sus filas como campos "<primera columna> <columna>"
+    (TablaCICS.a_campos): así llegan al JSON, a la BD y al histórico.
+    """
+    return dict(iterar_segmentos_registrados(file_path, fusionar_fragmentos, registro, selector, tablas))
+
+
+def iterar_segmentos_registrados(file_path: Path, fusionar_fragmentos: bool = False,
+                                 registro: RegistroTitulos | None = None,
+                                 selector: "SelectorSegmentos | None" = None,
+                                 tablas: bool = False) -> Iterator[tuple[str, dict]]:
+    """(clave, campos) de parse_cicsadm en orden, sin armar el dict completo."""
+    registro = RegistroTitulos() if registro is None else registro
+    pendiente = None  # el último segmento espera por si llegan continuaciones
+    for segmento in iterar_fragmentos(file_path, tablas=tablas, continuaciones=fusionar_fragmentos, selector=selector):
+        campos = segmento.campos
+        if isinstance(campos, TablaCICS):
+            campos = campos.a_campos()
+        if segmento.continuacion and pendiente is not None:
+            # un campo repetido en la continuación pisa al anterior, igual que dentro de un segmento
+            pendiente[1].update(campos)
             continue
+        if pendiente is not None:
+            yield pendiente
+        pendiente = (registro.registrar(segmento.titulo, segmento.pagina), campos)
+    if pendiente is not None:
+        yield pendiente
 
-        i += 1
 
+def parse_cicsadm_compacto(file_path: Path, fusionar_fragmentos: bool = False,
+                           registro: RegistroTitulos | None = None,
+                           selector: "SelectorSegmentos | None" = None,
+                           tablas: bool = False) -> ReporteCompacto:
+    """
+    Como parse_cicsadm, pero en un ReporteCompacto (nombres internados y
+    arreglos en lugar de un dict por segmento). Cada segmento pasa a los
+    arreglos apenas se parsea: el dict de dicts nunca existe completo.
+    """
+    return ReporteCompacto.desde_items(
+        iterar_segmentos_registrados(file_path, fusionar_fragmentos, registro, selector, tablas)
+    )
+
+
+def extraer_tablas(file_path: Path, fusionar_fragmentos: bool = False,
+                   selector: "SelectorSegmentos | None" = None) -> dict[str, TablaCICS]:
+    """
+    Solo los segmentos tabulares del reporte. Una tabla que continúa en
+    segmentos consecutivos con el mismo encabezado (cortes de página) se
+    entrega como una sola TablaCICS.
+    """
+    registro = RegistroTitulos()
+    out: dict[str, TablaCICS] = {}
+    anterior = None
+    for segmento in iterar_fragmentos(file_path, tablas=True, continuaciones=fusionar_fragmentos, selector=selector):
+        tabla = segmento.campos
+        if not isinstance(tabla, TablaCICS):
+            # una continuación sin tabla (solo texto) no corta la tabla anterior
+            if not segmento.continuacion:
+                anterior = None
+            continue
+        if anterior is not None and anterior.mismo_encabezado(tabla):
+            anterior.extender(tabla)
+            continue
+        out[registro.registrar(segmento.titulo, segmento.pagina)] = tabla
+        anterior = tabla
     return out
 
 
@@ -252,104 +1026,95 @@ def parse_cicsadm(file_path: Path) -> dict:
 # Validar si ya existe un segmento con la misma fecha
 def validarArchivoFecha(archivo, fecha_str):
     #validar si en base de datos ya existe un segmento con la misma 
-    conn = conectar_base_datos()
-
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM validacion_sistema WHERE archivo = ? AND fecha = ?", (archivo, fecha_str))   
-    count = cursor.fetchone()[0]
-    conn.close()    
+    with conexion() as conn:
+        cursor = conn.cursor()
+        # búsqueda por el prefijo (fecha, archivo) de la clave agrupada
+        cursor.execute("SELECT COUNT(*) FROM validacion_sistema WHERE fecha = ? AND archivo = ?", (fecha_str, archivo))   
+        count = cursor.fetchone()[0]
     return count
 
 
 # crear funcion que valide si ya existe un archivo en la tabla archivos
 def validarArchivoExistente(nombreArchivo):
     count = 0
-    conn = conectar_base_datos()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM archivos WHERE archivo = ?", (nombreArchivo))   
-    count = cursor.fetchone()[0]
-    conn.close()    
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM archivos WHERE archivo = ?", (nombreArchivo,))   
+        count = cursor.fetchone()[0]
     return count
 
 #crear función para insertar nombre de archivo
 def insertarArchivo(nombreArchivo):
-    conn_sqlserver = conectar_base_datos()
-    cursor = conn_sqlserver.cursor()
-
-    # ✅ crear tabla si no existe
-    cursor.execute("""
-    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='archivos' AND xtype='U')
-    CREATE TABLE archivos
-    (
-        id INT IDENTITY(1,1) PRIMARY KEY,
-        archivo NVARCHAR(255)
-    );
-    """)
-    conn_sqlserver.commit()
-
-    cantidadArchivos = validarArchivoExistente(nombreArchivo)
-    if cantidadArchivos == 0:
-
-        # insertar nombre de archivo
-        insert_sql = """
-            INSERT INTO archivos (archivo)
-            VALUES (?)
-        """
-
-        cursor.execute(insert_sql, (nombreArchivo,))
-        conn_sqlserver.commit()
-        conn_sqlserver.close()
+    # la tabla y los nombres existentes se resuelven desde la caché de dimensiones
+    if cache_archivos.asegurar([nombreArchivo]):
         print(f"Archivo insertado en archivos_procesados: {nombreArchivo}")
 
 
 # validar si existe Segmento
 def validarSegmentoExistente(nombreSegmento):
     count = 0
-    conn = conectar_base_datos()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM segmento WHERE segmento = ?", (nombreSegmento))   
-    count = cursor.fetchone()[0]
-    conn.close()    
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM segmento WHERE segmento = ?", (nombreSegmento,))   
+        count = cursor.fetchone()[0]
     return count
 
 
 # permite registrar segmento unicos en base de datos
 def insertarSeg(nombreSegmento):
-    conn_sqlserver = conectar_base_datos()
-    cursor = conn_sqlserver.cursor()
-
-    # ✅ crear tabla si no existe
-    cursor.execute("""
-    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='segmento' AND xtype='U')
-    CREATE TABLE segmento
-    (
-        id INT IDENTITY(1,1) PRIMARY KEY,
-        segmento NVARCHAR(255)
-    );
-    """)
-    conn_sqlserver.commit()
-    cantidadSegmentos = validarSegmentoExistente(nombreSegmento)
-    if cantidadSegmentos == 0:
-
-        # insertar nombre de segmento
-        insert_sql = """
-            INSERT INTO segmento (segmento)
-            VALUES (?)
-        """
+    if cache_segmentos.asegurar([nombreSegmento]):
+        print(f"Segmento insertado en segmentos_procesados: {nombreSegmento}")
 
-        cursor.execute(insert_sql, (nombreSegmento,))
-        conn_sqlserver.commit()
-        conn_sqlserver.close()
+
+def registrarSegmentos(nombresSegmentos):
+    # registra en bloque todos los segmentos que falten (una sentencia por lote)
+    insertados = cache_segmentos.asegurar(nombresSegmentos)
+    for nombreSegmento in insertados:
         print(f"Segmento insertado en segmentos_procesados: {nombreSegmento}")
+    return insertados
+
+
+def registrarArchivos(nombresArchivos):
+    insertados = cache_archivos.asegurar(nombresArchivos)
+    for nombreArchivo in insertados:
+        print(f"Archivo insertado en archivos_procesados: {nombreArchivo}")
+    return insertados
 
 
 def obtenerIdSegmento(nombreSegmento):
-    conn_sqlserver = conectar_base_datos()
-    cursor = conn_sqlserver.cursor()
-    cursor.execute("SELECT id FROM segmento WHERE segmento = ?", (nombreSegmento,))
-    segmento_id_row = cursor.fetchone()  
-    segmento_id = segmento_id_row[0] if segmento_id_row else None
-    return segmento_id
+    return cache_segmentos.id(nombreSegmento)
+
+
+def registrarCampos(nombresCampos):
+    # nombres de campo internados en la dimensión campo (sin print: son cientos por reporte)
+    return cache_campos.asegurar(str(n) for n in nombresCampos)
+
+
+def obtenerIdCampo(nombreCampo):
+    return cache_campos.id(str(nombreCampo))
+
+
+def crearTablaValidacionSistema(conn_sqlserver=None, cursor=None):
+    # el esquema lo administran las migraciones de esquema.py
+    asegurar_esquema()
+
+
+def obtenerIdArchivo(cursor, nombreArchivo):
+    # en vez de ser nombreArchivo un INT, debería ser el ID del archivo en la tabla archivos
+    archivoNombre = nombreArchivo.replace(".TXT", "")
+    archivo_id = cache_archivos.id(archivoNombre)
+
+    print(f"Archivo ID para {archivoNombre}: {archivo_id}")
+    return archivo_id
+
+
+def obtenerIdsSegmentos(cursor=None):
+    # todos los ids de segmento, servidos desde la caché (un SELECT al calentarla)
+    return cache_segmentos.ids()
+
+
+def obtenerIdsCampos():
+    return cache_campos.ids()
 
 
 def insertarValidacionSistema(fechaActual, nombreArchivo, diccionarioSegmentos):
@@ -362,96 +1127,592 @@ def insertarValidacionSistema(fechaActual, nombreArchivo, diccionarioSegmentos):
       }
     """
 
-    conn_sqlserver = conectar_base_datos()
-    cursor = conn_sqlserver.cursor()
-
-    # ✅ crear tabla si no existe (corregido: valida el nombre correcto)
-    cursor.execute("""
-    IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='validacion_sistema' AND xtype='U')
-    CREATE TABLE validacion_sistema
-    (
-        id INT IDENTITY(1,1) PRIMARY KEY,
-        archivo INT,
-        segmento INT,
-        campo NVARCHAR(255),
-        valor NVARCHAR(MAX),
-        fecha DATE
-    );
-    """)
-    conn_sqlserver.commit()
-
-    # índice para mejorar consultas por fecha
-    cursor.execute("""
-    IF NOT EXISTS (
-        SELECT * FROM sys.indexes
-        WHERE name = 'IX_validacion_sistema_fecha'
-          AND object_id = OBJECT_ID('validacion_sistema')
-    )
-    CREATE INDEX IX_validacion_sistema_fecha ON validacion_sistema(fecha);
-    """)
-    conn_sqlserver.commit()
+    with conexion() as conn_sqlserver:
+        cursor = conn_sqlserver.cursor()
 
+        crearTablaValidacionSistema(conn_sqlserver, cursor)
 
-    # en vez de ser nombreArchivo un INT, debería ser el ID del archivo en la tabla archivos
-    archivoNombre = nombreArchivo.replace(".TXT", "")
-    cursor.execute("SELECT id FROM archivos WHERE archivo = ?", (archivoNombre,))
-    archivo_id_row = cursor.fetchone()  
-    archivo_id = archivo_id_row[0] if archivo_id_row else None
+        archivo_id = obtenerIdArchivo(cursor, nombreArchivo)
 
-    print(f"Archivo ID para {archivoNombre}: {archivo_id}")
-    
+        # ✅ tu validación de duplicado por archivo+fecha
+        cantidadRegFechaActual = validarArchivoFecha(archivo_id, fechaActual)
+        print(f"Cantidad de registros para la fecha {fechaActual} y archivo {nombreArchivo}: {cantidadRegFechaActual}")
 
-    # ✅ tu validación de duplicado por archivo+fecha
-    cantidadRegFechaActual = validarArchivoFecha(archivo_id, fechaActual)
-    print(f"Cantidad de registros para la fecha {fechaActual} y archivo {nombreArchivo}: {cantidadRegFechaActual}")
+        if cantidadRegFechaActual > 0:
+            print(f"Ya existen segmentos registrados para la fecha {fechaActual} y archivo {nombreArchivo}. No se insertarán nuevos registros.")
+            return
 
-    if cantidadRegFechaActual > 0:
-        print(f"Ya existen segmentos registrados para la fecha {fechaActual} y archivo {nombreArchivo}. No se insertarán nuevos registros.")
-        conn_sqlserver.close()
-        return
+        print(f"Insertando nuevos segmentos para la fecha {fechaActual} y archivo {nombreArchivo}...")
 
-    print(f"Insertando nuevos segmentos para la fecha {fechaActual} y archivo {nombreArchivo}...")
+        insert_sql = """
+            INSERT INTO validacion_sistema (archivo, segmento, campo, valor, valor_num, valor_fecha, tipo_valor, fecha)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """
 
-    insert_sql = """
-        INSERT INTO validacion_sistema (archivo, segmento, campo, valor, fecha)
-        VALUES (?, ?, ?, ?, ?)
-    """
+        filas_insertadas = 0
+        detalle_filas = log.isEnabledFor(logging.DEBUG)
 
-    filas_insertadas = 0
+        # ✅ recorrer: titulo -> {campo:valor}
+        for titulo, campos in diccionarioSegmentos.items():
 
-    # ✅ recorrer: titulo -> {campo:valor}
-    for titulo, campos in diccionarioSegmentos.items():
+            # Segmento tabla (vacío) => por ahora no insertamos detalle
+            if not campos:
+                # Si quieres registrar que existe el segmento aunque no tenga detalle, descomenta:
+                # cursor.execute(insert_sql, (nombreArchivo, titulo, "__TABLE__", "__NO_DETAIL__", fechaActual))
+                # filas_insertadas += 1
+                continue
 
-        # Segmento tabla (vacío) => por ahora no insertamos detalle
-        if not campos:
-            # Si quieres registrar que existe el segmento aunque no tenga detalle, descomenta:
-            # cursor.execute(insert_sql, (nombreArchivo, titulo, "__TABLE__", "__NO_DETAIL__", fechaActual))
-            # filas_insertadas += 1
-            continue
+            # campos debe ser dict
+            if not isinstance(campos, Mapping):
+                # por si llega algo raro
+                continue
+
+            for campo, valor in campos.items():
+                # Normalizar valor a string (por seguridad)
+                if valor is None:
+                    valor = ""
+                else:
+                    valor = str(valor)
+
+                #obtener el id del segmento en base a su nombre
+                segmento_id = obtenerIdSegmento(titulo)
 
-        # campos debe ser dict
-        if not isinstance(campos, dict):
-            # por si llega algo raro
+                # detalle por fila solo con --nivel-log DEBUG (formatearlo siempre frena las cargas grandes)
+                if detalle_filas:
+                    log.debug("Archivo: %s, Segmento: %s, Campo: %s, Valor: %s", nombreArchivo, titulo, campo, valor)
+                normalizado = normalizar_valor(valor)
+                cursor.execute(insert_sql, (archivo_id, segmento_id, obtenerIdCampo(campo), valor, normalizado.numero, normalizado.fecha, normalizado.tipo, fechaActual))
+                filas_insertadas += 1
+
+        conn_sqlserver.commit()
+        contar("bd_sentencias", filas_insertadas)
+        contar("filas_insertadas", filas_insertadas)
+        print(f"Inserción completada. Filas insertadas: {filas_insertadas}")
+
+
+# filas por lote (executemany + commit) en la carga masiva
+TAMANO_LOTE_CARGA = 1000
+
+
+def filasValidacionSistema(fechaActual, archivo_id, diccionarioSegmentos, ids_segmentos, ids_campos):
+    # mismas reglas que insertarValidacionSistema, sin consultas por campo.
+    # Las dimensiones deben estar registradas antes (cargar_reporte): un
+    # segmento o campo sin id es un error, no una fila con NULL
+    filas = []
+    for titulo, campos in diccionarioSegmentos.items():
+        if not campos or not isinstance(campos, Mapping):
             continue
 
+        segmento_id = ids_segmentos.get(titulo)
+        if segmento_id is None:
+            raise ValueError(f"Segmento sin registrar en la tabla segmento: {titulo!r}")
         for campo, valor in campos.items():
-            # Normalizar valor a string (por seguridad)
-            if valor is None:
-                valor = ""
-            else:
-                valor = str(valor)
+            campo_id = ids_campos.get(str(campo))
+            if campo_id is None:
+                raise ValueError(f"Campo sin registrar en la tabla campo: {campo!r} (segmento {titulo!r})")
+            valor = "" if valor is None else str(valor)
+            normalizado = normalizar_valor(valor)
+            filas.append((
+                archivo_id, segmento_id, campo_id, valor,
+                normalizado.numero, normalizado.fecha, normalizado.tipo, fechaActual,
+            ))
+    return filas
+
+
+INSERT_CARGA_SQL = """
+    INSERT INTO validacion_sistema_carga (lote, archivo, segmento, campo, valor, valor_num, valor_fecha, tipo_valor, fecha)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# deduplicación set-based: una sola sentencia contra la clave agrupada;
+# UPDLOCK/HOLDLOCK evita que dos cargas simultáneas inserten la misma fila
+PUBLICAR_CARGA_SQL = """
+    INSERT INTO validacion_sistema (archivo, segmento, campo, valor, valor_num, valor_fecha, tipo_valor, fecha)
+    SELECT c.archivo, c.segmento, c.campo, c.valor, c.valor_num, c.valor_fecha, c.tipo_valor, c.fecha
+    FROM validacion_sistema_carga c
+    WHERE c.lote = ?
+      AND NOT EXISTS (
+          SELECT 1 FROM validacion_sistema v WITH (UPDLOCK, HOLDLOCK)
+          WHERE v.fecha = c.fecha AND v.archivo = c.archivo
+            AND v.segmento = c.segmento AND v.campo = c.campo
+      );
+"""
+
+
+# =========================
+# DIARIO DE CARGA Y CHECKPOINTS
+# =========================
+# La carga masiva deja rastro en carga_diario (una fila por lote) y en
+# carga_checkpoint (una fila por trozo confirmado en el staging). Si la
+# corrida se corta, la siguiente carga del mismo reporte y fecha con el
+# mismo contenido retoma el lote en el primer trozo sin checkpoint; un
+# corte de red durante la carga se reintenta ahí mismo con otra conexión.
+REINTENTOS_CARGA = 3
+ESPERA_REINTENTO = 2.0  # segundos, se duplica en cada intento
+
+ESTADO_CARGANDO = "cargando"
+ESTADO_PUBLICADA = "publicada"
+ESTADO_ABANDONADA = "abandonada"
+
+BUSCAR_DIARIO_SQL = """
+    SELECT TOP 1 lote, huella, tamano_trozo, estado, filas_distintas FROM carga_diario WITH (UPDLOCK, HOLDLOCK)
+    WHERE archivo = ? AND fecha = ? AND estado IN ('cargando', 'publicada')
+    ORDER BY iniciada DESC, id DESC
+"""
+
+INICIAR_DIARIO_SQL = """
+    INSERT INTO carga_diario (lote, archivo, fecha, huella, tamano_trozo, total_trozos, total_filas, estado)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 'cargando')
+"""
+
+CHECKPOINT_SQL = "INSERT INTO carga_checkpoint (lote, trozo, filas) VALUES (?, ?, ?)"
+
+# filas de (fecha, archivo) en el destino: prefijo de la clave agrupada
+CONTAR_PUBLICADAS_SQL = "SELECT COUNT(*) FROM validacion_sistema WHERE fecha = ? AND archivo = ?"
+
+# filas del lote cuya clave ya está publicada con otro valor: PUBLICAR_CARGA_SQL
+# no las pisa (EXCEPT compara NULL como igual a NULL)
+CONTAR_DISTINTAS_SQL = """
+    SELECT COUNT(*)
+    FROM validacion_sistema_carga c
+    JOIN validacion_sistema v WITH (UPDLOCK, HOLDLOCK)
+      ON v.fecha = c.fecha AND v.archivo = c.archivo
+     AND v.segmento = c.segmento AND v.campo = c.campo
+    WHERE c.lote = ?
+      AND EXISTS (SELECT v.valor EXCEPT SELECT c.valor)
+"""
+
+
+class LoteCarga(NamedTuple):
+    lote: str
+    confirmados: frozenset  # trozos ya en el staging
+    publicada: bool
+    distintas: int = 0  # de la publicación anterior, si ya está publicada
+
+
+class PublicacionLote(NamedTuple):
+    insertadas: int
+    distintas: int  # ya publicadas con otro valor: conservan el anterior
+
+
+def huella_filas(filas) -> str:
+    h = hashlib.sha256()
+    for fila in filas:
+        h.update(repr(fila).encode("utf-8"))
+    return h.hexdigest()
+
+
+def con_reintentos(funcion, descripcion):
+    """Ejecuta funcion(); ante un error de conexión espera y reintenta (cada intento con otra conexión del pool)."""
+    for intento in range(REINTENTOS_CARGA + 1):
+        try:
+            return funcion()
+        except ERRORES_CONEXION as e:
+            if intento == REINTENTOS_CARGA:
+                raise
+            espera = ESPERA_REINTENTO * 2 ** intento
+            contar("bd_reintentos")
+            print(f"❌ {descripcion}: {type(e).__name__}: {e}. Reintento {intento + 1}/{REINTENTOS_CARGA} en {espera:.0f} s")
+            time.sleep(espera)
+
+
+def abrirLoteCarga(archivo_id, fechaActual, huella, tamanoLote, total_trozos, total_filas,
+                   forzar=False) -> LoteCarga:
+    """
+    Lote de staging para (archivo, fecha): el mismo lote sin publicar si el
+    contenido no cambió (con sus trozos confirmados), o uno nuevo. Un lote
+    sin publicar de otro contenido se abandona y se limpia.
+
+    Una carga ya publicada con el mismo contenido no se repite mientras
+    validacion_sistema conserve al menos total_filas filas de ese archivo y
+    fecha; si se borraron (o con forzar=True) se abre un lote nuevo y la
+    publicación repone solo las que faltan.
+    """
+    with conexion() as conn_sqlserver:
+        cursor = conn_sqlserver.cursor()
+        try:
+            cursor.execute(BUSCAR_DIARIO_SQL, (archivo_id, fechaActual))
+            fila = cursor.fetchone()
+            if fila is not None:
+                lote, huella_previa, tamano_previo, estado, distintas = fila
+                if huella_previa == huella and estado == ESTADO_PUBLICADA and not forzar:
+                    cursor.execute(CONTAR_PUBLICADAS_SQL, (fechaActual, archivo_id))
+                    if cursor.fetchone()[0] >= total_filas:
+                        conn_sqlserver.commit()
+                        return LoteCarga(lote, frozenset(), True, distintas or 0)
+                if huella_previa == huella and tamano_previo == tamanoLote and estado == ESTADO_CARGANDO:
+                    cursor.execute("SELECT trozo FROM carga_checkpoint WHERE lote = ?", (lote,))
+                    confirmados = frozenset(t for (t,) in cursor.fetchall())
+                    conn_sqlserver.commit()
+                    return LoteCarga(lote, confirmados, False)
+                if estado == ESTADO_CARGANDO:
+                    cursor.execute("DELETE FROM validacion_sistema_carga WHERE lote = ?", (lote,))
+                    cursor.execute("DELETE FROM carga_checkpoint WHERE lote = ?", (lote,))
+                    cursor.execute(
+                        "UPDATE carga_diario SET estado = 'abandonada', actualizada = SYSUTCDATETIME() WHERE lote = ?",
+                        (lote,),
+                    )
+
+            lote = str(uuid.uuid4())
+            cursor.execute(
+                INICIAR_DIARIO_SQL,
+                (lote, archivo_id, fechaActual, huella, tamanoLote, total_trozos, total_filas),
+            )
+            conn_sqlserver.commit()
+            return LoteCarga(lote, frozenset(), False)
+        except Exception:
+            conn_sqlserver.rollback()
+            raise
+
+
+def confirmarTrozo(lote, trozo, filas):
+    # filas del trozo + su checkpoint en una transacción: o están los dos o ninguno
+    with conexion() as conn_sqlserver:
+        cursor = conn_sqlserver.cursor()
+        try:
+            cursor.execute("SELECT 1 FROM carga_checkpoint WHERE lote = ? AND trozo = ?", (lote, trozo))
+            if cursor.fetchone() is not None:
+                # el commit anterior llegó aunque la respuesta se perdió
+                conn_sqlserver.rollback()
+                return
+            cursor.fast_executemany = True
+            cursor.executemany(INSERT_CARGA_SQL, [(lote, *fila) for fila in filas])
+            cursor.execute(CHECKPOINT_SQL, (lote, trozo, len(filas)))
+            conn_sqlserver.commit()
+        except Exception:
+            conn_sqlserver.rollback()
+            raise
+
+
+def publicarLote(lote) -> PublicacionLote:
+    """
+    Pasa el lote a validacion_sistema y lo cierra en una transacción.
+    Devuelve las filas insertadas y las que ya estaban publicadas con otro
+    valor (no se actualizan: quedan contadas en el diario).
+    """
+    with conexion() as conn_sqlserver:
+        cursor = conn_sqlserver.cursor()
+        try:
+            cursor.execute(
+                "SELECT estado, filas_publicadas, filas_distintas FROM carga_diario WITH (UPDLOCK) WHERE lote = ?",
+                (lote,),
+            )
+            fila = cursor.fetchone()
+            if fila is not None and fila[0] == ESTADO_PUBLICADA:
+                conn_sqlserver.rollback()
+                return PublicacionLote(fila[1] or 0, fila[2] or 0)
+
+            cursor.execute(CONTAR_DISTINTAS_SQL, (lote,))
+            distintas = cursor.fetchone()[0]
+            cursor.execute(PUBLICAR_CARGA_SQL, (lote,))
+            insertadas = max(cursor.rowcount, 0)
+            cursor.execute("DELETE FROM validacion_sistema_carga WHERE lote = ?", (lote,))
+            cursor.execute("DELETE FROM carga_checkpoint WHERE lote = ?", (lote,))
+            cursor.execute(
+                "UPDATE carga_diario SET estado = 'publicada', filas_publicadas = ?, filas_distintas = ?, "
+                "actualizada = SYSUTCDATETIME() WHERE lote = ?",
+                (insertadas, distintas, lote),
+            )
+            conn_sqlserver.commit()
+            return PublicacionLote(insertadas, distintas)
+        except Exception:
+            conn_sqlserver.rollback()
+            raise
+
+
+def insertarValidacionSistemaMasivo(fechaActual, nombreArchivo, diccionarioSegmentos, tamanoLote=TAMANO_LOTE_CARGA,
+                                    forzar=False):
+    """
+    Carga masiva de validacion_sistema con checkpoints: resuelve los ids
+    de segmento y campo desde las cachés y envía las filas al staging
+    (validacion_sistema_carga) en trozos de tamanoLote, cada uno confirmado
+    con su checkpoint. Con todos los trozos en el staging, un único
+    INSERT ... SELECT (que omite las filas que ya existen para la misma
+    fecha, archivo, segmento y campo) los publica en una transacción. Las
+    que ya existen con otro valor no se actualizan: se cuentan en
+    filas_distintas y se informan.
+
+    Si una corrida anterior quedó a medias con el mismo contenido, se
+    reanuda en el primer trozo sin checkpoint; si ya se publicó y sus filas
+    siguen en validacion_sistema, no se repite (todas cuentan como
+    duplicadas) salvo con forzar=True. Devuelve la cantidad de filas insertadas.
+    """
+    crearTablaValidacionSistema()
+
+    archivo_id = obtenerIdArchivo(None, nombreArchivo)
+    filas = filasValidacionSistema(
+        fechaActual, archivo_id, diccionarioSegmentos, obtenerIdsSegmentos(), obtenerIdsCampos()
+    )
+    tamanoLote = max(1, tamanoLote)
+    trozos = [filas[i:i + tamanoLote] for i in range(0, len(filas), tamanoLote)]
+    inicio = time.perf_counter()
+
+    carga = con_reintentos(
+        lambda: abrirLoteCarga(
+            archivo_id, fechaActual, huella_filas(filas), tamanoLote, len(trozos), len(filas), forzar
+        ),
+        f"Diario de carga de {nombreArchivo}",
+    )
+    if carga.publicada:
+        # una recarga completamente deduplicada, no una carga vacía
+        metricas_actuales().sumar_tiempo("bd_insercion", time.perf_counter() - inicio)
+        contar("filas_insertadas", 0)
+        contar("filas_duplicadas", len(filas) - carga.distintas)
+        contar("filas_distintas", carga.distintas)
+        print(f"Carga de {nombreArchivo} para {fechaActual} ya publicada con el mismo contenido. No se repite.")
+        if carga.distintas:
+            print(f"❌ {carga.distintas} filas de esa publicación no se actualizaron: la fecha conserva los valores anteriores")
+        return 0
+    if carga.confirmados:
+        contar("trozos_reanudados", len(carga.confirmados))
+        print(f"Reanudando carga de {nombreArchivo}: {len(carga.confirmados)}/{len(trozos)} trozos ya en staging")
+
+    for n, trozo in enumerate(trozos):
+        if n in carga.confirmados:
+            continue
+        con_reintentos(
+            lambda: confirmarTrozo(carga.lote, n, trozo),
+            f"Trozo {n + 1}/{len(trozos)} de {nombreArchivo}",
+        )
+        contar("bd_lotes")
+
+    insertadas, distintas = con_reintentos(lambda: publicarLote(carga.lote), f"Publicación de {nombreArchivo}")
+
+    segundos = time.perf_counter() - inicio
+    metricas_actuales().sumar_tiempo("bd_insercion", segundos)
+    contar("filas_insertadas", insertadas)
+    contar("filas_duplicadas", len(filas) - insertadas - distintas)
+    contar("filas_distintas", distintas)
+
+    filas_por_segundo = len(filas) / segundos if segundos > 0 else float(len(filas))
+    if distintas:
+        # otro contenido para una fecha ya publicada: la fecha conserva los valores anteriores
+        print(
+            f"❌ Carga de {nombreArchivo} para {fechaActual} incompleta: {distintas} filas ya publicadas "
+            f"con otro valor no se actualizaron. Insertadas: {insertadas}, sin cambios: "
+            f"{len(filas) - insertadas - distintas} en {segundos:.2f} s"
+        )
+        return insertadas
+    print(f"Inserción masiva completada para {nombreArchivo}. Filas insertadas: {insertadas}, ya existentes: {len(filas) - insertadas} en {segundos:.2f} s ({filas_por_segundo:,.0f} filas/s)")
+    return insertadas
+
+
+# segmentos que no se cargan (títulos de formato "0", pools y totales)
+PREFIJOS_EXCLUIR = ("0", "Pool Number :", "Totals")
+
+
+# sufijo que parse_cicsadm agrega a los títulos repetidos
+_RE_SUFIJO_REPETIDO = re.compile(r" \(\d+\)$")
 
-            #obtener el id del segmento en base a su nombre
-            segmento_id = obtenerIdSegmento(titulo)
 
-            #print debug opcional
-            print(f"Archivo: {nombreArchivo}, Segmento: {titulo}, Campo: {campo}, Valor: {valor}")
-            cursor.execute(insert_sql, (archivo_id, segmento_id, str(campo), valor, fechaActual))
-            filas_insertadas += 1
+def titulo_base(clave: str) -> str:
+    # "Dispatcher (2)" -> "Dispatcher"
+    return _RE_SUFIJO_REPETIDO.sub("", clave)
 
-    conn_sqlserver.commit()
-    conn_sqlserver.close()
-    print(f"Inserción completada. Filas insertadas: {filas_insertadas}")
+
+class SelectorSegmentos:
+    """
+    Qué segmentos se parsean, por título: nombres exactos, prefijos o
+    expresiones regulares (re.search), para incluir y para excluir.
+
+    - Sin criterios de inclusión se incluye todo lo que no se excluye.
+    - La exclusión gana sobre la inclusión.
+    - Los nombres exactos aceptan también la clave con sufijo de
+      parse_cicsadm ("Dispatcher (2)" coincide con "Dispatcher").
+
+    Se pasa al parser (parse_cicsadm(..., selector=...)): un segmento
+    excluido se salta hasta el siguiente límite sin partir columnas ni
+    parsear clave/valor.
+    """
+
+    def __init__(self, incluir=(), incluir_prefijos=(), incluir_regex=(),
+                 excluir=(), excluir_prefijos=(), excluir_regex=()):
+        self.incluir = frozenset(incluir)
+        self.incluir_prefijos = tuple(incluir_prefijos)
+        self.incluir_regex = tuple(re.compile(r) for r in incluir_regex)
+        self.excluir = frozenset(excluir)
+        self.excluir_prefijos = tuple(excluir_prefijos)
+        self.excluir_regex = tuple(re.compile(r) for r in excluir_regex)
+        self._con_inclusion = bool(self.incluir or self.incluir_prefijos or self.incluir_regex)
+        # los títulos se repiten en cada página: la decisión se memoriza
+        self._decisiones: dict[str, bool] = {}
+
+    @classmethod
+    def desde_dict(cls, config: dict) -> "SelectorSegmentos":
+        """
+        {"incluir": {"nombres": [...], "prefijos": [...], "regex": [...]},
+         "excluir": {...}}  (todas las claves son opcionales)
+        """
+        incluir = config.get("incluir", {})
+        excluir = config.get("excluir", {})
+        return cls(
+            incluir.get("nombres", ()), incluir.get("prefijos", ()), incluir.get("regex", ()),
+            excluir.get("nombres", ()), excluir.get("prefijos", ()), excluir.get("regex", ()),
+        )
+
+    @classmethod
+    def desde_archivo(cls, ruta: Path) -> "SelectorSegmentos":
+        return cls.desde_dict(json.loads(Path(ruta).read_text(encoding="utf-8")))
+
+    def a_dict(self) -> dict:
+        """Inverso de desde_dict, con listas ordenadas (comparable entre corridas)."""
+        return {
+            "incluir": {
+                "nombres": sorted(self.incluir),
+                "prefijos": sorted(self.incluir_prefijos),
+                "regex": sorted(r.pattern for r in self.incluir_regex),
+            },
+            "excluir": {
+                "nombres": sorted(self.excluir),
+                "prefijos": sorted(self.excluir_prefijos),
+                "regex": sorted(r.pattern for r in self.excluir_regex),
+            },
+        }
+
+    def ampliar(self, incluir=(), excluir_prefijos=()) -> "SelectorSegmentos":
+        """Copia con nombres a incluir y prefijos a excluir agregados."""
+        return SelectorSegmentos(
+            self.incluir | set(incluir), self.incluir_prefijos, [r.pattern for r in self.incluir_regex],
+            self.excluir, self.excluir_prefijos + tuple(excluir_prefijos), [r.pattern for r in self.excluir_regex],
+        )
+
+    @staticmethod
+    def _coincide(titulo: str, nombres, prefijos, expresiones) -> bool:
+        if titulo in nombres or (nombres and titulo_base(titulo) in nombres):
+            return True
+        if prefijos and titulo.startswith(prefijos):
+            return True
+        return any(r.search(titulo) for r in expresiones)
+
+    def acepta(self, titulo: str) -> bool:
+        decision = self._decisiones.get(titulo)
+        if decision is None:
+            decision = not self._coincide(titulo, self.excluir, self.excluir_prefijos, self.excluir_regex) and (
+                not self._con_inclusion
+                or self._coincide(titulo, self.incluir, self.incluir_prefijos, self.incluir_regex)
+            )
+            self._decisiones[titulo] = decision
+        return decision
+
+
+# selección por defecto de la carga: la misma que filtrar_segmentos
+SELECTOR_POR_DEFECTO = SelectorSegmentos(excluir_prefijos=PREFIJOS_EXCLUIR)
+
+
+def filtrar_segmentos(data: dict, selector: SelectorSegmentos = SELECTOR_POR_DEFECTO) -> dict:
+    # para dicts ya parseados (JSON existentes); al parsear, pasar el selector a parse_cicsadm
+    return {
+        k: v
+        for k, v in data.items()
+        if selector.acepta(k)
+    }
+
+
+# formatos de exportación JSON: "ninguno" deja el pipeline solo en memoria
+FORMATO_JSON_INDENTADO = "indentado"
+FORMATO_JSON_COMPACTO = "compacto"
+FORMATO_JSON_NINGUNO = "ninguno"
+FORMATOS_JSON = (FORMATO_JSON_INDENTADO, FORMATO_JSON_COMPACTO, FORMATO_JSON_NINGUNO)
+
+
+def exportar_json(data: dict, salida_path: Path, formato: str = FORMATO_JSON_INDENTADO) -> None:
+    if isinstance(data, ReporteCompacto):
+        data = data.a_dict()
+    if formato == FORMATO_JSON_COMPACTO:
+        texto = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    else:
+        texto = json.dumps(data, indent=2, ensure_ascii=False)
+    salida_path.write_text(texto, encoding="utf-8")
+
+
+def procesar_reporte(archivo_path: Path, directorio_salida: Path | None = None,
+                     formato_json: str = FORMATO_JSON_INDENTADO, fusionar_fragmentos: bool = False,
+                     selector: SelectorSegmentos = SELECTOR_POR_DEFECTO, compacto: bool = False,
+                     tablas: bool = False) -> dict:
+    """
+    Pipeline completo de un reporte: parseo (con el selector) -> JSON (opcional).
+    Con compacto=True resumen["data"] es un ReporteCompacto (misma lectura,
+    menos memoria y un pickle más chico al volver del proceso de parseo).
+    Con tablas=True los segmentos tabulares traen sus filas como campos.
+    Se ejecuta en un proceso independiente en modo paralelo, por eso no
+    imprime nada y devuelve un resumen (picklable) del resultado. El dict
+    filtrado viaja en resumen["data"] para las etapas de BD, sin releer
+    el JSON.
+    """
+    inicio = time.perf_counter()
+    resumen = {
+        "archivo": archivo_path.name,
+        "ok": False,
+        "segmentos": 0,
+        "region": None,
+        "json": None,
+        "error": None,
+        "segundos": 0.0,
+        "data": None,
+        "firma": None,
+    }
+
+    with recolectar() as metricas:
+        try:
+            # antes de parsear: es la versión que se carga (el manifiesto la registra)
+            resumen["firma"] = firma_archivo(archivo_path)
+
+            # los segmentos que el selector excluye no llegan a parsearse
+            with etapa("parseo"):
+                parsear = parse_cicsadm_compacto if compacto else parse_cicsadm
+                if detalle_activo():
+                    with instrumentar(sys.modules[__name__]):
+                        data = parsear(archivo_path, fusionar_fragmentos, selector=selector, tablas=tablas)
+                else:
+                    data = parsear(archivo_path, fusionar_fragmentos, selector=selector, tablas=tablas)
+
+            if directorio_salida is not None and formato_json != FORMATO_JSON_NINGUNO:
+                salida_path = directorio_salida / (nombre_base_reporte(archivo_path.name) + ".JSON")
+                with etapa("serializacion"):
+                    exportar_json(data, salida_path, formato_json)
+                resumen["json"] = str(salida_path)
+
+            resumen["ok"] = True
+            resumen["segmentos"] = len(data)
+            resumen["region"] = obtener_region(archivo_path)
+            resumen["data"] = data
+            contar("segmentos", len(data))
+            contar("campos", sum(len(campos) for campos in data.values()))
+
+        except Exception as e:
+            resumen["error"] = f"{type(e).__name__}: {e}"
+            contar("reportes_con_error")
+
+        contar("reportes")
+
+    resumen["segundos"] = time.perf_counter() - inicio
+    # métricas del reporte (picklables): main las suma al recolector de la ejecución
+    resumen["metricas"] = metricas.instantanea()
+    return resumen
+
+
+def cargar_reporte(nombreArchivo, data, fechaActual, tamanoLote=TAMANO_LOTE_CARGA, forzar=False):
+    """
+    Etapas de BD de un reporte ya parseado y filtrado, directamente desde
+    memoria: registro de segmentos -> registro de archivo -> campos.
+    forzar=True vuelve a publicar aunque el diario ya tenga la carga.
+    """
+    with etapa("bd_dimensiones"):
+        registrarSegmentos(data.keys())
+        registrarArchivos([nombreArchivo])
+        registrarCampos(campo for campos in data.values() if isinstance(campos, Mapping) for campo in campos)
+
+    if tamanoLote > 0:
+        return insertarValidacionSistemaMasivo(fechaActual, nombreArchivo, data, tamanoLote, forzar)
+    with etapa("bd_insercion"):
+        insertarValidacionSistema(fechaActual, nombreArchivo, data)
+
+
+def imprimir_segmentos(nombreArchivo, data):
+    print(f"Listado de segmentos en {nombreArchivo}:")
+    for segmento in data.keys():
+        print(f" - {segmento}")
+    print("\n")
 
 
 def eliminar_segmentos_formato_0(DIRECTORIO_SALIDA):
@@ -468,13 +1729,7 @@ def eliminar_segmentos_formato_0(DIRECTORIO_SALIDA):
         try:
             data = json.loads(json_path.read_text(encoding="utf-8"))
 
-            prefijos_excluir = ("0", "Pool Number :", "Totals")
-
-            data = {
-                k: v
-                for k, v in data.items()
-                if not k.startswith(prefijos_excluir)
-            }
+            data = filtrar_segmentos(data)
 
             json_path.write_text(
                 json.dumps(data, indent=2, ensure_ascii=False),
@@ -487,8 +1742,13 @@ def eliminar_segmentos_formato_0(DIRECTORIO_SALIDA):
             print(f"❌ Error eliminando segmentos en {archivo_json}: {e}")
 
 
-def insertar_desde_json_generados(DIRECTORIO_SALIDA, fechaActual):
+def insertar_desde_json_generados(DIRECTORIO_SALIDA, fechaActual, tamanoLote=TAMANO_LOTE_CARGA, archivos=None):
+    # tamanoLote <= 0 usa la inserción fila por fila
+    # archivos: nombres de reporte (sin extensión) a cargar; None = todos los JSON
+    # devuelve los nombres cargados sin error
     archivos_json = os.listdir(DIRECTORIO_SALIDA)
+    seleccion = None if archivos is None else {a.upper() for a in archivos}
+    cargados = []
 
     for archivo_json in archivos_json:
         archivo_json = archivo_json.upper()
@@ -496,6 +1756,9 @@ def insertar_desde_json_generados(DIRECTORIO_SALIDA, fechaActual):
         if not archivo_json.endswith(".JSON"):
             continue
 
+        if seleccion is not None and archivo_json[:-5] not in seleccion:
+            continue
+
         json_path = DIRECTORIO_SALIDA / archivo_json
 
         try:
@@ -506,11 +1769,15 @@ def insertar_desde_json_generados(DIRECTORIO_SALIDA, fechaActual):
             nombreArchivo = archivo_json.replace(".JSON", "")
 
             print(f"Insertando segmentos desde: {archivo_json}")
-            insertarValidacionSistema(fechaActual, nombreArchivo, data)
+            # registra segmentos, archivo y campos del JSON antes de insertar
+            cargar_reporte(nombreArchivo, data, fechaActual, tamanoLote)
+            cargados.append(nombreArchivo)
 
         except Exception as e:
             print(f"❌ Error insertando desde {archivo_json}: {e}")
 
+    return cargados
+
 
 
 def obtener_segmentos_por_archivo(DIRECTORIO_SALIDA, archivos_reportes):
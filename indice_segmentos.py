@@ -0,0 +1,361 @@
+import argparse
+import codecs
+import json
+import locale
+import mmap
+import os
+import re
+from bisect import bisect_left
+from pathlib import Path
+from funciones import *
+
+
+# =========================
+# ÍNDICE DE SEGMENTOS
+# =========================
+VERSION_INDICE = 1
+SUFIJO_INDICE = ".idx.json"
+
+# saltos de línea ASCII que str.splitlines() reconoce ("\r\n" cuenta como uno)
+_SALTOS = rb"\n\r\x0b\x0c\x1c\x1d\x1e"
+_RE_SALTO = re.compile(rb"\r\n|[" + _SALTOS + rb"]")
+
+# prefiltro sobre bytes: líneas que podrían ser banda de inicio, fin de
+# segmento o encabezado de página (la clasificación exacta se hace después
+# decodificando solo esas líneas con clasificar_linea)
+_RE_CANDIDATA = re.compile(
+    rb"(?<![^" + _SALTOS + rb"])"
+    rb"(?:\+_|[ \t\x1f\x80-\xff]*[0-9\x80-\xff])"
+    rb"[^" + _SALTOS + rb"]*"
+)
+
+# si "\n" es el único salto alcanza con buscar textos fijos, mucho más
+# rápido que probar el patrón en cada línea: toda banda empieza con "+_",
+# todo fin contiene 20 caracteres "0-" seguidos y todo encabezado "Applid"
+_MARCAS_LF = (
+    re.compile(rb"\n\+_"),
+    re.compile(rb"0-[0-]{18}"),
+    re.compile(rb"Applid"),
+)
+_OTROS_SALTOS = (b"\x0b", b"\x0c", b"\x1c", b"\x1d", b"\x1e")
+_RE_CR_SUELTO = re.compile(rb"\r(?!\n)")
+
+
+def _solo_saltos_lf(mm) -> bool:
+    return not any(mm.find(s) != -1 for s in _OTROS_SALTOS) and not _RE_CR_SUELTO.search(mm)
+
+
+def _lineas_candidatas(mm):
+    # (desplazamiento, bytes) de las líneas candidatas, en orden
+    if not _solo_saltos_lf(mm):
+        for m in _RE_CANDIDATA.finditer(mm):
+            yield m.start(), m.group()
+        return
+
+    total = len(mm)
+    inicios = {0} if mm[:2] == b"+_" else set()
+    for marca in _MARCAS_LF:
+        for m in marca.finditer(mm):
+            # +1: la marca de bandas empieza en el propio "\n"
+            inicios.add(mm.rfind(b"\n", 0, m.start() + 1) + 1)
+    for inicio in sorted(inicios):
+        fin = mm.find(b"\n", inicio)
+        yield inicio, mm[inicio:total if fin == -1 else fin]
+
+
+# saltos de línea fuera de ASCII según la codificación del reporte; si
+# aparecen, los desplazamientos por bytes no coinciden con las líneas del parser
+_SALTOS_NO_ASCII = {
+    "utf-8": (b"\xc2\x85", b"\xe2\x80\xa8", b"\xe2\x80\xa9"),
+    "iso8859-1": (b"\x85",),
+    "cp1252": (),
+    "ascii": (),
+}
+
+
+def codificacion_reportes() -> str:
+    # la misma que usa open() en iterar_lineas
+    return codecs.lookup(locale.getpreferredencoding(False)).name
+
+
+def ruta_indice(ruta: Path, directorio_indices: Path | None = None) -> Path:
+    ruta = Path(ruta)
+    directorio = ruta.parent if directorio_indices is None else Path(directorio_indices)
+    return directorio / (ruta.name + SUFIJO_INDICE)
+
+
+def _lineas_desde(mm, inicio: int, codificacion: str):
+    # (desplazamiento, línea) a partir de `inicio`, decodificando de a una
+    pos = inicio
+    total = len(mm)
+    while pos < total:
+        m = _RE_SALTO.search(mm, pos)
+        fin, siguiente = (m.start(), m.end()) if m else (total, total)
+        yield pos, mm[pos:fin].decode(codificacion, "ignore")
+        pos = siguiente
+
+
+def _decodificar(mm, inicio: int, fin: int, codificacion: str) -> list[str]:
+    return mm[inicio:fin].decode(codificacion, "ignore").splitlines()
+
+
+class IndiceSegmentos:
+    """
+    Índice {segmento: rango de bytes} de un reporte, para parsear solo los
+    segmentos pedidos.
+
+    Se construye recorriendo el archivo mapeado en memoria con una
+    expresión sobre bytes que ubica bandas `+_`, fines `0-` y encabezados
+    de página; solo se decodifican esas líneas y las pocas que siguen a
+    cada banda (título). Los nombres son los de parse_cicsadm (" (2)",
+    " (3)", ...) y cada entrada guarda la página de inicio, de modo que
+    parsear el rango da exactamente el mismo resultado que el parse completo.
+
+    El índice se guarda junto al reporte (<reporte>.idx.json) y se
+    reconstruye si cambian el tamaño o el mtime del reporte.
+    """
+
+    def __init__(self, ruta: Path, entradas: list, tamano: int, mtime_ns: int,
+                 codificacion: str, exacto: bool = True):
+        self.ruta = Path(ruta)
+        # [nombre, titulo, ocurrencia, pagina, inicio, fin, lado, pagina_previa]
+        self.entradas = entradas
+        self.tamano = tamano
+        self.mtime_ns = mtime_ns
+        self.codificacion = codificacion
+        # False si el reporte tiene saltos de línea que el índice no sabe ubicar:
+        # las consultas caen al parse completo
+        self.exacto = exacto
+        self._por_nombre = {e[0]: e for e in entradas}
+
+    # -------------------------
+    # construcción
+    # -------------------------
+    @classmethod
+    def construir(cls, ruta: Path, codificacion: str | None = None) -> "IndiceSegmentos":
+        ruta = Path(ruta)
+        codificacion = codificacion or codificacion_reportes()
+        st = ruta.stat()
+
+        if st.st_size == 0:
+            return cls(ruta, [], st.st_size, st.st_mtime_ns, codificacion)
+
+        # comprimido o EBCDIC: los bytes del archivo no son las líneas del parser
+        if not detectar_formato(ruta).plano:
+            return cls(ruta, [], st.st_size, st.st_mtime_ns, codificacion, exacto=False)
+
+        with open(ruta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            saltos_no_ascii = _SALTOS_NO_ASCII.get(codificacion)
+            if saltos_no_ascii is None or any(mm.find(s) != -1 for s in saltos_no_ascii):
+                return cls(ruta, [], st.st_size, st.st_mtime_ns, codificacion, exacto=False)
+            entradas = cls._escanear(mm, codificacion)
+
+        return cls(ruta, entradas, st.st_size, st.st_mtime_ns, codificacion)
+
+    @staticmethod
+    def _escanear(mm, codificacion: str) -> list:
+        bandas, limites, paginas, numeros = [], [], [], []
+        numero = 0
+        for desplazamiento, crudo in _lineas_candidatas(mm):
+            linea = crudo.decode(codificacion, "ignore")
+            tipo = clasificar_linea(linea)
+            if tipo == LINEA_INICIO:
+                bandas.append(desplazamiento)
+                limites.append(desplazamiento)
+            elif tipo == LINEA_FIN:
+                limites.append(desplazamiento)
+            elif tipo == LINEA_PAGINA:
+                numero = numero_pagina(linea, numero)
+                paginas.append(desplazamiento)
+                numeros.append(numero)
+
+        def pagina_antes_de(desplazamiento):
+            i = bisect_left(paginas, desplazamiento)
+            return numeros[i - 1] if i else 0
+
+        registro = RegistroTitulos()
+        entradas = []
+        total = len(mm)
+        i_banda = 0
+
+        # misma secuencia que iterar_fragmentos_lineas: banda -> título ->
+        # contenido hasta el siguiente límite -> siguiente banda
+        while i_banda < len(bandas):
+            inicio = bandas[i_banda]
+            lineas = _lineas_desde(mm, inicio, codificacion)
+            next(lineas)  # la banda
+
+            titulo_en = linea_titulo = None
+            for desplazamiento, linea in lineas:
+                if clasificar_linea(linea) not in (LINEA_VACIA, LINEA_PAGINA):
+                    titulo_en, linea_titulo = desplazamiento, linea
+                    break
+            if linea_titulo is None:
+                break
+            pagina = pagina_antes_de(titulo_en + 1)
+
+            split = split_two_columns(linea_titulo)
+            if split and is_title_text(split[0]) and is_title_text(split[1]):
+                titulos = [split[0].lstrip("-").strip(), split[1].lstrip("-").strip()]
+                contenido_en = next(lineas, (total, None))[0]
+            else:
+                titulos = [linea_titulo.lstrip("-").strip()]
+                contenido_en = total
+                for desplazamiento, linea in lineas:
+                    tipo = clasificar_linea(linea)
+                    if tipo == LINEA_VACIA or tipo == LINEA_PAGINA or linea.startswith("+_"):
+                        continue
+                    contenido_en = desplazamiento
+                    break
+
+            j = bisect_left(limites, contenido_en)
+            fin = limites[j] if j < len(limites) else total
+
+            for lado, titulo in enumerate(titulos):
+                nombre = registro.registrar(titulo, pagina)
+                ocurrencia = registro.identidad(nombre).ocurrencia
+                entradas.append([nombre, titulo, ocurrencia, pagina, inicio, fin, lado, pagina_antes_de(inicio)])
+
+            i_banda = bisect_left(bandas, fin)
+
+        return entradas
+
+    # -------------------------
+    # persistencia
+    # -------------------------
+    def a_dict(self) -> dict:
+        return {
+            "version": VERSION_INDICE,
+            "archivo": self.ruta.name,
+            "tamano": self.tamano,
+            "mtime_ns": self.mtime_ns,
+            "codificacion": self.codificacion,
+            "exacto": self.exacto,
+            "segmentos": self.entradas,
+        }
+
+    def guardar(self, destino: Path) -> None:
+        # escritura atómica, igual que el manifiesto
+        destino = Path(destino)
+        temporal = destino.with_name(destino.name + ".tmp")
+        temporal.write_text(json.dumps(self.a_dict(), ensure_ascii=False), encoding="utf-8")
+        os.replace(temporal, destino)
+
+    @classmethod
+    def cargar(cls, ruta: Path, origen: Path) -> "IndiceSegmentos | None":
+        """Índice guardado, o None si no existe, es ilegible o el reporte cambió."""
+        try:
+            datos = json.loads(Path(origen).read_text(encoding="utf-8"))
+            st = Path(ruta).stat()
+        except (OSError, ValueError):
+            return None
+
+        if (
+            datos.get("version") != VERSION_INDICE
+            or datos.get("tamano") != st.st_size
+            or datos.get("mtime_ns") != st.st_mtime_ns
+            or datos.get("codificacion") != codificacion_reportes()
+        ):
+            return None
+        return cls(ruta, datos["segmentos"], datos["tamano"], datos["mtime_ns"],
+                   datos["codificacion"], datos.get("exacto", True))
+
+    # -------------------------
+    # consultas
+    # -------------------------
+    def nombres(self) -> list[str]:
+        return [e[0] for e in self.entradas]
+
+    def buscar(self, titulo: str, todas: bool = False) -> list[str]:
+        # nombre exacto; con todas=True, además cada aparición del título
+        if not todas:
+            return [titulo] if titulo in self._por_nombre else []
+        return [e[0] for e in self.entradas if e[0] == titulo or e[1] == titulo]
+
+    def leer(self, nombres: Iterable[str], tablas: bool = False) -> dict:
+        """
+        {nombre: campos} solo de los segmentos pedidos (los que no están
+        en el índice se omiten). Cada rango se parsea por separado con el
+        motor del parser.
+        """
+        nombres = list(dict.fromkeys(nombres))
+        if not self.exacto:
+            registro = RegistroTitulos()
+            completo = {
+                registro.registrar(s.titulo, s.pagina): s.campos
+                for s in iterar_fragmentos(self.ruta, tablas)
+            }
+            return {n: completo[n] for n in nombres if n in completo}
+
+        pedidas = [self._por_nombre[n] for n in nombres if n in self._por_nombre]
+        out = {}
+        if not pedidas:
+            return out
+
+        with open(self.ruta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for nombre, _, _, _, inicio, fin, lado, pagina_previa in pedidas:
+                lineas = _decodificar(mm, inicio, fin, self.codificacion)
+                segmentos = list(iterar_fragmentos_lineas(lineas, tablas, pagina_inicial=pagina_previa))
+                if lado < len(segmentos):
+                    out[nombre] = segmentos[lado].campos
+        return out
+
+    def __contains__(self, nombre) -> bool:
+        return nombre in self._por_nombre
+
+    def __len__(self) -> int:
+        return len(self.entradas)
+
+
+def obtener_indice(ruta: Path, directorio_indices: Path | None = None, guardar: bool = True) -> IndiceSegmentos:
+    """Índice del reporte: el guardado si sigue vigente, si no se construye (y se guarda)."""
+    ruta = Path(ruta)
+    destino = ruta_indice(ruta, directorio_indices)
+    indice = IndiceSegmentos.cargar(ruta, destino)
+    if indice is not None:
+        return indice
+
+    indice = IndiceSegmentos.construir(ruta)
+    if guardar:
+        try:
+            indice.guardar(destino)
+        except OSError as e:
+            # reportes archivados en solo lectura: el índice sirve igual en memoria
+            print(f"❌ No se pudo guardar el índice {destino}: {e}")
+    return indice
+
+
+def leer_segmentos(ruta: Path, titulos: Iterable[str], todas: bool = False,
+                   directorio_indices: Path | None = None) -> dict:
+    """
+    Parsea solo los segmentos pedidos de un reporte, p. ej.
+    leer_segmentos(ruta, ["System Status", "Dispatcher"]).
+    Con todas=True incluye cada aparición del título ("Dispatcher (2)", ...).
+    """
+    indice = obtener_indice(ruta, directorio_indices)
+    nombres = [n for titulo in titulos for n in indice.buscar(titulo, todas)]
+    return indice.leer(nombres)
+
+
+def leer_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta segmentos de un reporte CICS usando su índice.")
+    parser.add_argument("reporte", type=Path)
+    parser.add_argument("titulos", nargs="*", help="segmentos a leer (sin títulos: lista el índice)")
+    parser.add_argument("--todas", action="store_true", help="incluir cada aparición del título")
+    parser.add_argument("--directorio-indices", type=Path, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = leer_argumentos(argv)
+    indice = obtener_indice(args.reporte, args.directorio_indices)
+    if not args.titulos:
+        for nombre, _, _, pagina, inicio, fin, _, _ in indice.entradas:
+            print(f"{nombre}\tpágina {pagina}\tbytes {inicio}-{fin}")
+        return
+    nombres = [n for titulo in args.titulos for n in indice.buscar(titulo, args.todas)]
+    print(json.dumps(indice.leer(nombres), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
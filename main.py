@@ -2,8 +2,22 @@ import os
 import json
 import datetime
 import json
+import argparse
+import time
+import logging
+import threading
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 from funciones import *     
+from manifiesto import ManifiestoReportes
+from almacen_columnar import AlmacenColumnar, REGION_DESCONOCIDA
+from pipeline import PipelineCarga, CAPACIDAD_COLA, ESCRITORES
+from metricas import METRICAS, VARIABLE_DETALLE, perfilar
+from vigilancia import VigilanteReportes, ESTABILIDAD_SEGUNDOS, INTERVALO_SONDEO
+from cambios import CacheUltimosValores, cargar_reporte_cdc
+from consultas import precalcular_rollup
 
 fechaActual = datetime.date.today().isoformat()
 
@@ -14,89 +28,495 @@ fechaActual = datetime.date.today().isoformat()
 PROJECT_ROOT = Path(__file__).parent
 DIRECTORIO_REPORTES = PROJECT_ROOT / "Reportes_CICS_TEST"
 DIRECTORIO_SALIDA = PROJECT_ROOT / "JSON_SALIDA"
+# tamaño, mtime y hash de los reportes ya cargados (modo --incremental)
+RUTA_MANIFIESTO = PROJECT_ROOT / "manifiesto_reportes.json"
+# histórico columnar local (fecha=/region=), destino alternativo a la BD
+DIRECTORIO_HISTORIAL = PROJECT_ROOT / "HISTORIAL_COLUMNAR"
+# volcados de cProfile y resúmenes de hotspots (modo --perfil)
+DIRECTORIO_PERFILES = PROJECT_ROOT / "PERFILES"
+# últimos valores por (archivo, segmento, campo) de la carga CDC (--modo-carga cdc)
+RUTA_CACHE_CDC = PROJECT_ROOT / "cache_cdc.sqlite3"
+
+DESTINO_BD = "bd"
+DESTINO_COLUMNAR = "columnar"
+DESTINO_AMBOS = "ambos"
+DESTINOS = (DESTINO_BD, DESTINO_COLUMNAR, DESTINO_AMBOS)
+
+# completo: todas las filas en validacion_sistema; cdc: solo cambios y lápidas en validacion_sistema_cambios
+CARGA_COMPLETA = "completo"
+CARGA_CDC = "cdc"
+MODOS_CARGA = (CARGA_COMPLETA, CARGA_CDC)
 
 # crear carpeta de salida si no existe
 DIRECTORIO_SALIDA.mkdir(exist_ok=True)
 
 
-def main():
+def rutas_reportes(archivos):
+    # solo procesar txt, también comprimidos (los nombres se manejan en mayúsculas)
+    return [
+        DIRECTORIO_REPORTES / archivo.upper()
+        for archivo in sorted(archivos, key=str.upper)
+        if es_nombre_reporte(archivo)
+    ]
 
-    #cantidadRegFechaActual = validarCargaFecha(fechaActual)
-    cantidadRegFechaActual = 0
-    if cantidadRegFechaActual == 0:
 
-        if not DIRECTORIO_REPORTES.exists():
-            raise FileNotFoundError(f"No existe el directorio: {DIRECTORIO_REPORTES}")
+def iterar_reportes_procesados(rutas, trabajadores=1, formato_json=FORMATO_JSON_INDENTADO, fusionar_fragmentos=False,
+                               selector=SELECTOR_POR_DEFECTO, compacto=False, pool=None, tablas=False):
+    """
+    Produce el resumen de cada reporte (con el dict en resumen["data"])
+    en el orden de entrada, para que las etapas de BD consuman cada
+    resultado desde memoria apenas está listo.
 
-        archivos = os.listdir(DIRECTORIO_REPORTES)
+    pool: ProcessPoolExecutor ya creado (modo --vigilar, que lo reutiliza
+    entre lotes); si no se pasa, se crea uno para estas rutas.
+    """
+    if trabajadores <= 1 or len(rutas) <= 1:
+        for ruta in rutas:
+            yield procesar_reporte(ruta, DIRECTORIO_SALIDA, formato_json, fusionar_fragmentos, selector, compacto, tablas)
+        return
 
-        for archivo in archivos:
-            archivo = archivo.upper()
+    argumentos = (
+        repeat(DIRECTORIO_SALIDA), repeat(formato_json), repeat(fusionar_fragmentos), repeat(selector),
+        repeat(compacto), repeat(tablas),
+    )
+    # map conserva el orden de entrada: el resumen es determinista
+    if pool is not None:
+        yield from pool.map(procesar_reporte, rutas, *argumentos)
+        return
+    with ProcessPoolExecutor(max_workers=trabajadores) as pool:
+        yield from pool.map(procesar_reporte, rutas, *argumentos)
 
-            # solo procesar txt
-            if not archivo.endswith(".TXT"):
-                continue
 
-            print(f"Archivo en análisis: {archivo}")
+def procesar_reportes(rutas, trabajadores=1, formato_json=FORMATO_JSON_INDENTADO, fusionar_fragmentos=False,
+                      selector=SELECTOR_POR_DEFECTO, compacto=False, tablas=False):
+    resultados = list(iterar_reportes_procesados(
+        rutas, trabajadores, formato_json, fusionar_fragmentos, selector, compacto, tablas=tablas
+    ))
+    imprimir_resumen_procesamiento(resultados, trabajadores)
+    return resultados
 
-            archivo_path = DIRECTORIO_REPORTES / archivo
 
-            try:
-                data = parse_cicsadm(archivo_path)
+def imprimir_resumen_procesamiento(resultados, trabajadores):
+    correctos = [r for r in resultados if r["ok"]]
+
+    print("========================================")
+    print(f"Resumen de procesamiento ({len(resultados)} archivos, {trabajadores} trabajador(es)):")
+    for r in resultados:
+        if r["ok"]:
+            json_generado = f", JSON {r['json']}" if r["json"] else ""
+            print(f"  ✔ {r['archivo']}: {r['segmentos']} segmentos{json_generado} ({r['segundos']:.2f} s)")
+        else:
+            print(f"  ❌ {r['archivo']}: {r['error']} ({r['segundos']:.2f} s)")
+    print(f"Correctos: {len(correctos)} / Con error: {len(resultados) - len(correctos)}")
+    print("========================================")
+    print("\n")
 
-                nombre_json = archivo.replace(".TXT", ".JSON")
-                salida_path = DIRECTORIO_SALIDA / nombre_json
 
-                salida_path.write_text(
-                    json.dumps(data, indent=2, ensure_ascii=False),
-                    encoding="utf-8"
-                )
+class EtapasSalida:
+    """
+    Etapas de salida de un reporte ya parseado: histórico columnar, BD y
+    manifiesto. Un fallo queda en resumen["ok"]/["error"]. Es segura entre
+    hilos (los escritores del modo --pipeline la comparten).
+    """
 
-                print(f"  ✔ Segmentos detectados: {len(data)}")
-                print(f"  ✔ JSON generado: {salida_path}\n")
+    def __init__(self, destino, tamano_lote, historial=None, manifiesto=None, fecha=fechaActual, cache_cdc=None,
+                 forzar_carga=False):
+        self.destino = destino
+        self.tamano_lote = tamano_lote
+        # republicar aunque el diario de carga ya tenga el reporte
+        self.forzar_carga = forzar_carga
+        self.historial = historial
+        self.manifiesto = manifiesto
+        # con caché CDC la BD recibe solo los cambios (cambios.py)
+        self.cache_cdc = cache_cdc
+        # fecha de carga; el modo --vigilar la actualiza en cada lote
+        self.fecha = fecha
+        self._lock = threading.Lock()
 
+    def __call__(self, resumen, data):
+        nombreArchivo = nombre_base_reporte(resumen["archivo"])  # elimina ".TXT" y la compresión
+        with self._lock:
+            imprimir_segmentos(resumen["archivo"], data)
+
+        if self.historial is not None:
+            try:
+                filas = self.historial.agregar_reporte(self.fecha, resumen["region"], nombreArchivo, data)
+                print(f"✔ Histórico columnar: {filas} filas de {nombreArchivo} (región {resumen['region'] or REGION_DESCONOCIDA})")
             except Exception as e:
-                print(f"  ❌ Error procesando {archivo}: {e}\n")
+                resumen["ok"] = False
+                resumen["error"] = f"Histórico: {type(e).__name__}: {e}"
+                print(f"❌ Error escribiendo el histórico de {nombreArchivo}: {e}")
+                return
+            try:
+                # rollup parcial de este reporte para consultas.py; si falla, la primera consulta lo recalcula
+                precalcular_rollup(self.historial, self.fecha, resumen["region"] or REGION_DESCONOCIDA, nombreArchivo)
+            except Exception as e:
+                print(f"❌ Error precalculando el rollup de {nombreArchivo}: {e}")
+
+        if self.destino != DESTINO_COLUMNAR:
+            try:
+                if self.cache_cdc is not None:
+                    cargar_reporte_cdc(nombreArchivo, data, self.fecha, self.cache_cdc, self.tamano_lote)
+                else:
+                    cargar_reporte(nombreArchivo, data, self.fecha, self.tamano_lote, self.forzar_carga)
+            except Exception as e:
+                resumen["ok"] = False
+                resumen["error"] = f"BD: {type(e).__name__}: {e}"
+                print(f"❌ Error insertando {nombreArchivo}: {e}")
+                return
+
+        # el manifiesto solo registra reportes que llegaron a la BD: un fallo se reintenta.
+        # Se registra la firma tomada antes de parsear, no el archivo actual: si
+        # cambió entre el parseo y la carga, la próxima corrida lo vuelve a cargar
+        if self.manifiesto is not None:
+            firma = resumen.get("firma")
+            if firma is None:
+                print(f"❌ {resumen['archivo']} cambió mientras se leía: no se registra en el manifiesto")
+                return
+            with self._lock:
+                self.manifiesto.registrar(DIRECTORIO_REPORTES / resumen["archivo"], **firma)
+
+    def cerrar(self):
+        if self.cache_cdc is not None:
+            self.cache_cdc.cerrar()
+
+
+def leer_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Procesa reportes de estadísticas CICS.")
+    parser.add_argument(
+        "--trabajadores",
+        type=int,
+        default=int(os.environ.get("CICS_TRABAJADORES", "1")),
+        help="procesos para parsear reportes en paralelo (1 = secuencial)",
+    )
+    parser.add_argument(
+        "--tamano-lote",
+        type=int,
+        default=TAMANO_LOTE_CARGA,
+        help="filas por lote en la carga masiva a validacion_sistema (0 = inserción fila por fila)",
+    )
+    parser.add_argument(
+        "--forzar-carga",
+        action="store_true",
+        help="volver a publicar los reportes aunque el diario de carga ya los tenga como publicados "
+             "(p. ej. tras borrar filas de validacion_sistema); solo se insertan las filas que falten",
+    )
+    parser.add_argument(
+        "--tamano-pool",
+        type=int,
+        default=TAMANO_POOL,
+        help="conexiones máximas del pool a SQL Server",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="saltar los reportes sin cambios según el manifiesto local",
+    )
+    parser.add_argument(
+        "--json",
+        choices=FORMATOS_JSON,
+        default=FORMATO_JSON_INDENTADO,
+        help="exportación JSON por reporte (una sola escritura); 'ninguno' no escribe a disco",
+    )
+    parser.add_argument(
+        "--destino",
+        choices=DESTINOS,
+        default=DESTINO_BD,
+        help="dónde cargar los valores: SQL Server, el histórico columnar local o ambos",
+    )
+    parser.add_argument(
+        "--modo-carga",
+        choices=MODOS_CARGA,
+        default=CARGA_COMPLETA,
+        help="completo: todas las filas por fecha; cdc: solo campos nuevos, modificados o eliminados "
+             "(validacion_sistema_cambios, snapshot por fecha con cambios.py)",
+    )
+    parser.add_argument(
+        "--fusionar-fragmentos",
+        action="store_true",
+        help="unir en un solo segmento los fragmentos que continúan tras un salto de página",
+    )
+    parser.add_argument(
+        "--selector",
+        type=Path,
+        help='JSON con los segmentos a parsear: {"incluir": {"nombres"|"prefijos"|"regex": [...]}, "excluir": {...}}; '
+             "los excluidos se saltan sin parsearlos (por defecto se excluyen los títulos que empiezan por '0')",
+    )
+    parser.add_argument(
+        "--solo",
+        action="append",
+        default=[],
+        metavar="SEGMENTO",
+        help="parsear solo este segmento (título exacto; se puede repetir). Se suma a --selector",
+    )
+    parser.add_argument(
+        "--compacto",
+        action="store_true",
+        help="mantener cada reporte parseado como ReporteCompacto (nombres internados, arreglos) en lugar "
+             "de dict de dicts: menos memoria y menos bytes entre procesos",
+    )
+    parser.add_argument(
+        "--tablas",
+        action="store_true",
+        help="cargar también las filas de los segmentos tabulares (campos \"<fila> <columna>\"); "
+             "sin esta opción esos segmentos quedan vacíos",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="superponer parseo y carga: los reportes parseados pasan por una cola acotada a hilos escritores",
+    )
+    parser.add_argument(
+        "--escritores",
+        type=int,
+        default=ESCRITORES,
+        help="hilos que cargan a la BD en modo --pipeline (limitado por --tamano-pool)",
+    )
+    parser.add_argument(
+        "--capacidad-cola",
+        type=int,
+        default=CAPACIDAD_COLA,
+        help="reportes parseados que pueden esperar carga en modo --pipeline (contrapresión)",
+    )
+    parser.add_argument(
+        "--vigilar",
+        action="store_true",
+        help="modo continuo: esperar reportes nuevos (inotify o sondeo) y cargar cada uno al terminar de "
+             "escribirse; implica --incremental. Se detiene con Ctrl+C o SIGTERM",
+    )
+    parser.add_argument(
+        "--estabilidad",
+        type=float,
+        default=ESTABILIDAD_SEGUNDOS,
+        help="segundos sin escrituras para considerar completo un reporte en modo --vigilar",
+    )
+    parser.add_argument(
+        "--intervalo-sondeo",
+        type=float,
+        default=INTERVALO_SONDEO,
+        help="segundos entre barridos del directorio en modo --vigilar sin inotify",
+    )
+    parser.add_argument(
+        "--sondeo",
+        action="store_true",
+        help="en modo --vigilar, sondear el directorio aunque inotify esté disponible",
+    )
+    parser.add_argument(
+        "--metricas",
+        type=Path,
+        help="archivo con las métricas de la ejecución: .prom = textfile de Prometheus, otro = JSON",
+    )
+    parser.add_argument(
+        "--metricas-detalle",
+        action="store_true",
+        help="medir también lectura, clasificación, columnas, KV y detección de tablas (agrega overhead)",
+    )
+    parser.add_argument(
+        "--perfil", "--profile",
+        action="store_true",
+        help=f"envolver la ejecución en cProfile y tracemalloc; el resumen queda en {DIRECTORIO_PERFILES.name}/ "
+             "(solo el proceso principal: usar --trabajadores 1 para incluir el parseo)",
+    )
+    parser.add_argument(
+        "--nivel-log",
+        choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+        default="INFO",
+        help="DEBUG muestra cada campo insertado fila por fila (lento en cargas grandes)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = leer_argumentos(argv)
+    logging.basicConfig(level=args.nivel_log, format="%(levelname)s %(name)s: %(message)s")
+    if args.metricas_detalle:
+        # variable de entorno: la heredan los procesos de parseo
+        os.environ[VARIABLE_DETALLE] = "1"
+
+    if not args.perfil:
+        return ejecutar(args)
 
+    nombre = f"perfil_{datetime.datetime.now():%Y%m%d_%H%M%S}"
+    with perfilar(DIRECTORIO_PERFILES, nombre):
+        resultado = ejecutar(args)
+    print(f"✔ Perfil escrito en {DIRECTORIO_PERFILES / (nombre + '.txt')} (volcado cProfile: {nombre}.prof)")
+    return resultado
 
-        # eliminar segmentos en el que el nombre inicie con "0"
-        eliminar_segmentos_formato_0(DIRECTORIO_SALIDA)
 
-        # imprimir listado segmentos tipo tabla
-        print("========================================")
-        print("Listado de segmentos tipo tabla:")
-        imprimir_listado_segmentos_tabla(DIRECTORIO_SALIDA)
-        print("========================================")
-        print("\n")
+def opciones_manifiesto(args, selector):
+    # lo que cambia el contenido cargado: un reporte cargado con otras opciones se recarga
+    return {
+        "destino": args.destino,
+        "modo_carga": args.modo_carga,
+        "tablas": args.tablas,
+        "fusionar_fragmentos": args.fusionar_fragmentos,
+        "selector": selector.a_dict(),
+    }
+
+
+def etapas_desde_argumentos(args, manifiesto=None):
+    historial = AlmacenColumnar(DIRECTORIO_HISTORIAL) if args.destino != DESTINO_BD else None
+    cache_cdc = None
+    if args.modo_carga == CARGA_CDC and args.destino != DESTINO_COLUMNAR:
+        cache_cdc = CacheUltimosValores(RUTA_CACHE_CDC)
+    return EtapasSalida(args.destino, args.tamano_lote, historial, manifiesto, cache_cdc=cache_cdc,
+                        forzar_carga=args.forzar_carga)
+
+
+def selector_desde_argumentos(args):
+    selector = SelectorSegmentos.desde_archivo(args.selector) if args.selector else SELECTOR_POR_DEFECTO
+    if args.solo:
+        # las exclusiones del selector base (por defecto, PREFIJOS_EXCLUIR) se mantienen
+        selector = selector.ampliar(incluir=args.solo)
+    return selector
+
+
+def cargar_lote_vigilado(listos, cargar, manifiesto, args, selector, pool=None):
+    """Parsea y carga un lote del vigilante; devuelve los resúmenes."""
+    rutas, sin_cambios = manifiesto.pendientes(rutas_reportes(r.nombre for r in listos))
+    for ruta in sin_cambios:
+        print(f"Sin cambios desde la última carga: {ruta.name}")
+    if not rutas:
+        return []
+
+    llegadas = {r.nombre.upper(): r.llegada for r in listos}
+    # un daemon cruza la medianoche: la fecha de carga es la del lote
+    cargar.fecha = datetime.date.today().isoformat()
+    trabajadores = max(1, args.trabajadores)
+    resultados = []
+    for resumen in iterar_reportes_procesados(
+        rutas, trabajadores, args.json, args.fusionar_fragmentos, selector, args.compacto, pool, args.tablas
+    ):
+        data = resumen.pop("data")
+        resultados.append(resumen)
+        if resumen["ok"]:
+            cargar(resumen, data)
+        del data
+        METRICAS.combinar(resumen.pop("metricas", None))
+
+        llegada = llegadas.get(resumen["archivo"])
+        if resumen["ok"] and llegada is not None:
+            # desde que el reporte apareció en el directorio hasta que quedó cargado
+            latencia = time.time() - llegada
+            METRICAS.sumar_tiempo("latencia_ingesta", latencia)
+            METRICAS.fijar("latencia_ultima_segundos", latencia)
+            print(f"✔ {resumen['archivo']} cargado {latencia:.1f} s después de su llegada")
+
+    imprimir_resumen_procesamiento(resultados, trabajadores)
+    manifiesto.guardar()
+    return resultados
+
+
+def vigilar(args, selector):
+    """
+    Modo continuo (--vigilar): el proceso queda vivo y carga cada reporte
+    apenas termina de escribirse. Entre reportes se conservan el pool de
+    conexiones, las cachés de dimensiones, el esquema ya verificado y (con
+    --trabajadores > 1) el pool de procesos de parseo.
+    """
+    if not DIRECTORIO_REPORTES.exists():
+        raise FileNotFoundError(f"No existe el directorio: {DIRECTORIO_REPORTES}")
+
+    manifiesto = ManifiestoReportes(RUTA_MANIFIESTO, opciones_manifiesto(args, selector))
+    cargar = etapas_desde_argumentos(args, manifiesto)
+    vigilante = VigilanteReportes(
+        DIRECTORIO_REPORTES, args.estabilidad, args.intervalo_sondeo,
+        usar_inotify=False if args.sondeo else None,
+    )
+    # SIGTERM (systemd, docker stop) termina el lote en curso y sale
+    signal.signal(signal.SIGTERM, lambda *_: vigilante.detener())
+
+    trabajadores = max(1, args.trabajadores)
+    pool = ProcessPoolExecutor(max_workers=trabajadores) if trabajadores > 1 else None
+    print(f"Vigilando {DIRECTORIO_REPORTES} ({vigilante.modo}, estabilidad {vigilante.estabilidad:.1f} s). Ctrl+C para salir.")
+    cargados = 0
+    try:
+        for listos in vigilante.lotes():
+            resultados = cargar_lote_vigilado(listos, cargar, manifiesto, args, selector, pool)
+            cargados += sum(1 for r in resultados if r["ok"])
+            if args.metricas is not None and resultados:
+                # el archivo de métricas se reescribe tras cada lote (textfile de Prometheus o JSON)
+                METRICAS.fijar("conexiones_abiertas", obtener_pool().estadisticas()["abiertas"])
+                METRICAS.exportar(args.metricas, etiquetas={"fecha": cargar.fecha})
+    except KeyboardInterrupt:
+        pass
+    finally:
+        vigilante.cerrar()
+        if pool is not None:
+            pool.shutdown()
+        manifiesto.guardar()
+        cargar.cerrar()
+        estadisticas_pool = obtener_pool().cerrar()
+        print(f"Vigilancia detenida: {cargados} reportes cargados. Pool de conexiones: {estadisticas_pool}")
+
+
+def ejecutar(args):
+    inicio = time.perf_counter()
+    trabajadores = max(1, args.trabajadores)
+    configurar_pool(tamano=max(1, args.tamano_pool))
+    selector = selector_desde_argumentos(args)
+    if args.vigilar:
+        return vigilar(args, selector)
+
+    #cantidadRegFechaActual = validarCargaFecha(fechaActual)
+    cantidadRegFechaActual = 0
+    if cantidadRegFechaActual == 0:
+
+        if not DIRECTORIO_REPORTES.exists():
+            raise FileNotFoundError(f"No existe el directorio: {DIRECTORIO_REPORTES}")
+
+        rutas = rutas_reportes(os.listdir(DIRECTORIO_REPORTES))
 
-        # obtener lista de archivos de reportes sin extensión
-        archivos_reportes = [
-            f[:-4]                       # elimina ".TXT"
-            for f in os.listdir(DIRECTORIO_REPORTES)
-            if f.upper().endswith(".TXT")
-        ]
+        manifiesto = None
+        if args.incremental:
+            manifiesto = ManifiestoReportes(RUTA_MANIFIESTO, opciones_manifiesto(args, selector))
+            rutas, sin_cambios = manifiesto.pendientes(rutas)
+            print(f"Modo incremental: {len(rutas)} reportes nuevos o modificados, {len(sin_cambios)} sin cambios.")
+            if not rutas:
+                manifiesto.guardar()
+                return
 
-        # obtener la lista de segmentos por archivo
-        segmentos_por_archivo = obtener_segmentos_por_archivo(DIRECTORIO_SALIDA, archivos_reportes)
-        print("Segmentos por archivo:")
-        for archivo, segmentos in segmentos_por_archivo.items():
-            # imprimir el archivo y cada uno de sus segmentos
-            print(f"Archivo: {archivo}")
-            for segmento in segmentos:
-                insertarSeg(segmento)
+        cargar = etapas_desde_argumentos(args, manifiesto)
 
-            
+        if args.pipeline:
+            # parseo y carga superpuestos: los escritores no pueden superar al pool
+            escritores = min(max(1, args.escritores), max(1, args.tamano_pool))
+            pipeline = PipelineCarga(
+                cargar, trabajadores, escritores, args.capacidad_cola,
+                DIRECTORIO_SALIDA, args.json, args.fusionar_fragmentos, selector, args.compacto, args.tablas,
+            )
+            resultados = pipeline.ejecutar(rutas)
+            pipeline.imprimir_estadisticas()
+        else:
+            # parseo (solo los segmentos del selector) -> JSON por reporte (en paralelo
+            # si trabajadores > 1); cada dict pasa directo de memoria a las etapas de BD
+            resultados = []
+            for resumen in iterar_reportes_procesados(
+                rutas, trabajadores, args.json, args.fusionar_fragmentos, selector, args.compacto,
+                tablas=args.tablas,
+            ):
+                data = resumen.pop("data")
+                resultados.append(resumen)
+                if resumen["ok"]:
+                    cargar(resumen, data)
 
-        # insertar segmentos por archivo
-        insertar_segmentos_por_archivo(segmentos_por_archivo, fechaActual)
+        for resumen in resultados:
+            METRICAS.combinar(resumen.pop("metricas", None))
+        imprimir_resumen_procesamiento(resultados, trabajadores)
 
-        #imprimir archivos_reportes
-        for archivo in archivos_reportes:
-            insertarArchivo(archivo)
+        if manifiesto is not None:
+            manifiesto.guardar()
+        cargar.cerrar()
 
+        estadisticas_pool = obtener_pool().cerrar()
+        print(f"Pool de conexiones: {estadisticas_pool}")
 
-        # ✅ al final, recorre JSONs e inserta en BD
-        insertar_desde_json_generados(DIRECTORIO_SALIDA, fechaActual)
+        METRICAS.fijar("conexiones_abiertas", estadisticas_pool["abiertas"])
+        METRICAS.fijar("prestamos_conexion", estadisticas_pool["prestamos"])
+        METRICAS.sumar_tiempo("total", time.perf_counter() - inicio)
+        if args.metricas is not None:
+            ruta = METRICAS.exportar(args.metricas, etiquetas={"fecha": fechaActual})
+            print(f"✔ Métricas de la ejecución en {ruta}")
 
 
     else:
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+TAMANO_BLOQUE_HASH = 1 << 20
+
+
+def hash_archivo(ruta: Path) -> str:
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        while True:
+            bloque = f.read(TAMANO_BLOQUE_HASH)
+            if not bloque:
+                break
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def firma_archivo(ruta: Path) -> dict | None:
+    """
+    {tamano, mtime_ns, sha256} del reporte tal como está ahora. Se toma
+    antes de parsear: si el archivo cambia después, el manifiesto guarda la
+    versión vieja y la próxima corrida lo reprocesa. None si cambió
+    mientras se calculaba el hash.
+    """
+    st = os.stat(ruta)
+    sha256 = hash_archivo(ruta)
+    despues = os.stat(ruta)
+    if (despues.st_size, despues.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+        return None
+    return {"tamano": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha256}
+
+
+class ManifiestoReportes:
+    """
+    Manifiesto local {reporte: tamaño, mtime, sha256} de los reportes ya
+    cargados, para que el modo incremental salte los que no cambiaron
+    antes de parsearlos.
+
+    Primero se comparan tamaño y mtime (sin leer el archivo). Solo si el
+    mtime cambió con el mismo tamaño se calcula el hash: un reporte que
+    se volvió a copiar sin cambios sigue contando como ya procesado.
+
+    opciones: las opciones de la corrida que cambian lo que se carga
+    (destino, selector, --tablas, ...). Se guardan en cada entrada y un
+    reporte cargado con otras opciones cuenta como pendiente.
+    """
+
+    def __init__(self, ruta: Path, opciones: dict | None = None):
+        self.ruta = Path(ruta)
+        self.opciones = opciones
+        self._entradas = {}
+        self.cargar()
+
+    def cargar(self):
+        try:
+            self._entradas = json.loads(self.ruta.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            self._entradas = {}
+        except (ValueError, OSError) as e:
+            # un manifiesto dañado solo obliga a reprocesar todo
+            print(f"❌ Manifiesto ilegible ({self.ruta}): {e}. Se reprocesarán todos los reportes.")
+            self._entradas = {}
+
+    def sin_cambios(self, ruta: Path) -> bool:
+        entrada = self._entradas.get(ruta.name)
+        if entrada is None:
+            return False
+        if self.opciones is not None and entrada.get("opciones") != self.opciones:
+            return False
+
+        try:
+            st = ruta.stat()
+        except OSError:
+            return False
+
+        if st.st_size != entrada["tamano"]:
+            return False
+        if st.st_mtime_ns == entrada["mtime_ns"]:
+            return True
+
+        if hash_archivo(ruta) != entrada["sha256"]:
+            return False
+
+        # mismo contenido con otro mtime: se actualiza para no volver a hashear
+        entrada["mtime_ns"] = st.st_mtime_ns
+        return True
+
+    def pendientes(self, rutas):
+        """Divide las rutas en (por procesar, sin cambios)."""
+        por_procesar, sin_cambios = [], []
+        for ruta in rutas:
+            (sin_cambios if self.sin_cambios(ruta) else por_procesar).append(ruta)
+        return por_procesar, sin_cambios
+
+    def registrar(self, ruta: Path, sha256: str | None = None, tamano: int | None = None,
+                  mtime_ns: int | None = None):
+        # tamano/mtime_ns/sha256 de firma_archivo() tomada antes de parsear; sin
+        # ellos se lee el archivo ahora (puede no ser lo que se cargó)
+        if tamano is None or mtime_ns is None:
+            st = ruta.stat()
+            tamano, mtime_ns = st.st_size, st.st_mtime_ns
+        entrada = {
+            "tamano": tamano,
+            "mtime_ns": mtime_ns,
+            "sha256": sha256 or hash_archivo(ruta),
+        }
+        if self.opciones is not None:
+            entrada["opciones"] = self.opciones
+        self._entradas[ruta.name] = entrada
+
+    def olvidar(self, ruta: Path):
+        self._entradas.pop(ruta.name, None)
+
+    def guardar(self):
+        # escritura atómica: un corte a mitad de camino no deja el manifiesto a medias
+        temporal = self.ruta.with_name(self.ruta.name + ".tmp")
+        temporal.write_text(json.dumps(self._entradas, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(temporal, self.ruta)
+
+    def __contains__(self, nombre):
+        return nombre in self._entradas
+
+    def __len__(self):
+        return len(self._entradas)
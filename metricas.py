@@ -0,0 +1,328 @@
+import contextvars
+import cProfile
+import inspect
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: sin getrusage, el pico de RSS no se informa
+    resource = None
+
+
+# =========================
+# MÉTRICAS POR EJECUCIÓN
+# =========================
+# Tres tipos de dato:
+#   - etapas: tiempo acumulado y cantidad de llamadas (parseo, serialización, BD...)
+#   - contadores: líneas, segmentos, campos, filas, lotes enviados a la BD...
+#   - memoria: pico de RSS (y de tracemalloc si está activo)
+#
+# Las funciones etapa() y contar() escriben en el recolector "actual":
+# METRICAS (el de la ejecución) salvo dentro de recolectar(), que instala
+# uno nuevo. procesar_reporte usa recolectar() para devolver las métricas
+# de su reporte en el resumen (también desde otro proceso) y main las suma
+# con combinar().
+
+# variable de entorno que activa la instrumentación fina del parser;
+# se hereda en los procesos del pool sin importar el método de arranque
+VARIABLE_DETALLE = "CICS_METRICAS_DETALLE"
+
+# etapas finas del parser (etapa -> función o Clase.metodo en funciones).
+# Envolver funciones de línea cuesta tiempo: solo con detalle activo.
+ETAPAS_DETALLE = {
+    "lectura": "iterar_lineas",
+    "clasificacion": "clasificar_linea",
+    "deteccion_tabla": "es_tabla_clasificada",
+    "columnas": "DisposicionColumnas.partir",
+    "kv": "parse_kvs",
+}
+
+PREFIJO_PROMETHEUS = "cics"
+FORMATO_JSON = "json"
+FORMATO_PROMETHEUS = "prometheus"
+
+
+def rss_pico_mb() -> float | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB; macOS, bytes
+    return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024
+
+
+class Metricas:
+    """Recolector de etapas, contadores y memoria; seguro entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.etapas: dict[str, list] = {}  # nombre -> [llamadas, segundos]
+        self.contadores: dict[str, float] = {}
+        self.memoria: dict[str, float] = {}
+
+    def sumar_tiempo(self, nombre: str, segundos: float, llamadas: int = 1) -> None:
+        with self._lock:
+            acumulado = self.etapas.setdefault(nombre, [0, 0.0])
+            acumulado[0] += llamadas
+            acumulado[1] += segundos
+
+    @contextmanager
+    def etapa(self, nombre: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sumar_tiempo(nombre, time.perf_counter() - inicio)
+
+    def contar(self, nombre: str, n: float = 1) -> None:
+        with self._lock:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + n
+
+    def fijar(self, nombre: str, valor: float) -> None:
+        # valor instantáneo (p. ej. conexiones abiertas por el pool)
+        with self._lock:
+            self.contadores[nombre] = valor
+
+    def registrar_memoria(self) -> None:
+        muestras = {"rss_pico_mb": rss_pico_mb()}
+        if tracemalloc.is_tracing():
+            muestras["tracemalloc_pico_mb"] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        with self._lock:
+            for nombre, valor in muestras.items():
+                if valor is not None:
+                    self.memoria[nombre] = max(valor, self.memoria.get(nombre, 0.0))
+
+    def instantanea(self) -> dict:
+        """Copia picklable (para enviar desde un proceso hijo o exportar)."""
+        self.registrar_memoria()
+        with self._lock:
+            return {
+                "etapas": {n: {"llamadas": ll, "segundos": s} for n, (ll, s) in sorted(self.etapas.items())},
+                "contadores": dict(sorted(self.contadores.items())),
+                "memoria": dict(self.memoria),
+            }
+
+    def combinar(self, otra: dict | None) -> None:
+        """Suma una instantánea (la memoria se combina con el máximo)."""
+        if not otra:
+            return
+        for nombre, etapa in otra.get("etapas", {}).items():
+            self.sumar_tiempo(nombre, etapa["segundos"], etapa["llamadas"])
+        for nombre, valor in otra.get("contadores", {}).items():
+            self.contar(nombre, valor)
+        with self._lock:
+            for nombre, valor in otra.get("memoria", {}).items():
+                self.memoria[nombre] = max(valor, self.memoria.get(nombre, 0.0))
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self.etapas.clear()
+            self.contadores.clear()
+            self.memoria.clear()
+
+    # -------------------------
+    # exportación
+    # -------------------------
+    def a_prometheus(self, etiquetas: dict | None = None) -> str:
+        """Formato textfile de Prometheus (node_exporter --collector.textfile)."""
+        datos = self.instantanea()
+        base = ",".join(f'{k}="{v}"' for k, v in (etiquetas or {}).items())
+
+        def serie(nombre, valor, extra=""):
+            etiqueta = ",".join(e for e in (base, extra) if e)
+            return f"{PREFIJO_PROMETHEUS}_{nombre}{{{etiqueta}}} {valor}" if etiqueta \
+                else f"{PREFIJO_PROMETHEUS}_{nombre} {valor}"
+
+        lineas = [
+            f"# HELP {PREFIJO_PROMETHEUS}_etapa_segundos_total Tiempo acumulado por etapa.",
+            f"# TYPE {PREFIJO_PROMETHEUS}_etapa_segundos_total counter",
+        ]
+        lineas += [serie("etapa_segundos_total", e["segundos"], f'etapa="{n}"') for n, e in datos["etapas"].items()]
+        lineas += [
+            f"# HELP {PREFIJO_PROMETHEUS}_etapa_llamadas_total Veces que se ejecutó cada etapa.",
+            f"# TYPE {PREFIJO_PROMETHEUS}_etapa_llamadas_total counter",
+        ]
+        lineas += [serie("etapa_llamadas_total", e["llamadas"], f'etapa="{n}"') for n, e in datos["etapas"].items()]
+        for nombre, valor in datos["contadores"].items():
+            lineas.append(f"# TYPE {PREFIJO_PROMETHEUS}_{nombre} gauge")
+            lineas.append(serie(nombre, valor))
+        for nombre, valor in datos["memoria"].items():
+            lineas.append(f"# TYPE {PREFIJO_PROMETHEUS}_memoria_{nombre} gauge")
+            lineas.append(serie(f"memoria_{nombre}", round(valor, 3)))
+        return "\n".join(lineas) + "\n"
+
+    def exportar(self, ruta: Path, formato: str | None = None, etiquetas: dict | None = None) -> Path:
+        """
+        Escribe el reporte de la ejecución (atómico, para que el colector
+        de Prometheus nunca lea un archivo a medias). Sin formato se
+        deduce de la extensión: .prom -> Prometheus, el resto JSON.
+        """
+        ruta = Path(ruta)
+        if formato is None:
+            formato = FORMATO_PROMETHEUS if ruta.suffix == ".prom" else FORMATO_JSON
+        if formato == FORMATO_PROMETHEUS:
+            texto = self.a_prometheus(etiquetas)
+        else:
+            texto = json.dumps({**(etiquetas or {}), **self.instantanea()}, indent=2, ensure_ascii=False)
+
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        temporal = ruta.with_name(ruta.name + ".tmp")
+        temporal.write_text(texto, encoding="utf-8")
+        os.replace(temporal, ruta)
+        return ruta
+
+
+# recolector de la ejecución (proceso actual)
+METRICAS = Metricas()
+_actual = contextvars.ContextVar("metricas_actuales", default=None)
+
+
+def metricas_actuales() -> Metricas:
+    return _actual.get() or METRICAS
+
+
+def etapa(nombre: str):
+    """with etapa("serializacion"): ...  (tiempo en el recolector actual)"""
+    return metricas_actuales().etapa(nombre)
+
+
+def contar(nombre: str, n: float = 1) -> None:
+    metricas_actuales().contar(nombre, n)
+
+
+@contextmanager
+def recolectar():
+    """Instala un recolector nuevo mientras dure el bloque y lo entrega."""
+    metricas = Metricas()
+    token = _actual.set(metricas)
+    try:
+        yield metricas
+    finally:
+        _actual.reset(token)
+
+
+def detalle_activo() -> bool:
+    return os.environ.get(VARIABLE_DETALLE, "") not in ("", "0")
+
+
+# =========================
+# INSTRUMENTACIÓN FINA
+# =========================
+def _envolver(funcion):
+    reloj = time.perf_counter
+    acumulado = [0, 0.0]
+
+    if inspect.isgeneratorfunction(funcion):
+        # generadores: se mide cada avance, no solo la creación
+        def medida(*args, **kwargs):
+            generador = funcion(*args, **kwargs)
+            try:
+                while True:
+                    t0 = reloj()
+                    try:
+                        valor = next(generador)
+                    except StopIteration:
+                        return
+                    finally:
+                        acumulado[1] += reloj() - t0
+                    yield valor
+            finally:
+                acumulado[0] += 1
+                generador.close()
+    else:
+        def medida(*args, **kwargs):
+            t0 = reloj()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                acumulado[0] += 1
+                acumulado[1] += reloj() - t0
+
+    return medida, acumulado
+
+
+@contextmanager
+def instrumentar(modulo, etapas: dict[str, str] = ETAPAS_DETALLE, metricas: Metricas | None = None):
+    """
+    Reemplaza temporalmente las funciones de `modulo` indicadas en etapas
+    (etapa -> "funcion" o "Clase.metodo") por versiones medidas. Los
+    tiempos son inclusivos (una etapa contiene a las que llama) y se suman
+    a `metricas` (el recolector actual si es None) al salir.
+    """
+    metricas = metricas_actuales() if metricas is None else metricas
+
+    def resolver(nombre):
+        *clase, atributo = nombre.split(".")
+        return (getattr(modulo, clase[0]) if clase else modulo), atributo
+
+    originales = {}
+    acumulados = {}
+    for nombre_etapa, nombre in etapas.items():
+        dueno, atributo = resolver(nombre)
+        originales[nombre] = getattr(dueno, atributo)
+        medida, acumulados[nombre_etapa] = _envolver(originales[nombre])
+        setattr(dueno, atributo, medida)
+    try:
+        yield metricas
+    finally:
+        for nombre, funcion in originales.items():
+            dueno, atributo = resolver(nombre)
+            setattr(dueno, atributo, funcion)
+        for nombre_etapa, (llamadas, segundos) in acumulados.items():
+            if llamadas:
+                metricas.sumar_tiempo(nombre_etapa, segundos, llamadas)
+
+
+# =========================
+# PERFIL (--perfil)
+# =========================
+FUNCIONES_PERFIL = 30
+LINEAS_MEMORIA_PERFIL = 15
+
+
+@contextmanager
+def perfilar(directorio: Path, nombre: str = "perfil"):
+    """
+    Envuelve un bloque en cProfile y tracemalloc. Al salir deja en
+    `directorio` el volcado <nombre>.prof (para snakeviz/pstats) y un
+    resumen <nombre>.txt con las funciones más costosas y las líneas que
+    más memoria asignaron. Solo mide el proceso actual: con trabajadores
+    en paralelo el parseo de los hijos no aparece.
+    """
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    ya_rastreaba = tracemalloc.is_tracing()
+    if not ya_rastreaba:
+        tracemalloc.start()
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        instantanea = tracemalloc.take_snapshot()
+        actual, pico = tracemalloc.get_traced_memory()
+        METRICAS.registrar_memoria()
+        if not ya_rastreaba:
+            tracemalloc.stop()
+
+        perfil.dump_stats(directorio / f"{nombre}.prof")
+
+        texto = io.StringIO()
+        texto.write(f"Memoria Python (tracemalloc): actual {actual / 1024 ** 2:.1f} MB, pico {pico / 1024 ** 2:.1f} MB\n\n")
+        texto.write(f"=== {FUNCIONES_PERFIL} funciones con más tiempo acumulado ===\n")
+        pstats.Stats(perfil, stream=texto).sort_stats("cumulative").print_stats(FUNCIONES_PERFIL)
+        texto.write(f"=== {FUNCIONES_PERFIL} funciones con más tiempo propio ===\n")
+        pstats.Stats(perfil, stream=texto).sort_stats("tottime").print_stats(FUNCIONES_PERFIL)
+        texto.write(f"=== {LINEAS_MEMORIA_PERFIL} líneas con más memoria asignada ===\n")
+        for estadistica in instantanea.statistics("lineno")[:LINEAS_MEMORIA_PERFIL]:
+            texto.write(f"{estadistica}\n")
+        (directorio / f"{nombre}.txt").write_text(texto.getvalue(), encoding="utf-8")
@@ -0,0 +1,175 @@
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from funciones import *
+
+
+# =========================
+# PIPELINE PARSEO -> CARGA
+# =========================
+# Modo superpuesto: mientras los trabajadores de parseo producen reportes,
+# un grupo de hilos escritores los carga a la BD. Las dos etapas corren a
+# la vez, así el tiempo total se acerca a max(parseo, carga) en lugar de
+# su suma.
+#
+#   [procesos de parseo] --(ventana acotada)--> cola acotada --> [hilos escritores]
+#
+# Contrapresión: el productor no envía más de VENTANA_POR_TRABAJADOR
+# reportes por trabajador al pool de procesos y se bloquea en put() cuando
+# la cola está llena. En memoria hay como máximo ventana + capacidad +
+# escritores reportes a la vez, sin importar cuántos haya en el directorio.
+CAPACIDAD_COLA = 4
+ESCRITORES = 2
+VENTANA_POR_TRABAJADOR = 2
+
+# marca de fin para los escritores (una por hilo)
+_FIN = object()
+
+
+class PipelineCarga:
+    """
+    Parseo y carga superpuestos con contrapresión.
+
+    - cargar: función (resumen, data) -> None que ejecuta las etapas de
+      salida de un reporte (BD, histórico, manifiesto). Corre en los hilos
+      escritores, por eso debe ser segura entre hilos; si falla, el error
+      queda en resumen["error"].
+    - trabajadores: procesos de parseo (1 = un hilo productor en este
+      mismo proceso).
+    - escritores: hilos que consumen la cola; cada uno usa su propia
+      conexión del pool (conviene escritores <= tamaño del pool).
+    - capacidad: reportes parseados que pueden esperar en la cola.
+    - selector: SelectorSegmentos que reciben los trabajadores de parseo.
+    - compacto: los reportes viajan por la cola como ReporteCompacto.
+    - tablas: los segmentos tabulares traen sus filas como campos.
+    """
+
+    def __init__(self, cargar, trabajadores=1, escritores=ESCRITORES, capacidad=CAPACIDAD_COLA,
+                 directorio_salida=None, formato_json=FORMATO_JSON_INDENTADO, fusionar_fragmentos=False,
+                 selector=SELECTOR_POR_DEFECTO, compacto=False, tablas=False):
+        self.cargar = cargar
+        self.trabajadores = max(1, trabajadores)
+        self.escritores = max(1, escritores)
+        self.capacidad = max(1, capacidad)
+        self.directorio_salida = directorio_salida
+        self.formato_json = formato_json
+        self.fusionar_fragmentos = fusionar_fragmentos
+        self.selector = selector
+        self.compacto = compacto
+        self.tablas = tablas
+
+        self._cola = queue.Queue(maxsize=self.capacidad)
+        self._lock = threading.Lock()
+        self._resultados = []
+        self._error_productor = None
+        self.estadisticas = {
+            "segundos_parseo": 0.0,
+            "segundos_carga": 0.0,
+            "segundos_total": 0.0,
+            "espera_cola": 0.0,
+            "max_en_cola": 0,
+        }
+
+    # -------------------------
+    # productor
+    # -------------------------
+    def _encolar(self, resumen):
+        inicio = time.perf_counter()
+        self._cola.put(resumen)  # bloquea si la carga va atrasada
+        with self._lock:
+            self.estadisticas["espera_cola"] += time.perf_counter() - inicio
+            self.estadisticas["segundos_parseo"] += resumen["segundos"]
+            self.estadisticas["max_en_cola"] = max(self.estadisticas["max_en_cola"], self._cola.qsize())
+
+    def _producir(self, rutas):
+        try:
+            if self.trabajadores <= 1 or len(rutas) <= 1:
+                for ruta in rutas:
+                    self._encolar(procesar_reporte(
+                        ruta, self.directorio_salida, self.formato_json, self.fusionar_fragmentos,
+                        self.selector, self.compacto, self.tablas,
+                    ))
+                return
+
+            ventana = self.trabajadores * VENTANA_POR_TRABAJADOR
+            with ProcessPoolExecutor(max_workers=self.trabajadores) as pool:
+                pendientes = set()
+                for ruta in rutas:
+                    if len(pendientes) >= ventana:
+                        listos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                        for futuro in listos:
+                            self._encolar(futuro.result())
+                    pendientes.add(pool.submit(
+                        procesar_reporte, ruta, self.directorio_salida, self.formato_json,
+                        self.fusionar_fragmentos, self.selector, self.compacto, self.tablas,
+                    ))
+                # el primero que termina pasa primero: un reporte lento no frena a los demás
+                while pendientes:
+                    listos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                    for futuro in listos:
+                        self._encolar(futuro.result())
+        except BaseException as e:
+            self._error_productor = e
+        finally:
+            for _ in range(self.escritores):
+                self._cola.put(_FIN)
+
+    # -------------------------
+    # escritores
+    # -------------------------
+    def _escribir(self):
+        while True:
+            resumen = self._cola.get()
+            if resumen is _FIN:
+                return
+
+            data = resumen.pop("data")
+            if resumen["ok"]:
+                inicio = time.perf_counter()
+                try:
+                    self.cargar(resumen, data)
+                except Exception as e:
+                    resumen["ok"] = False
+                    resumen["error"] = f"{type(e).__name__}: {e}"
+                with self._lock:
+                    self.estadisticas["segundos_carga"] += time.perf_counter() - inicio
+            del data  # libera el reporte antes de tomar el siguiente
+
+            with self._lock:
+                self._resultados.append(resumen)
+
+    # -------------------------
+    # ejecución
+    # -------------------------
+    def ejecutar(self, rutas):
+        """Procesa y carga todas las rutas; devuelve los resúmenes en el orden de entrada."""
+        rutas = list(rutas)
+        inicio = time.perf_counter()
+
+        hilos = [
+            threading.Thread(target=self._escribir, name=f"escritor-{n + 1}", daemon=True)
+            for n in range(self.escritores)
+        ]
+        for hilo in hilos:
+            hilo.start()
+
+        self._producir(rutas)
+        for hilo in hilos:
+            hilo.join()
+
+        self.estadisticas["segundos_total"] = time.perf_counter() - inicio
+        if self._error_productor is not None:
+            raise self._error_productor
+
+        orden = {ruta.name: i for i, ruta in enumerate(rutas)}
+        return sorted(self._resultados, key=lambda r: orden.get(r["archivo"], len(orden)))
+
+    def imprimir_estadisticas(self):
+        e = self.estadisticas
+        secuencial = e["segundos_parseo"] + e["segundos_carga"]
+        print(
+            f"Pipeline: {e['segundos_total']:.2f} s de pared "
+            f"(parseo {e['segundos_parseo']:.2f} s + carga {e['segundos_carga']:.2f} s = {secuencial:.2f} s en serie), "
+            f"espera por cola llena {e['espera_cola']:.2f} s, máximo en cola {e['max_en_cola']}/{self.capacidad}"
+        )
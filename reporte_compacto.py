@@ -0,0 +1,240 @@
+import sys
+import threading
+from array import array
+from collections.abc import ItemsView, Iterable, Mapping, ValuesView
+
+
+# =========================
+# MODELO COMPACTO DE REPORTE
+# =========================
+# parse_cicsadm devuelve un dict de dicts con strings nuevos por cada
+# reporte, aunque los nombres de campo ("Peak", "Attach Count") y los
+# valores ("Yes", "No", "0", "ACTIVE") se repiten miles de veces. Para
+# corridas que mantienen muchos reportes en memoria, ReporteCompacto
+# guarda lo mismo en arreglos:
+#
+#   titulos[i]              id del título del segmento i (tabla TITULOS)
+#   inicios[i]:inicios[i+1] rango de sus campos en `campos` / `valores`
+#   campos[j]               id del nombre de campo (tabla CAMPOS)
+#   valores[j]              valor (str internado con sys.intern)
+#
+# Las tablas de nombres son compartidas por todos los reportes del
+# proceso; los valores internados se comparten mientras algún reporte los
+# use. Hacia afuera el reporte es un Mapping {titulo: {campo: valor}} de
+# solo lectura: las vistas no copian nada.
+
+
+class TablaNombres:
+    """Nombres internados: nombre <-> índice, compartida entre reportes."""
+
+    def __init__(self):
+        self._indices: dict[str, int] = {}
+        self._nombres: list[str] = []
+        self._lock = threading.Lock()
+
+    def indice(self, nombre: str) -> int:
+        i = self._indices.get(nombre)
+        if i is None:
+            with self._lock:
+                i = self._indices.get(nombre)
+                if i is None:
+                    i = len(self._nombres)
+                    self._nombres.append(sys.intern(nombre))
+                    self._indices[self._nombres[i]] = i
+        return i
+
+    def buscar(self, nombre: str) -> int | None:
+        # sin agregar: una consulta por un nombre desconocido no hace crecer la tabla
+        return self._indices.get(nombre)
+
+    def nombre(self, indice: int) -> str:
+        return self._nombres[indice]
+
+    def __len__(self):
+        return len(self._nombres)
+
+
+TITULOS = TablaNombres()
+CAMPOS = TablaNombres()
+
+
+def _internar(valor):
+    return sys.intern(valor) if type(valor) is str else valor
+
+
+class VistaSegmento(Mapping):
+    """{campo: valor} de un segmento, leído directamente de los arreglos del reporte."""
+
+    __slots__ = ("_reporte", "_inicio", "_fin")
+
+    def __init__(self, reporte: "ReporteCompacto", inicio: int, fin: int):
+        self._reporte = reporte
+        self._inicio = inicio
+        self._fin = fin
+
+    def __getitem__(self, campo):
+        indice = CAMPOS.buscar(campo) if type(campo) is str else None
+        if indice is not None:
+            campos = self._reporte._campos
+            for j in range(self._inicio, self._fin):
+                if campos[j] == indice:
+                    return self._reporte._valores[j]
+        raise KeyError(campo)
+
+    def __iter__(self):
+        nombre = CAMPOS.nombre
+        campos = self._reporte._campos
+        for j in range(self._inicio, self._fin):
+            yield nombre(campos[j])
+
+    def __len__(self):
+        return self._fin - self._inicio
+
+    def items(self):
+        return _ItemsSegmento(self)
+
+    def values(self):
+        return _ValoresSegmento(self)
+
+    def __repr__(self):
+        return f"VistaSegmento({dict(self.items())!r})"
+
+
+class _ItemsSegmento(ItemsView):
+    # recorrido secuencial: sin buscar cada campo por nombre
+    def __iter__(self):
+        vista = self._mapping
+        nombre = CAMPOS.nombre
+        campos, valores = vista._reporte._campos, vista._reporte._valores
+        for j in range(vista._inicio, vista._fin):
+            yield nombre(campos[j]), valores[j]
+
+
+class _ValoresSegmento(ValuesView):
+    def __iter__(self):
+        vista = self._mapping
+        valores = vista._reporte._valores
+        for j in range(vista._inicio, vista._fin):
+            yield valores[j]
+
+
+class ReporteCompacto(Mapping):
+    """
+    Reporte parseado en forma compacta, con la misma interfaz de lectura
+    que el dict de parse_cicsadm: data[titulo][campo], data.items(),
+    len(data), ... Es inmutable; a_dict() da una copia dict de dicts.
+
+    Al serializarse (pickle entre procesos) viaja con sus propios nombres
+    y se vuelve a internar en las tablas del proceso que lo recibe.
+    """
+
+    __slots__ = ("_titulos", "_inicios", "_campos", "_valores", "_posiciones", "__weakref__")
+
+    def __init__(self, titulos: array, inicios: array, campos: array, valores: tuple):
+        self._titulos = titulos
+        self._inicios = inicios
+        self._campos = campos
+        self._valores = valores
+        self._posiciones = None  # titulo -> posición, al primer acceso por título
+
+    @classmethod
+    def desde_items(cls, items: Iterable[tuple[str, Mapping]]) -> "ReporteCompacto":
+        """Desde pares (titulo, {campo: valor}) en orden, p. ej. dict.items()."""
+        titulos, inicios, campos, valores = array("I"), array("I", [0]), array("I"), []
+        indice_titulo, indice_campo = TITULOS.indice, CAMPOS.indice
+        for titulo, segmento in items:
+            titulos.append(indice_titulo(titulo))
+            for campo, valor in segmento.items():
+                campos.append(indice_campo(campo))
+                valores.append(_internar(valor))
+            inicios.append(len(campos))
+        return cls(titulos, inicios, campos, tuple(valores))
+
+    def _posicion(self, titulo) -> int:
+        if self._posiciones is None:
+            self._posiciones = {TITULOS.nombre(t): i for i, t in enumerate(self._titulos)}
+        return self._posiciones[titulo]
+
+    def __getitem__(self, titulo) -> VistaSegmento:
+        i = self._posicion(titulo)
+        return VistaSegmento(self, self._inicios[i], self._inicios[i + 1])
+
+    def __contains__(self, titulo):
+        try:
+            self._posicion(titulo)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        nombre = TITULOS.nombre
+        for t in self._titulos:
+            yield nombre(t)
+
+    def __len__(self):
+        return len(self._titulos)
+
+    def items(self):
+        return _ItemsReporte(self)
+
+    def values(self):
+        return _ValoresReporte(self)
+
+    def segmentos(self) -> Iterable[tuple[str, VistaSegmento]]:
+        inicios = self._inicios
+        for i, t in enumerate(self._titulos):
+            yield TITULOS.nombre(t), VistaSegmento(self, inicios[i], inicios[i + 1])
+
+    @property
+    def total_campos(self) -> int:
+        return len(self._campos)
+
+    def a_dict(self) -> dict[str, dict]:
+        return {titulo: dict(segmento.items()) for titulo, segmento in self.segmentos()}
+
+    def __repr__(self):
+        return f"<ReporteCompacto {len(self)} segmentos, {self.total_campos} campos>"
+
+    # -------------------------
+    # pickle
+    # -------------------------
+    def __reduce__(self):
+        # los ids son del proceso: viajan los nombres usados (cada uno una vez)
+        locales, campos_locales = {}, array("I")
+        for c in self._campos:
+            campos_locales.append(locales.setdefault(c, len(locales)))
+        return (
+            _reconstruir_reporte,
+            (
+                [TITULOS.nombre(t) for t in self._titulos],
+                self._inicios.tobytes(),
+                [CAMPOS.nombre(c) for c in locales],
+                campos_locales.tobytes(),
+                self._valores,
+            ),
+        )
+
+
+def _reconstruir_reporte(titulos, inicios, nombres_campos, campos, valores) -> ReporteCompacto:
+    ids_campos = [CAMPOS.indice(n) for n in nombres_campos]
+    locales = array("I")
+    locales.frombytes(campos)
+    arreglo_inicios = array("I")
+    arreglo_inicios.frombytes(inicios)
+    return ReporteCompacto(
+        array("I", (TITULOS.indice(t) for t in titulos)),
+        arreglo_inicios,
+        array("I", (ids_campos[c] for c in locales)),
+        tuple(_internar(v) for v in valores),
+    )
+
+
+class _ItemsReporte(ItemsView):
+    def __iter__(self):
+        return self._mapping.segmentos()
+
+
+class _ValoresReporte(ValuesView):
+    def __iter__(self):
+        for _, segmento in self._mapping.segmentos():
+            yield segmento
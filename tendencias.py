@@ -0,0 +1,329 @@
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from funciones import *
+from almacen_columnar import AlmacenColumnar, REGION_DESCONOCIDA
+
+try:
+    import numpy as np
+except ImportError:  # el motor es vectorizado: sin numpy no se puede usar
+    np = None
+
+
+# =========================
+# TENDENCIAS POR DÍA
+# =========================
+# Cada fecha es una columna de una matriz [serie x fecha] de float64, donde
+# una serie es (region, segmento, campo). Agregar un día solo escribe su
+# columna (y las filas de series nuevas); deltas, tasas, ventanas móviles y
+# top-N se calculan sobre la matriz completa en bloque.
+CAPACIDAD_INICIAL = 64
+
+TOP_POR_DELTA = "delta"
+TOP_POR_PORCENTAJE = "porcentaje"
+
+
+def _requiere_numpy():
+    if np is None:
+        raise ImportError("numpy no está instalado: el motor de tendencias lo necesita")
+
+
+class MotorTendencias:
+    """
+    Series diarias alineadas por (region, segmento, campo).
+
+    La caché es por fecha: agregar_dia() / agregar_reporte() tocan solo la
+    columna de ese día, y guardar() escribe solo las fechas nuevas, así
+    que sumar un día no recalcula el histórico. Cada fecha cargada desde
+    el histórico recuerda la firma de sus .col (AlmacenColumnar.firma):
+    si después se agregan reportes de esa fecha (otra región, --vigilar,
+    una recarga) la fecha se vuelve a leer.
+    """
+
+    def __init__(self):
+        _requiere_numpy()
+        self.claves: list[tuple[str, str, str]] = []
+        self._indice: dict[tuple[str, str, str], int] = {}
+        self.fechas: list[str] = []
+        self._columna: dict[str, int] = {}
+        self._datos = np.full((CAPACIDAD_INICIAL, CAPACIDAD_INICIAL), np.nan)
+        self._sucias: set[str] = set()
+        self._firmas: dict[str, list] = {}
+
+    # -------------------------
+    # carga incremental
+    # -------------------------
+    def _fila(self, clave) -> int:
+        fila = self._indice.get(clave)
+        if fila is None:
+            fila = len(self.claves)
+            self.claves.append(clave)
+            self._indice[clave] = fila
+        return fila
+
+    def _asegurar_capacidad(self, filas: int, columnas: int) -> None:
+        cap_filas, cap_columnas = self._datos.shape
+        if filas <= cap_filas and columnas <= cap_columnas:
+            return
+        # crecimiento al doble: agregar días/series cuesta O(1) amortizado
+        while cap_filas < filas:
+            cap_filas *= 2
+        while cap_columnas < columnas:
+            cap_columnas *= 2
+        nuevas = np.full((cap_filas, cap_columnas), np.nan)
+        nuevas[:self._datos.shape[0], :self._datos.shape[1]] = self._datos
+        self._datos = nuevas
+
+    def _columna_de(self, fecha: str) -> int:
+        columna = self._columna.get(fecha)
+        if columna is not None:
+            return columna
+
+        self._asegurar_capacidad(len(self.claves), len(self.fechas) + 1)
+        if self.fechas and fecha < self.fechas[-1]:
+            # fecha atrasada (p. ej. recarga de un día viejo): se inserta en orden
+            posicion = next(i for i, f in enumerate(self.fechas) if f > fecha)
+            n = len(self.fechas)
+            self._datos[:, posicion + 1:n + 1] = self._datos[:, posicion:n]
+            self._datos[:, posicion] = np.nan
+            self.fechas.insert(posicion, fecha)
+            self._columna = {f: i for i, f in enumerate(self.fechas)}
+            return posicion
+
+        self.fechas.append(fecha)
+        self._columna[fecha] = len(self.fechas) - 1
+        return len(self.fechas) - 1
+
+    def agregar_valores(self, fecha: str, claves: list, valores) -> None:
+        """Carga en bloque los valores de un día: claves[i] -> valores[i]."""
+        filas = np.fromiter((self._fila(c) for c in claves), dtype=np.int64, count=len(claves))
+        columna = self._columna_de(fecha)
+        self._asegurar_capacidad(len(self.claves), len(self.fechas))
+        self._datos[filas, columna] = np.asarray(valores, dtype=np.float64)
+        self._sucias.add(fecha)
+
+    def agregar_reporte(self, fecha: str, region: str | None, data: dict) -> None:
+        """Un reporte parseado {segmento: {campo: valor}} del día `fecha`."""
+        region = region or REGION_DESCONOCIDA
+        claves, valores = [], []
+        for segmento, campos in data.items():
+            for campo, valor in campos.items():
+                numero = normalizar_valor("" if valor is None else str(valor)).numero
+                if numero is None:
+                    continue
+                claves.append((region, segmento, campo))
+                valores.append(numero)
+        self.agregar_valores(fecha, claves, valores)
+
+    def agregar_dia(self, almacen: AlmacenColumnar, fecha: str) -> int:
+        """Carga (o recarga) una fecha desde el histórico columnar (solo 4 columnas)."""
+        # la firma se toma antes de leer: un reporte que llega durante la lectura fuerza otra recarga
+        self._firmas[fecha] = almacen.firma(fecha)
+        self._datos[:, self._columna_de(fecha)] = np.nan
+        datos = almacen.leer(["region", "segmento", "campo", "valor_num"], fecha_desde=fecha,
+                             fecha_hasta=fecha, como_numpy=True)
+        valores = datos["valor_num"]
+        numericos = ~np.isnan(valores)
+        claves = list(zip(datos["region"][numericos], datos["segmento"][numericos], datos["campo"][numericos]))
+        self.agregar_valores(fecha, claves, valores[numericos])
+        return len(claves)
+
+    def fechas_desactualizadas(self, almacen: AlmacenColumnar) -> list[str]:
+        """Fechas del histórico que faltan o cuyos .col cambiaron desde que se cargaron."""
+        return [f for f in almacen.fechas() if f not in self._columna or self._firmas.get(f) != almacen.firma(f)]
+
+    def actualizar_desde_almacen(self, almacen: AlmacenColumnar, recargar: Iterable[str] = ()) -> list[str]:
+        """Agrega las fechas del histórico que faltan o cambiaron (más las de `recargar`)."""
+        recargar = set(recargar)
+        nuevas = sorted(set(self.fechas_desactualizadas(almacen)) | (recargar & set(almacen.fechas())))
+        for fecha in nuevas:
+            self.agregar_dia(almacen, fecha)
+        return nuevas
+
+    # -------------------------
+    # persistencia de la caché
+    # -------------------------
+    def guardar(self, directorio: Path) -> None:
+        """Escribe claves.json, firmas.json y un .npy por cada fecha modificada."""
+        directorio = Path(directorio)
+        directorio.mkdir(parents=True, exist_ok=True)
+        filas = len(self.claves)
+        for fecha in sorted(self._sucias):
+            destino = directorio / f"{fecha}.npy"
+            temporal = directorio / f"{fecha}.tmp.npy"
+            np.save(temporal, self._datos[:filas, self._columna[fecha]])
+            os.replace(temporal, destino)
+
+        temporal = directorio / "claves.json.tmp"
+        temporal.write_text(json.dumps(self.claves, ensure_ascii=False), encoding="utf-8")
+        os.replace(temporal, directorio / "claves.json")
+        temporal = directorio / "firmas.json.tmp"
+        temporal.write_text(json.dumps(self._firmas, ensure_ascii=False), encoding="utf-8")
+        os.replace(temporal, directorio / "firmas.json")
+        self._sucias.clear()
+
+    @classmethod
+    def cargar(cls, directorio: Path) -> "MotorTendencias":
+        motor = cls()
+        directorio = Path(directorio)
+        try:
+            claves = json.loads((directorio / "claves.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return motor
+
+        for clave in claves:
+            motor._fila(tuple(clave))
+        try:
+            # sin firmas (caché de una versión anterior) cada fecha se recarga una vez
+            motor._firmas = json.loads((directorio / "firmas.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            motor._firmas = {}
+        for ruta in sorted(directorio.glob("*.npy")):
+            if ruta.name.endswith(".tmp.npy"):
+                continue
+            columna = np.load(ruta)
+            fecha = ruta.stem
+            # una columna guardada antes de que aparecieran series nuevas es más corta
+            j = motor._columna_de(fecha)
+            motor._asegurar_capacidad(len(motor.claves), len(motor.fechas))
+            motor._datos[:len(columna), j] = columna
+        return motor
+
+    # -------------------------
+    # cálculos vectorizados
+    # -------------------------
+    def matriz(self) -> "np.ndarray":
+        """Vista [serie x fecha] (NaN donde una serie no tiene valor ese día)."""
+        return self._datos[:len(self.claves), :len(self.fechas)]
+
+    def seleccionar(self, regiones=None, segmentos=None, campos=None) -> "np.ndarray":
+        """Índices de las series que cumplen el filtro."""
+        regiones = set(regiones) if regiones is not None else None
+        segmentos = set(segmentos) if segmentos is not None else None
+        campos = set(campos) if campos is not None else None
+        return np.array([
+            i for i, (region, segmento, campo) in enumerate(self.claves)
+            if (regiones is None or region in regiones)
+            and (segmentos is None or segmento in segmentos)
+            and (campos is None or campo in campos)
+        ], dtype=np.int64)
+
+    def deltas(self, periodos: int = 1) -> "np.ndarray":
+        """valor[t] - valor[t - periodos]; columnas alineadas con fechas[periodos:]."""
+        m = self.matriz()
+        return m[:, periodos:] - m[:, :-periodos]
+
+    def tasas(self, periodos: int = 1) -> "np.ndarray":
+        """Delta por día calendario (los días sin reporte no se cuentan dos veces)."""
+        dias = np.array(self.fechas, dtype="datetime64[D]").astype(np.int64)
+        return self.deltas(periodos) / (dias[periodos:] - dias[:-periodos])
+
+    def variacion_porcentual(self, periodos: int = 1) -> "np.ndarray":
+        m = self.matriz()
+        anterior = m[:, :-periodos]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(anterior != 0, (m[:, periodos:] - anterior) / np.abs(anterior) * 100.0, np.nan)
+
+    def ventana_movil(self, dias: int, minimo: int = 1) -> "np.ndarray":
+        """
+        Media móvil de `dias` fechas ignorando NaN (columnas alineadas con
+        fechas); NaN si la ventana tiene menos de `minimo` valores.
+        """
+        m = self.matriz()
+        validos = ~np.isnan(m)
+        suma = np.cumsum(np.where(validos, m, 0.0), axis=1)
+        cuenta = np.cumsum(validos, axis=1)
+        suma[:, dias:] = suma[:, dias:] - suma[:, :-dias]
+        cuenta[:, dias:] = cuenta[:, dias:] - cuenta[:, :-dias]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(cuenta >= minimo, suma / cuenta, np.nan)
+
+    def top_movimientos(self, n: int = 10, fecha: str | None = None, por: str = TOP_POR_DELTA,
+                        regiones=None, segmentos=None, campos=None) -> list[dict]:
+        """
+        Las n series que más cambiaron entre `fecha` (la última por
+        defecto) y la fecha anterior, por valor absoluto del delta o de la
+        variación porcentual.
+        """
+        if len(self.fechas) < 2:
+            return []
+        j = len(self.fechas) - 1 if fecha is None else self._columna[fecha]
+        if j == 0:
+            return []
+
+        m = self.matriz()
+        filas = self.seleccionar(regiones, segmentos, campos) if (regiones or segmentos or campos) \
+            else np.arange(len(self.claves))
+        anterior = m[filas, j - 1]
+        actual = m[filas, j]
+        delta = actual - anterior
+        with np.errstate(divide="ignore", invalid="ignore"):
+            porcentaje = np.where(anterior != 0, delta / np.abs(anterior) * 100.0, np.nan)
+
+        criterio = np.abs(delta if por == TOP_POR_DELTA else porcentaje)
+        criterio = np.where(np.isnan(criterio), -1.0, criterio)
+        k = min(n, len(filas))
+        if k == 0:
+            return []
+        mejores = np.argpartition(-criterio, k - 1)[:k]
+        mejores = mejores[np.argsort(-criterio[mejores], kind="stable")]
+
+        out = []
+        for i in mejores:
+            if criterio[i] < 0:
+                break
+            region, segmento, campo = self.claves[filas[i]]
+            out.append({
+                "region": region,
+                "segmento": segmento,
+                "campo": campo,
+                "fecha_anterior": self.fechas[j - 1],
+                "fecha": self.fechas[j],
+                "anterior": float(anterior[i]),
+                "actual": float(actual[i]),
+                "delta": float(delta[i]),
+                "porcentaje": None if np.isnan(porcentaje[i]) else float(porcentaje[i]),
+            })
+        return out
+
+    def serie(self, region: str, segmento: str, campo: str) -> dict[str, float]:
+        fila = self._indice.get((region, segmento, campo))
+        if fila is None:
+            return {}
+        valores = self.matriz()[fila]
+        return {f: float(v) for f, v in zip(self.fechas, valores) if not np.isnan(v)}
+
+    def __len__(self) -> int:
+        return len(self.claves)
+
+
+def leer_argumentos(argv=None):
+    raiz = Path(__file__).parent
+    parser = argparse.ArgumentParser(description="Top de cambios día a día sobre el histórico columnar.")
+    parser.add_argument("--historial", type=Path, default=raiz / "HISTORIAL_COLUMNAR")
+    parser.add_argument("--cache", type=Path, default=raiz / "TENDENCIAS_CACHE")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--por", choices=(TOP_POR_DELTA, TOP_POR_PORCENTAJE), default=TOP_POR_DELTA)
+    parser.add_argument("--fecha", default=None, help="fecha a comparar con la anterior (por defecto la última)")
+    parser.add_argument("--region", action="append", default=None)
+    parser.add_argument("--segmento", action="append", default=None)
+    parser.add_argument("--campo", action="append", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = leer_argumentos(argv)
+    motor = MotorTendencias.cargar(args.cache)
+    nuevas = motor.actualizar_desde_almacen(AlmacenColumnar(args.historial))
+    if nuevas:
+        motor.guardar(args.cache)
+    print(f"Series: {len(motor)}, fechas: {len(motor.fechas)} ({len(nuevas)} nuevas)", file=sys.stderr)
+
+    top = motor.top_movimientos(args.top, args.fecha, args.por, args.region, args.segmento, args.campo)
+    print(json.dumps(top, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
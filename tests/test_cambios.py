@@ -0,0 +1,154 @@
+import sqlite3
+
+import pytest
+
+import cambios
+import conexionBD
+from cambios import CacheUltimosValores, diferencias, filasCambios, reconstruir_snapshot, valores_reporte
+from conexionBD import configurar_pool
+
+
+def test_valores_reporte_omite_segmentos_vacios():
+    data = {
+        "Resumen": {"Max IP Sockets": 255, "Descripción": None},
+        "Vacío": {},
+        "Texto": "no es un segmento",
+    }
+    assert valores_reporte(data) == {
+        ("Resumen", "Max IP Sockets"): "255",
+        ("Resumen", "Descripción"): "",
+    }
+
+
+def test_diferencias_cambios_lapidas_y_sin_cambios():
+    anteriores = {
+        ("Resumen", "MVS Product Name"): "z/OS",
+        ("Resumen", "Max IP Sockets"): "255",
+        ("Resumen", "Quitado"): "X",
+    }
+    data = {"Resumen": {"MVS Product Name": "z/OS", "Max IP Sockets": "512", "Nuevo": "1"}}
+
+    cambiados, eliminados, sin_cambio = diferencias(anteriores, data)
+    assert sorted(cambiados) == [("Resumen", "Max IP Sockets", "512"), ("Resumen", "Nuevo", "1")]
+    assert eliminados == [("Resumen", "Quitado")]
+    assert sin_cambio == 1
+
+
+def test_diferencias_sin_snapshot_anterior_es_todo_cambio():
+    cambiados, eliminados, sin_cambio = diferencias({}, {"Resumen": {"A": "1", "B": "2"}})
+    assert len(cambiados) == 2
+    assert eliminados == []
+    assert sin_cambio == 0
+
+
+def test_filas_cambios_normaliza_y_marca_lapidas():
+    filas = filasCambios(
+        "2025-04-11", 7,
+        [("Resumen", "Region size", "10,216K")],
+        [("Resumen", "Quitado")],
+        {"Resumen": 3}, {"Region size": 11, "Quitado": 12},
+    )
+    assert filas == [
+        (7, 3, 11, "10,216K", 10216 * 1024.0, None, "bytes", "2025-04-11", 0),
+        (7, 3, 12, None, None, None, None, "2025-04-11", 1),
+    ]
+
+
+def test_cache_aplica_y_persiste_entre_aperturas(tmp_path):
+    ruta = tmp_path / "cdc.sqlite3"
+    cache = CacheUltimosValores(ruta)
+    assert cache.estado("CICSADM") is None
+
+    cache.reemplazar("CICSADM", {("Resumen", "A"): "1", ("Resumen", "B"): "2"}, "2025-04-10", 1)
+    cache.aplicar("CICSADM", [("Resumen", "A", "9")], [("Resumen", "B")], "2025-04-11", 2)
+    cache.cerrar()
+
+    cache = CacheUltimosValores(ruta)
+    assert cache.estado("CICSADM") == ("2025-04-11", 2)
+    assert cache.valores("CICSADM") == {("Resumen", "A"): "9"}
+
+    cache.olvidar("CICSADM")
+    assert cache.estado("CICSADM") is None
+    assert cache.valores("CICSADM") == {}
+    cache.cerrar()
+
+
+def test_cache_reemplazar_descarta_solo_el_archivo(tmp_path):
+    cache = CacheUltimosValores(tmp_path / "cdc.sqlite3")
+    cache.reemplazar("A", {("S", "x"): "1", ("S", "y"): "2"}, "2025-04-10", 1)
+    cache.reemplazar("B", {("S", "x"): "3"}, "2025-04-10", 1)
+
+    cache.reemplazar("A", {("S", "z"): "4"}, "2025-04-11", 5)
+    assert cache.valores("A") == {("S", "z"): "4"}
+    assert cache.valores("B") == {("S", "x"): "3"}
+    assert cache.estado("A") == ("2025-04-11", 5)
+    cache.cerrar()
+
+
+class _Archivos:
+    def id(self, nombre):
+        return {"CICSADM": 1}.get(nombre)
+
+
+@pytest.fixture
+def bd_cambios(tmp_path, monkeypatch):
+    """validacion_sistema_cambios y sus dimensiones en SQLite, detrás del pool."""
+    ruta = tmp_path / "cambios.sqlite3"
+    with sqlite3.connect(ruta) as conn:
+        conn.executescript(
+            """
+            CREATE TABLE segmento (id INTEGER PRIMARY KEY, segmento TEXT);
+            CREATE TABLE campo (id INTEGER PRIMARY KEY, campo TEXT);
+            CREATE TABLE validacion_sistema_cambios (
+                archivo INTEGER, segmento INTEGER, campo INTEGER,
+                valor TEXT, valor_num REAL, valor_fecha TEXT, tipo_valor TEXT, fecha TEXT, eliminado INTEGER
+            );
+            INSERT INTO segmento VALUES (3, 'Resumen');
+            INSERT INTO campo VALUES (11, 'A'), (12, 'B'), (13, 'C');
+            """
+        )
+    configurar_pool(lambda: sqlite3.connect(ruta, check_same_thread=False), tamano=1)
+    monkeypatch.setattr(cambios, "asegurar_esquema", lambda: None)
+    monkeypatch.setattr(cambios, "cache_archivos", _Archivos())
+
+    def escribir(filas):
+        with sqlite3.connect(ruta) as conn:
+            # mismas columnas que filasCambios (el staging de INSERT_CARGA_CDC_SQL)
+            conn.executemany("INSERT INTO validacion_sistema_cambios VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", filas)
+
+    yield escribir
+    conexionBD._pool.cerrar()
+    conexionBD._pool = None
+    conexionBD._pool_config = {}
+
+
+def test_reconstruir_snapshot_a_cada_fecha(bd_cambios):
+    # día 10: carga completa; día 11: A cambia y B se elimina; día 12: B vuelve
+    bd_cambios(
+        filasCambios("2025-04-10", 1, [("Resumen", "A", "1"), ("Resumen", "B", "2")], [],
+                     {"Resumen": 3}, {"A": 11, "B": 12})
+        + filasCambios("2025-04-11", 1, [("Resumen", "A", "5")], [("Resumen", "B")],
+                       {"Resumen": 3}, {"A": 11, "B": 12})
+        + filasCambios("2025-04-12", 1, [("Resumen", "B", "7")], [],
+                       {"Resumen": 3}, {"B": 12})
+    )
+
+    assert reconstruir_snapshot("CICSADM", "2025-04-09") == {}
+    assert reconstruir_snapshot("CICSADM", "2025-04-10") == {"Resumen": {"A": "1", "B": "2"}}
+    assert reconstruir_snapshot("CICSADM", "2025-04-11") == {"Resumen": {"A": "5"}}
+    assert reconstruir_snapshot("CICSADM", "2025-04-12") == {"Resumen": {"A": "5", "B": "7"}}
+    assert reconstruir_snapshot("OTRO", "2025-04-12") == {}
+
+
+def test_snapshot_reconstruido_mas_diferencias_reproduce_el_reporte(bd_cambios):
+    dia1 = {"Resumen": {"A": "1", "B": "2", "C": "3"}}
+    dia2 = {"Resumen": {"A": "1", "C": "4"}}
+    ids_segmentos, ids_campos = {"Resumen": 3}, {"A": 11, "B": 12, "C": 13}
+
+    for anterior, fecha, data in (("2025-04-09", "2025-04-10", dia1), ("2025-04-10", "2025-04-11", dia2)):
+        anteriores = valores_reporte(reconstruir_snapshot("CICSADM", anterior))
+        cambiados, eliminados, _ = diferencias(anteriores, data)
+        bd_cambios(filasCambios(fecha, 1, cambiados, eliminados, ids_segmentos, ids_campos))
+
+    assert reconstruir_snapshot("CICSADM", "2025-04-10") == dia1
+    assert reconstruir_snapshot("CICSADM", "2025-04-11") == dia2
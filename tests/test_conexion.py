@@ -0,0 +1,102 @@
+import sqlite3
+import threading
+
+import pytest
+
+import conexionBD
+from conexionBD import PoolAgotadoError, configurar_pool, conexion
+
+
+@pytest.fixture
+def crear_pool(tmp_path):
+    """configurar_pool con sqlite3 como fábrica; se cierra al terminar la prueba."""
+    ruta = tmp_path / "pool.sqlite3"
+    with sqlite3.connect(ruta) as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+
+    def crear(**opciones):
+        return configurar_pool(lambda: sqlite3.connect(ruta, check_same_thread=False), **opciones)
+
+    yield crear
+    if conexionBD._pool is not None:
+        conexionBD._pool.cerrar()
+    conexionBD._pool = None
+    conexionBD._pool_config = {}
+
+
+def test_prestamo_anidado_reutiliza_la_conexion(crear_pool):
+    pool = crear_pool(tamano=2)
+    with conexion() as externa:
+        with conexion() as interna:
+            assert interna is externa
+    with conexion() as siguiente:
+        assert siguiente is externa
+
+    stats = pool.estadisticas()
+    assert stats["abiertas"] == 1
+    assert stats["prestamos"] == 2
+    assert stats["reutilizadas"] == 1
+    assert stats["prestadas"] == 0
+
+
+def test_otro_hilo_espera_y_se_agota(crear_pool):
+    pool = crear_pool(tamano=1, espera=0.1)
+    errores = []
+
+    def otro_hilo():
+        try:
+            with conexion():
+                pass
+        except PoolAgotadoError as e:
+            errores.append(e)
+
+    with conexion():
+        hilo = threading.Thread(target=otro_hilo)
+        hilo.start()
+        hilo.join()
+
+    assert len(errores) == 1
+    # liberada la conexión, el otro hilo la reutiliza
+    hilo = threading.Thread(target=otro_hilo)
+    hilo.start()
+    hilo.join()
+    assert len(errores) == 1
+    assert pool.estadisticas()["abiertas"] == 1
+
+
+def test_devolver_descarta_lo_no_confirmado(crear_pool):
+    crear_pool(tamano=1)
+    with conexion() as conn:
+        conn.execute("INSERT INTO t VALUES (1)")
+    with conexion() as conn:
+        conn.execute("INSERT INTO t VALUES (2)")
+        conn.commit()
+    with conexion() as conn:
+        assert conn.execute("SELECT x FROM t").fetchall() == [(2,)]
+
+
+def test_conexion_rota_se_descarta_en_la_verificacion(crear_pool):
+    pool = crear_pool(tamano=1, verificar_tras=0.0)
+    with conexion() as conn:
+        rota = conn
+    rota.close()  # muere mientras está inactiva en el pool
+
+    with conexion() as conn:
+        assert conn is not rota
+        assert conn.execute("SELECT 1").fetchone() == (1,)
+
+    stats = pool.estadisticas()
+    assert stats["fallos_salud"] == 1
+    assert stats["abiertas"] == 2
+    assert stats["vivas"] == 1
+
+
+def test_contabiliza_fugas(crear_pool):
+    pool = crear_pool(umbral_fuga=0.0)
+    with conexion():
+        stats = pool.estadisticas()
+        assert stats["prestadas"] == 1
+        assert stats["fugas"] == 1
+        (_, hilo), = pool.fugas()
+        assert hilo == threading.current_thread().name
+    assert pool.estadisticas()["fugas"] == 0
@@ -0,0 +1,204 @@
+import contextlib
+
+import pytest
+
+import funciones
+from funciones import abrirLoteCarga, confirmarTrozo, huella_filas, publicarLote
+
+
+class BDFalsa:
+    """carga_diario, carga_checkpoint, el staging y validacion_sistema en memoria."""
+
+    def __init__(self):
+        self.diario = {}  # lote -> dict
+        self.checkpoints = set()  # (lote, trozo)
+        self.staging = []  # (lote, archivo, segmento, campo, valor, num, fecha_valor, tipo, fecha)
+        self.publicadas = {}  # (fecha, archivo, segmento, campo) -> valor
+
+    def conexion(self):
+        return contextlib.nullcontext(_Conexion(self))
+
+
+def _clave(fila):
+    lote, archivo, segmento, campo, valor, _, _, _, fecha = fila
+    return (fecha, archivo, segmento, campo)
+
+
+class _Cursor:
+    fast_executemany = False
+
+    def __init__(self, conn):
+        self.conn, self.bd, self.res, self.rowcount = conn, conn.bd, [], -1
+
+    def execute(self, sql, p=()):
+        bd, diferir, self.res = self.bd, self.conn.pendientes.append, []
+        if sql is funciones.BUSCAR_DIARIO_SQL:
+            # el último lote abierto gana (el dict conserva el orden de inserción)
+            self.res = [
+                (lote, d["huella"], d["tamano"], d["estado"], d["distintas"])
+                for lote, d in bd.diario.items()
+                if (d["archivo"], d["fecha"]) == p and d["estado"] in ("cargando", "publicada")
+            ][-1:]
+        elif sql is funciones.INICIAR_DIARIO_SQL:
+            lote, archivo, fecha, huella, tamano, _, _ = p
+            diferir(lambda: bd.diario.__setitem__(lote, dict(
+                archivo=archivo, fecha=fecha, huella=huella, tamano=tamano,
+                estado="cargando", publicadas=None, distintas=None,
+            )))
+        elif sql is funciones.CONTAR_PUBLICADAS_SQL:
+            self.res = [(sum(1 for c in bd.publicadas if c[:2] == p),)]
+        elif sql is funciones.CHECKPOINT_SQL:
+            diferir(lambda: bd.checkpoints.add(p[:2]))
+        elif sql is funciones.CONTAR_DISTINTAS_SQL:
+            self.res = [(sum(
+                1 for f in bd.staging
+                if f[0] == p[0] and _clave(f) in bd.publicadas and bd.publicadas[_clave(f)] != f[4]
+            ),)]
+        elif sql is funciones.PUBLICAR_CARGA_SQL:
+            nuevas = {_clave(f): f[4] for f in bd.staging if f[0] == p[0] and _clave(f) not in bd.publicadas}
+            self.rowcount = len(nuevas)
+            diferir(lambda: bd.publicadas.update(nuevas))
+        elif sql.startswith("SELECT trozo FROM carga_checkpoint"):
+            self.res = [(t,) for lote, t in bd.checkpoints if lote == p[0]]
+        elif sql.startswith("SELECT 1 FROM carga_checkpoint"):
+            self.res = [(1,)] if tuple(p) in bd.checkpoints else []
+        elif sql.startswith("SELECT estado, filas_publicadas, filas_distintas"):
+            d = bd.diario.get(p[0])
+            self.res = [] if d is None else [(d["estado"], d["publicadas"], d["distintas"])]
+        elif sql.startswith("DELETE FROM validacion_sistema_carga"):
+            diferir(lambda: setattr(bd, "staging", [f for f in bd.staging if f[0] != p[0]]))
+        elif sql.startswith("DELETE FROM carga_checkpoint"):
+            diferir(lambda: setattr(bd, "checkpoints", {c for c in bd.checkpoints if c[0] != p[0]}))
+        elif sql.startswith("UPDATE carga_diario SET estado = 'publicada'"):
+            diferir(lambda: bd.diario[p[2]].update(estado="publicada", publicadas=p[0], distintas=p[1]))
+        elif sql.startswith("UPDATE carga_diario SET estado = 'abandonada'"):
+            diferir(lambda: bd.diario[p[0]].update(estado="abandonada"))
+        else:
+            raise AssertionError(f"SQL inesperado: {sql}")
+
+    def executemany(self, sql, filas):
+        assert sql is funciones.INSERT_CARGA_SQL
+        self.conn.pendientes.append(lambda: self.bd.staging.extend(filas))
+
+    def fetchone(self):
+        return self.res[0] if self.res else None
+
+    def fetchall(self):
+        return self.res
+
+
+class _Conexion:
+    def __init__(self, bd):
+        self.bd, self.pendientes = bd, []
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        for operacion in self.pendientes:
+            operacion()
+        self.pendientes = []
+
+    def rollback(self):
+        self.pendientes = []
+
+
+@pytest.fixture
+def bd(monkeypatch):
+    falsa = BDFalsa()
+    monkeypatch.setattr(funciones, "conexion", falsa.conexion)
+    return falsa
+
+
+def _filas(valores, fecha="2025-04-11", archivo=1):
+    # como filasValidacionSistema: (archivo, segmento, campo, valor, num, fecha_valor, tipo, fecha)
+    return [(archivo, 3, campo, valor, None, None, "texto", fecha) for campo, valor in enumerate(valores)]
+
+
+def _cargar(filas, tamano=2, forzar=False, fallar_en=None):
+    """Lo que hace insertarValidacionSistemaMasivo, sin reintentos; fallar_en corta antes de ese trozo."""
+    trozos = [filas[i:i + tamano] for i in range(0, len(filas), tamano)]
+    carga = abrirLoteCarga(1, "2025-04-11", huella_filas(filas), tamano, len(trozos), len(filas), forzar)
+    if carga.publicada:
+        return carga, None
+    for n, trozo in enumerate(trozos):
+        if n == fallar_en:
+            raise ConnectionError("red caída")
+        if n not in carga.confirmados:
+            confirmarTrozo(carga.lote, n, trozo)
+    return carga, publicarLote(carga.lote)
+
+
+def test_huella_depende_del_contenido_y_del_orden():
+    filas = _filas(["a", "b"])
+    assert huella_filas(filas) == huella_filas(list(filas))
+    assert huella_filas(filas) != huella_filas(filas[::-1])
+    assert huella_filas(filas) != huella_filas(_filas(["a", "c"]))
+    assert len(huella_filas([])) == 64
+
+
+def test_carga_cortada_se_reanuda_en_el_primer_trozo_sin_checkpoint(bd):
+    filas = _filas("abcde")
+    with pytest.raises(ConnectionError):
+        _cargar(filas, fallar_en=2)
+    assert len(bd.staging) == 4 and not bd.publicadas
+
+    carga, publicacion = _cargar(filas)
+    assert carga.confirmados == {0, 1}
+    assert publicacion == (5, 0)
+    assert len(bd.publicadas) == 5
+    assert bd.staging == [] and bd.checkpoints == set()
+    assert [d["estado"] for d in bd.diario.values()] == ["publicada"]
+
+
+def test_trozo_ya_confirmado_no_se_duplica(bd):
+    filas = _filas("ab")
+    carga = abrirLoteCarga(1, "2025-04-11", huella_filas(filas), 2, 1, 2)
+    confirmarTrozo(carga.lote, 0, filas)
+    confirmarTrozo(carga.lote, 0, filas)  # el commit llegó pero la respuesta se perdió
+    assert len(bd.staging) == 2
+
+
+def test_otro_contenido_abandona_el_lote_a_medias(bd):
+    with pytest.raises(ConnectionError):
+        _cargar(_filas("abcd"), fallar_en=1)
+    carga, publicacion = _cargar(_filas("wxyz"))
+
+    assert carga.confirmados == frozenset()
+    assert publicacion == (4, 0)
+    assert sorted(d["estado"] for d in bd.diario.values()) == ["abandonada", "publicada"]
+    assert bd.staging == [] and bd.checkpoints == set()
+
+
+def test_mismo_contenido_publicado_no_se_repite_salvo_que_falten_filas(bd):
+    filas = _filas("abc")
+    _cargar(filas)
+    carga, _ = _cargar(filas)
+    assert carga.publicada
+    assert len(bd.diario) == 1
+
+    del bd.publicadas[("2025-04-11", 1, 3, 0)]
+    carga, publicacion = _cargar(filas)
+    assert not carga.publicada
+    assert publicacion == (1, 0)
+
+    _, publicacion = _cargar(filas, forzar=True)
+    assert publicacion == (0, 0)
+
+
+def test_republicar_otro_valor_no_pisa_y_lo_cuenta(bd):
+    _cargar(_filas("abc"))
+    _, publicacion = _cargar(_filas("aXcd"))
+
+    assert publicacion == (1, 1)
+    assert bd.publicadas[("2025-04-11", 1, 3, 1)] == "b"
+    # la misma carga otra vez: el diario conserva cuántas quedaron sin actualizar
+    carga, _ = _cargar(_filas("aXcd"))
+    assert carga.publicada and carga.distintas == 1
+
+
+def test_publicar_dos_veces_devuelve_lo_registrado(bd):
+    filas = _filas("ab")
+    carga, publicacion = _cargar(filas)
+    assert publicarLote(carga.lote) == publicacion == (2, 0)
+    assert len(bd.publicadas) == 2
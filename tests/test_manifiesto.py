@@ -0,0 +1,41 @@
+import os
+
+from manifiesto import ManifiestoReportes, firma_archivo
+
+
+def test_cambio_entre_parseo_y_carga_queda_pendiente(tmp_path):
+    reporte = tmp_path / "CICSADM.TXT"
+    reporte.write_text("contenido original\n", encoding="utf-8")
+    firma = firma_archivo(reporte)  # lo que procesar_reporte toma antes de parsear
+
+    # el reporte crece mientras se carga la versión anterior
+    with open(reporte, "a", encoding="utf-8") as f:
+        f.write("más líneas\n")
+
+    manifiesto = ManifiestoReportes(tmp_path / "manifiesto.json")
+    manifiesto.registrar(reporte, **firma)
+    assert manifiesto.pendientes([reporte]) == ([reporte], [])
+
+
+def test_mismo_contenido_con_otro_mtime_no_se_reprocesa(tmp_path):
+    reporte = tmp_path / "CICSADM.TXT"
+    reporte.write_text("contenido\n", encoding="utf-8")
+    manifiesto = ManifiestoReportes(tmp_path / "manifiesto.json")
+    manifiesto.registrar(reporte, **firma_archivo(reporte))
+
+    st = reporte.stat()
+    os.utime(reporte, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert manifiesto.pendientes([reporte]) == ([], [reporte])
+
+
+def test_otras_opciones_de_carga_quedan_pendientes(tmp_path):
+    reporte = tmp_path / "CICSADM.TXT"
+    reporte.write_text("contenido\n", encoding="utf-8")
+    ruta = tmp_path / "manifiesto.json"
+
+    manifiesto = ManifiestoReportes(ruta, {"destino": "bd", "tablas": False})
+    manifiesto.registrar(reporte, **firma_archivo(reporte))
+    manifiesto.guardar()
+
+    assert ManifiestoReportes(ruta, {"destino": "bd", "tablas": False}).pendientes([reporte]) == ([], [reporte])
+    assert ManifiestoReportes(ruta, {"destino": "bd", "tablas": True}).pendientes([reporte]) == ([reporte], [])
@@ -0,0 +1,33 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from almacen_columnar import AlmacenColumnar
+from tendencias import MotorTendencias
+
+
+def _reporte(valor):
+    return {"Dispatcher": {"Peak Attach Count": str(valor), "Estado": "ACTIVE"}}
+
+
+def test_segunda_region_de_una_fecha_ya_cacheada(tmp_path):
+    almacen = AlmacenColumnar(tmp_path / "historial")
+    cache = tmp_path / "cache"
+    almacen.agregar_reporte("2026-01-01", "CICSADM", "A", _reporte(10))
+    almacen.agregar_reporte("2026-01-02", "CICSADM", "A", _reporte(15))
+
+    motor = MotorTendencias()
+    assert motor.actualizar_desde_almacen(almacen) == ["2026-01-01", "2026-01-02"]
+    motor.guardar(cache)
+
+    # llega otra región para una fecha que ya está en la caché
+    almacen.agregar_reporte("2026-01-02", "OTRA", "B", _reporte(7))
+
+    motor = MotorTendencias.cargar(cache)
+    assert motor.actualizar_desde_almacen(almacen) == ["2026-01-02"]
+    assert motor.serie("OTRA", "Dispatcher", "Peak Attach Count") == {"2026-01-02": 7.0}
+    assert motor.serie("CICSADM", "Dispatcher", "Peak Attach Count") == {"2026-01-01": 10.0, "2026-01-02": 15.0}
+
+    # sin cambios no se vuelve a leer nada
+    motor.guardar(cache)
+    assert MotorTendencias.cargar(cache).actualizar_desde_almacen(almacen) == []
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, NamedTuple
+from entrada import es_nombre_reporte
+
+try:
+    from inotify_simple import INotify, flags as flags_inotify
+except ImportError:  # opcional: sin inotify_simple (o fuera de Linux) se sondea el directorio
+    INotify = None
+    flags_inotify = None
+
+
+# =========================
+# VIGILANCIA DEL DIRECTORIO DE REPORTES
+# =========================
+# Modo continuo: en lugar de listar el directorio una vez, se espera a que
+# lleguen reportes y se entregan apenas terminan de escribirse.
+#
+# Un reporte está listo cuando pasaron ESTABILIDAD_SEGUNDOS desde su
+# última escritura sin que cambie su (tamaño, mtime): así no se parsea un
+# archivo que el FTP o la copia todavía están escribiendo. Con inotify los eventos del kernel avisan de
+# cada cambio; sin inotify se barre el directorio cada INTERVALO_SONDEO.
+# En los dos modos un barrido completo periódico recupera eventos perdidos
+# (desborde de la cola de inotify).
+ESTABILIDAD_SEGUNDOS = 2.0
+INTERVALO_SONDEO = 1.0
+BARRIDO_COMPLETO = 60.0
+# ms que inotify espera tras el primer evento para agrupar los siguientes
+RETARDO_LECTURA_MS = 50
+
+MODO_INOTIFY = "inotify"
+MODO_SONDEO = "sondeo"
+
+
+class ReporteListo(NamedTuple):
+    nombre: str
+    llegada: float  # time.time() de la primera vez que se vio con este contenido
+
+
+class VigilanteReportes:
+    """
+    Observa un directorio y entrega en lotes los reportes nuevos o
+    modificados una vez que dejan de cambiar.
+
+    - usar_inotify: None = inotify si está disponible, False = sondeo.
+    - Un reporte entregado solo vuelve a entregarse si cambia su tamaño o
+      su mtime (un fallo de carga se reintenta al reemplazar el archivo o
+      al reiniciar, porque el manifiesto no lo registra).
+    - detener() es segura desde otro hilo o desde un manejador de señal.
+    """
+
+    def __init__(self, directorio: Path, estabilidad: float = ESTABILIDAD_SEGUNDOS,
+                 intervalo: float = INTERVALO_SONDEO, usar_inotify: bool | None = None):
+        self.directorio = Path(directorio)
+        self.estabilidad = max(0.0, estabilidad)
+        self.intervalo = max(0.1, intervalo)
+        self._detener = threading.Event()
+        # nombre -> [firma, llegada (time.time), desde (monotonic, último cambio)]
+        self._candidatos: dict[str, list] = {}
+        # nombre -> firma entregada
+        self._entregados: dict[str, tuple[int, int]] = {}
+        self._ultimo_barrido = 0.0
+
+        self._inotify = None
+        if usar_inotify is None:
+            usar_inotify = INotify is not None
+        if usar_inotify:
+            if INotify is None:
+                raise ImportError("El modo inotify requiere inotify_simple (pip install inotify_simple)")
+            self._inotify = INotify()
+            self._inotify.add_watch(
+                str(self.directorio),
+                flags_inotify.CLOSE_WRITE | flags_inotify.MOVED_TO | flags_inotify.CREATE
+                | flags_inotify.MODIFY | flags_inotify.DELETE | flags_inotify.MOVED_FROM,
+            )
+
+    @property
+    def modo(self) -> str:
+        return MODO_INOTIFY if self._inotify is not None else MODO_SONDEO
+
+    # -------------------------
+    # observación
+    # -------------------------
+    def _observar(self, nombre: str) -> None:
+        try:
+            st = os.stat(self.directorio / nombre)
+        except OSError:
+            # borrado o renombrado antes de estabilizarse
+            self._candidatos.pop(nombre, None)
+            return
+        firma = (st.st_size, st.st_mtime_ns)
+        if self._entregados.get(nombre) == firma:
+            self._candidatos.pop(nombre, None)
+            return
+
+        # el plazo de estabilidad corre desde la última escritura (mtime): un
+        # reporte que ya estaba quieto al verlo por primera vez sale sin esperar
+        ahora = time.time()
+        desde = time.monotonic() - min(max(0.0, ahora - st.st_mtime), self.estabilidad)
+        candidato = self._candidatos.get(nombre)
+        if candidato is None:
+            self._candidatos[nombre] = [firma, ahora, desde]
+        elif candidato[0] != firma:
+            # sigue escribiéndose: el plazo vuelve a empezar
+            candidato[0] = firma
+            candidato[2] = desde
+
+    def _barrer(self) -> None:
+        self._ultimo_barrido = time.monotonic()
+        try:
+            nombres = [e.name for e in os.scandir(self.directorio) if e.is_file() and es_nombre_reporte(e.name)]
+        except OSError:
+            return
+        for nombre in nombres:
+            self._observar(nombre)
+        for nombre in set(self._candidatos) - set(nombres):
+            del self._candidatos[nombre]
+
+    def _listos(self) -> list[ReporteListo]:
+        ahora = time.monotonic()
+        listos = []
+        for nombre in list(self._candidatos):
+            # se vuelve a mirar: con inotify un archivo pudo cambiar sin que el evento se haya leído aún
+            self._observar(nombre)
+            candidato = self._candidatos.get(nombre)
+            if candidato is None or ahora - candidato[2] < self.estabilidad:
+                continue
+            if candidato[0][0] == 0:
+                continue  # creado y todavía vacío
+            del self._candidatos[nombre]
+            self._entregados[nombre] = candidato[0]
+            listos.append(ReporteListo(nombre, candidato[1]))
+        listos.sort(key=lambda r: r.nombre.upper())
+        return listos
+
+    def _espera(self) -> float:
+        # hasta que el candidato más próximo cumpla la estabilidad, como máximo un intervalo
+        espera = self.intervalo
+        ahora = time.monotonic()
+        for (tamano, _), _, desde in self._candidatos.values():
+            if tamano:  # uno vacío espera el intervalo completo (o su evento)
+                espera = min(espera, max(0.0, desde + self.estabilidad - ahora))
+        return espera
+
+    def _esperar_cambios(self, segundos: float) -> None:
+        if self._inotify is None:
+            if not self._detener.wait(segundos):
+                self._barrer()
+            return
+
+        for evento in self._inotify.read(timeout=int(segundos * 1000), read_delay=RETARDO_LECTURA_MS):
+            if evento.mask & flags_inotify.Q_OVERFLOW:
+                self._barrer()
+            elif evento.name and es_nombre_reporte(evento.name):
+                self._observar(evento.name)
+        if time.monotonic() - self._ultimo_barrido >= BARRIDO_COMPLETO:
+            self._barrer()
+
+    # -------------------------
+    # ciclo
+    # -------------------------
+    def lotes(self) -> Iterator[list[ReporteListo]]:
+        """
+        Produce cada lote de reportes listos (lo que ya estaba en el
+        directorio sale en el primero) hasta que se llame a detener().
+        """
+        self._barrer()
+        while not self._detener.is_set():
+            listos = self._listos()
+            if listos:
+                yield listos
+                continue
+            self._esperar_cambios(self._espera())
+
+    def detener(self) -> None:
+        self._detener.set()
+
+    def cerrar(self) -> None:
+        self.detener()
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()